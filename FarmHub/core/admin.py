@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Farm, Cow, Activity, MilkProduction, Enrollment
+from .models import User, Farm, Cow, Activity, MilkProduction, Enrollment, DailyMilkRollup, ArchivedMilkProduction, ExportJob, ReportJob, Tombstone
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'role', 'mobile_no', 'is_active')
@@ -42,6 +42,74 @@ class MilkProductionAdmin(admin.ModelAdmin):
 
 admin.site.register(MilkProduction, MilkProductionAdmin)
 
+class DailyMilkRollupAdmin(admin.ModelAdmin):
+    list_display = ('cow', 'farm', 'date', 'total_quantity', 'record_count')
+    search_fields = ['cow__tag_number', 'farm__name']
+    list_filter = ('date',)
+
+    # maintained from MilkProduction writes; see `manage.py rebuild_milk_rollup`
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(DailyMilkRollup, DailyMilkRollupAdmin)
+
+class ArchivedMilkProductionAdmin(admin.ModelAdmin):
+    list_display = ('cow', 'farm', 'date', 'quantity', 'recorded_by', 'archived_at')
+    search_fields = ['cow__tag_number', 'farm__name']
+    list_filter = ('date',)
+
+    # filled by `manage.py archive_milk`
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(ArchivedMilkProduction, ArchivedMilkProductionAdmin)
+
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'dataset', 'format', 'status', 'requested_by', 'rows', 'size', 'created_at', 'finished_at')
+    list_filter = ('dataset', 'format', 'status')
+    search_fields = ['requested_by__username']
+
+    # created through /api/exports/ and written by core.exports
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(ExportJob, ExportJobAdmin)
+
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'report', 'scope', 'status', 'data_version', 'created_at', 'finished_at')
+    list_filter = ('report', 'status')
+
+    # queued through the reporting service's /reports/jobs
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(ReportJob, ReportJobAdmin)
+
+class TombstoneAdmin(admin.ModelAdmin):
+    list_display = ('model', 'object_id', 'farm_id', 'owner_id', 'deleted_at')
+    list_filter = ('model',)
+
+    # written by core.signals on delete; pruned by `manage.py prune_tombstones`
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+admin.site.register(Tombstone, TombstoneAdmin)
+
 class EnrollmentAdmin(admin.ModelAdmin):
     list_display = ('user', 'farm', 'is_active', 'progress', 'is_completed', 'total_yield')
     search_fields = ['user__username', 'farm__name']
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ArchivedMilkProduction, MilkProduction
+
+ARCHIVE_BATCH_SIZE = 2000
+
+# columns copied verbatim from MilkProduction into ArchivedMilkProduction
+ARCHIVED_COLUMNS = ("id", "date", "quantity", "cow_id", "farm_id", "recorded_by_id", "created_at", "updated_at")
+
+
+def archive_cutoff(today=None):
+    """Milk records dated before this day belong in the archive."""
+    return (today or date.today()) - timedelta(days=settings.MILK_ARCHIVE_AFTER_DAYS)
+
+
+def archived_keys(keys):
+    """
+    The (cow_id, date) pairs among ``keys`` that already exist in the archive.
+    Only dates older than the cutoff can be there, so recent keys cost nothing.
+    """
+    cutoff = archive_cutoff()
+    old = {(cow_id, day) for cow_id, day in keys if day < cutoff}
+    if not old:
+        return set()
+    found = (ArchivedMilkProduction.objects
+             .filter(cow_id__in={c for c, _ in old}, date__in={d for _, d in old})
+             .values_list("cow_id", "date"))
+    return set(found) & old
+
+
+def archive_milk(cutoff=None, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """
+    Move MilkProduction rows dated before ``cutoff`` into ArchivedMilkProduction,
+    one transaction per batch. Totals do not change, so rollups and the farm
+    summary are left alone. Returns the number of rows moved (or due, when
+    ``dry_run``).
+    """
+    from .signals import milk_signals_muted
+
+    cutoff = cutoff or archive_cutoff()
+    due = MilkProduction.objects.filter(date__lt=cutoff)
+    if dry_run:
+        return due.count()
+    moved = 0
+    while True:
+        with transaction.atomic(), milk_signals_muted():
+            rows = list(due.order_by("date", "id").values_list(*ARCHIVED_COLUMNS)[:batch_size])
+            if not rows:
+                break
+            ArchivedMilkProduction.objects.bulk_create(
+                [ArchivedMilkProduction(**dict(zip(ARCHIVED_COLUMNS, row))) for row in rows]
+            )
+            MilkProduction.objects.filter(id__in=[row[0] for row in rows]).delete()
+        moved += len(rows)
+    return moved
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+FARM_SUMMARY_KEY = "farmhub:farm-summary"
+ANALYTICS_KEY = "farmhub:analytics"
+# bumped on every invalidation; part of each scoped summary and analytics key,
+# so one increment retires the cached reports of every role/user at once
+FARM_SUMMARY_GENERATION_KEY = "farmhub:farm-summary:generation"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def report_cache():
+    return caches[getattr(settings, "FARMHUB_REPORT_CACHE", "default")]
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _summary_generation(cache):
+    generation = cache.get(FARM_SUMMARY_GENERATION_KEY)
+    if generation is None:
+        # start from the clock so a lost counter never revives older entries
+        cache.add(FARM_SUMMARY_GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(FARM_SUMMARY_GENERATION_KEY)
+    return generation
+
+
+def cache_generation():
+    """
+    Current generation of the report cache; it changes whenever farms, cows,
+    users or milk records are written through this cache's invalidation.
+    """
+    return _summary_generation(report_cache())
+
+
+def cached_farm_summary(compute, scope="all"):
+    """
+    Return the cached farm summary for ``scope`` (one key per role/user view
+    of the data), calling ``compute()`` on a miss.
+    """
+    cache = report_cache()
+    key = f"{FARM_SUMMARY_KEY}:{_summary_generation(cache)}:{scope}"
+    summary = cache.get(key)
+    if summary is not None:
+        _count("hits")
+        return summary
+    _count("misses")
+    summary = compute()
+    cache.set(key, summary, getattr(settings, "FARM_SUMMARY_CACHE_TIMEOUT", 60))
+    return summary
+
+
+def cached_analytics(compute, *key_parts):
+    """
+    Return cached milk analytics for ``key_parts`` (cow or farm, date range,
+    parameters and scope), calling ``compute()`` on a miss. Milk writes bump
+    the same generation as the farm summary, so these expire with it.
+    """
+    cache = report_cache()
+    key = ":".join([ANALYTICS_KEY, str(_summary_generation(cache)), *map(str, key_parts)])
+    result = cache.get(key)
+    if result is not None:
+        _count("hits")
+        return result
+    _count("misses")
+    result = compute()
+    cache.set(key, result, getattr(settings, "ANALYTICS_CACHE_TIMEOUT", 300))
+    return result
+
+
+def invalidate_farm_summary():
+    cache = report_cache()
+    try:
+        cache.incr(FARM_SUMMARY_GENERATION_KEY)
+    except ValueError:
+        cache.add(FARM_SUMMARY_GENERATION_KEY, time.time_ns(), None)
+    _count("invalidations")
+
+
+def cache_stats():
+    """Hit/miss/invalidation counters for this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
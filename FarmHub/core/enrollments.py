@@ -0,0 +1,112 @@
+import math
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, IntegerField, Sum, Value, When
+from django.db.models.functions import Cast, Floor, Greatest, Least
+from django.utils import timezone
+
+from .models import Cow, DailyMilkRollup, Enrollment
+
+RECONCILE_BATCH_SIZE = 1000
+# liters; smaller differences between a stored and a recomputed total are noise
+YIELD_TOLERANCE = 1e-6
+
+
+def yield_target():
+    """Liters an enrollment must reach for full progress and its certificate."""
+    return float(getattr(settings, "ENROLLMENT_YIELD_TARGET", 1000.0))
+
+
+def progress_for(total_yield):
+    return max(0, min(100, int(total_yield * 100 // yield_target())))
+
+
+def apply_yield_delta(farmer_id, farm_id, quantity):
+    """
+    Add ``quantity`` liters to the (farmer, farm) enrollment and refresh its
+    progress and certificate flag in the same UPDATE. No enrollment, no-op.
+    """
+    if not farmer_id or not farm_id or not quantity:
+        return
+    target = yield_target()
+    # SET expressions see the row as it was, so the new total is spelled out
+    new_total = F("total_yield") + Value(float(quantity), output_field=FloatField())
+    Enrollment.objects.filter(user_id=farmer_id, farm_id=farm_id).update(
+        total_yield=new_total,
+        progress=Greatest(Least(Cast(Floor(new_total * 100.0 / target), IntegerField()), Value(100)), Value(0)),
+        is_certificate_ready=Case(
+            When(total_yield__gte=target - float(quantity), then=Value(True)), default=Value(False),
+        ),
+        # UPDATE skips auto_now; clients revalidate (and sync) on updated_at
+        updated_at=timezone.now(),
+    )
+
+
+def yield_pairs_for_cows(cow_ids):
+    """The (farmer_id, farm_id) enrollments the given cows' milk counts towards."""
+    return set(Cow.objects.filter(id__in=set(cow_ids)).values_list("farmer_id", "farm_id"))
+
+
+def reconcile_enrollments(pairs=None, batch_size=RECONCILE_BATCH_SIZE):
+    """
+    Recompute total_yield, progress and is_certificate_ready from the daily
+    rollup (which covers archived milk too) with one grouped query. ``pairs``
+    limits it to those (farmer_id, farm_id) enrollments. Returns the number
+    of enrollments whose values changed.
+    """
+    enrollments = Enrollment.objects.all()
+    rollups = DailyMilkRollup.objects.all()
+    if pairs is not None:
+        pairs = set(pairs)
+        if not pairs:
+            return 0
+        farmer_ids = {farmer_id for farmer_id, _ in pairs}
+        farm_ids = {farm_id for _, farm_id in pairs}
+        enrollments = enrollments.filter(user_id__in=farmer_ids, farm_id__in=farm_ids)
+        rollups = rollups.filter(cow__farmer_id__in=farmer_ids, farm_id__in=farm_ids)
+    totals = {
+        (farmer_id, farm_id): total or 0.0
+        for farmer_id, farm_id, total in rollups.order_by()
+        .values_list("cow__farmer_id", "farm_id")
+        .annotate(total=Sum("total_quantity"))
+    }
+    target = yield_target()
+    changed = []
+    now = timezone.now()
+    for enrollment in enrollments.only("id", "user_id", "farm_id", "total_yield", "progress", "is_certificate_ready"):
+        key = (enrollment.user_id, enrollment.farm_id)
+        if pairs is not None and key not in pairs:
+            continue
+        total = float(totals.get(key, 0.0))
+        values = (total, progress_for(total), total >= target)
+        # SUM order differs between queries, so totals agree only up to float rounding
+        if (not math.isclose(enrollment.total_yield, total, abs_tol=YIELD_TOLERANCE)
+                or (enrollment.progress, enrollment.is_certificate_ready) != values[1:]):
+            enrollment.total_yield, enrollment.progress, enrollment.is_certificate_ready = values
+            enrollment.updated_at = now
+            changed.append(enrollment)
+    if changed:
+        # bulk_update is already atomic across its batches
+        Enrollment.objects.bulk_update(
+            changed, ["total_yield", "progress", "is_certificate_ready", "updated_at"], batch_size=batch_size
+        )
+    return len(changed)
+
+
+def sync_enrollment_yield(enrollment):
+    """Bring one enrollment up to the milk its farmer already has on its farm."""
+    total = float(
+        DailyMilkRollup.objects.filter(cow__farmer_id=enrollment.user_id, farm_id=enrollment.farm_id)
+        .aggregate(total=Sum("total_quantity"))["total"] or 0.0
+    )
+    values = {
+        "total_yield": total,
+        "progress": progress_for(total),
+        "is_certificate_ready": total >= yield_target(),
+    }
+    if all(getattr(enrollment, field) == value for field, value in values.items()):
+        return
+    values["updated_at"] = timezone.now()
+    Enrollment.objects.filter(pk=enrollment.pk).update(**values)
+    for field, value in values.items():
+        setattr(enrollment, field, value)
@@ -0,0 +1,262 @@
+import csv
+import gzip
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import islice
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.utils import timezone
+
+from .models import Activity, ArchivedMilkProduction, Cow, Enrollment, ExportJob, Farm, MilkProduction
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_DIR = "exports"
+
+
+@dataclass(frozen=True)
+class ExportDataset:
+    model: type
+    # (output column, values() lookup)
+    columns: tuple
+    # filtered on for farmers; agents are filtered on farm_id
+    owner_field: str
+    date_field: Optional[str] = None
+    archive: Optional[type] = None
+
+    @property
+    def names(self):
+        return [name for name, _ in self.columns]
+
+    @property
+    def lookups(self):
+        return [lookup for _, lookup in self.columns]
+
+
+_RECORD_COLUMNS = (
+    ("id", "id"), ("cow_id", "cow_id"), ("tag_number", "cow__tag_number"), ("farm_id", "farm_id"),
+)
+
+DATASETS = {
+    "milk": ExportDataset(
+        MilkProduction,
+        _RECORD_COLUMNS + (("date", "date"), ("quantity", "quantity"), ("recorded_by_id", "recorded_by_id"),
+                           ("created_at", "created_at"), ("updated_at", "updated_at")),
+        owner_field="recorded_by_id", date_field="date", archive=ArchivedMilkProduction,
+    ),
+    "activities": ExportDataset(
+        Activity,
+        _RECORD_COLUMNS + (("date", "date"), ("activity_type", "activity_type"), ("category", "category"),
+                           ("description", "description"), ("recorded_by_id", "recorded_by_id"),
+                           ("created_at", "created_at"), ("updated_at", "updated_at")),
+        owner_field="recorded_by_id", date_field="date",
+    ),
+    "cows": ExportDataset(
+        Cow,
+        tuple((f, f) for f in ("id", "tag_number", "breed", "birth_date", "health_status", "farm_id",
+                               "farmer_id", "is_active", "created_at", "updated_at")),
+        owner_field="farmer_id",
+    ),
+    "enrollments": ExportDataset(
+        Enrollment,
+        tuple((f, f) for f in ("id", "user_id", "farm_id", "is_active", "progress", "is_completed",
+                               "total_yield", "is_certificate_ready", "enrolled_at", "created_at", "updated_at")),
+        owner_field="user_id",
+    ),
+}
+
+
+def _scoped(qs, dataset, user):
+    """Rows ``user`` can see, as in the list endpoints; ``None`` means everything."""
+    role = getattr(user, "role", None)
+    if user is None or role == "admin":
+        return qs
+    if role == "agent":
+        return qs.filter(farm_id__in=Farm.objects.filter(agent=user).values("id"))
+    if role == "farmer":
+        return qs.filter(**{dataset.owner_field: user.id})
+    return qs.none()
+
+
+def _filtered(model, dataset, user, filters):
+    qs = _scoped(model.objects.all(), dataset, user)
+    if filters.get("farm_id"):
+        qs = qs.filter(farm_id=filters["farm_id"])
+    if dataset.date_field:
+        if filters.get("start_date"):
+            qs = qs.filter(**{f"{dataset.date_field}__gte": filters["start_date"]})
+        if filters.get("end_date"):
+            qs = qs.filter(**{f"{dataset.date_field}__lte": filters["end_date"]})
+    return qs.order_by().values_list(*dataset.lookups)
+
+
+def export_rows(name, user=None, filters=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the value tuples of dataset ``name`` from a server-side cursor,
+    ``chunk_size`` rows at a time. Milk includes the archive (one UNION ALL).
+    """
+    dataset = DATASETS[name]
+    filters = filters or {}
+    qs = _filtered(dataset.model, dataset, user, filters)
+    if dataset.archive is not None:
+        qs = qs.union(_filtered(dataset.archive, dataset, user, filters), all=True)
+    yield from qs.order_by("id").iterator(chunk_size=chunk_size)
+
+
+def _field(model, lookup):
+    *path, name = lookup.split("__")
+    for step in path:
+        model = model._meta.get_field(step).related_model
+    field = model._meta.get_field(name)  # also finds foreign keys by attname ("cow_id")
+    return field.target_field if field.is_relation else field
+
+
+def _arrow_schema(dataset):
+    import pyarrow as pa
+
+    def arrow_type(field):
+        if isinstance(field, models.BooleanField):
+            return pa.bool_()
+        if isinstance(field, (models.IntegerField, models.AutoField)):
+            return pa.int64()
+        if isinstance(field, models.FloatField):
+            return pa.float64()
+        if isinstance(field, models.DateTimeField):
+            return pa.timestamp("us", tz="UTC")
+        if isinstance(field, models.DateField):
+            return pa.date32()
+        return pa.string()
+
+    return pa.schema([(name, arrow_type(_field(dataset.model, lookup))) for name, lookup in dataset.columns])
+
+
+def _write_csv(path, dataset, rows):
+    written = 0
+    with gzip.open(path, "wt", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(dataset.names)
+        for row in rows:
+            writer.writerow(row)
+            written += 1
+    return written
+
+
+def _write_parquet(path, dataset, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(dataset)
+    written = 0
+    # one row group per chunk, so only a chunk is ever held in memory
+    with pq.ParquetWriter(path, schema, compression="snappy") as writer:
+        while chunk := list(islice(rows, chunk_size)):
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=schema.field(i).type) for i, col in enumerate(columns)], schema=schema,
+            ))
+            written += len(chunk)
+    return written
+
+
+WRITERS = {"csv": (_write_csv, "csv.gz"), "parquet": (_write_parquet, "parquet")}
+
+
+def _heartbeat(rows, job_id, every):
+    """
+    Pass ``rows`` through, touching the running job's updated_at every
+    ``every`` rows, so a long export is not taken for one whose worker died.
+    """
+    for i, row in enumerate(rows, start=1):
+        yield row
+        if i % every == 0:
+            ExportJob.objects.filter(pk=job_id, status="running").update(updated_at=timezone.now())
+
+
+def run_export(job_id):
+    """Write the file of a pending ExportJob and record the outcome on it."""
+    # claimed with a conditional UPDATE, so a job runs once however often it is queued
+    if not ExportJob.objects.filter(pk=job_id, status="pending").update(status="running", updated_at=timezone.now()):
+        return ExportJob.objects.get(pk=job_id)
+    job = ExportJob.objects.select_related("requested_by").get(pk=job_id)
+    write, extension = WRITERS[job.format]
+    relative = os.path.join(EXPORT_DIR, f"{job.dataset}-{job.pk}-{timezone.now():%Y%m%dT%H%M%S}.{extension}")
+    path = os.path.join(settings.MEDIA_ROOT, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + ".part"
+    try:
+        rows = _heartbeat(export_rows(job.dataset, job.requested_by, job.filters), job.pk, EXPORT_CHUNK_SIZE)
+        job.rows = write(partial, DATASETS[job.dataset], rows)
+        os.replace(partial, path)
+    except Exception as e:
+        if os.path.exists(partial):
+            os.remove(partial)
+        job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+    else:
+        job.status, job.file.name, job.size = "done", relative, os.path.getsize(path)
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "file", "rows", "size", "error", "finished_at", "updated_at"])
+    return job
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def export_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "EXPORT_WORKERS", 2),
+                thread_name_prefix="farmhub-export",
+            )
+        return _executor
+
+
+def _run_in_worker(job_id):
+    close_old_connections()
+    try:
+        run_export(job_id)
+    finally:
+        close_old_connections()
+
+
+def start_export(job):
+    """
+    Queue ``job``. With EXPORT_BACKEND = "thread" it goes to the export
+    threads once the transaction creating it commits; with "db" the row is
+    the queue and ``run_exports`` workers claim it.
+    """
+    if getattr(settings, "EXPORT_BACKEND", "thread") == "thread":
+        transaction.on_commit(lambda: export_executor().submit(_run_in_worker, job.pk))
+    return job
+
+
+def requeue_stale_exports():
+    """
+    Put jobs not heard from for EXPORT_STALE_AFTER seconds (their worker
+    died; a live one touches updated_at every chunk) back to pending.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, "EXPORT_STALE_AFTER", 3600))
+    return ExportJob.objects.filter(status="running", updated_at__lt=cutoff).update(status="pending", updated_at=now)
+
+
+def work(poll_seconds=1.0, once=False):
+    """Table-backed worker loop: reclaim stale jobs, claim the oldest pending export, run it, repeat."""
+    while True:
+        close_old_connections()
+        requeue_stale_exports()
+        job_id = (ExportJob.objects.filter(status="pending").order_by("created_at")
+                  .values_list("id", flat=True).first())
+        if job_id is not None:
+            _run_in_worker(job_id)
+        elif once:
+            return
+        else:
+            time.sleep(poll_seconds)
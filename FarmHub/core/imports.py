@@ -0,0 +1,345 @@
+import csv
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import islice
+
+from django.db import transaction
+
+from .archive import archived_keys
+from .models import Activity, Cow, Enrollment, Farm, MilkProduction, User
+from .signals import data_changed, milk_bulk_written
+
+IMPORT_CHUNK_SIZE = 2000
+# errors kept in the result; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+# kind -> (required columns, optional columns)
+IMPORT_COLUMNS = {
+    "cows": (("tag_number", "breed", "birth_date", "farmer"), ("farm", "health_status", "is_active")),
+    "milk": (("tag_number", "date", "quantity"), ()),
+    "activities": (("tag_number", "activity_type"), ("date", "description", "category")),
+}
+IMPORT_KINDS = tuple(IMPORT_COLUMNS)
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be imported (unknown kind, missing columns)."""
+
+
+@dataclass
+class ImportStats:
+    kind: str
+    rows: int = 0
+    saved: int = 0
+    failed: int = 0
+    # rows superseded by a later row for the same record in their chunk
+    replaced: int = 0
+    errors: list = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def reject(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": errors})
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "rows": self.rows,
+            "saved": self.saved,
+            "failed": self.failed,
+            "replaced": self.replaced,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def _required(value, name, errors):
+    value = (value or "").strip()
+    if not value:
+        errors[name] = ["This field is required."]
+    return value
+
+
+def _parse_date(value, name, errors, required=True):
+    value = (value or "").strip()
+    if not value:
+        if required:
+            errors[name] = ["This field is required."]
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        errors[name] = ["Date has wrong format. Use one of these formats instead: YYYY-MM-DD."]
+        return None
+
+
+def _parse_quantity(value, errors):
+    try:
+        quantity = float(value)
+        if not math.isfinite(quantity):
+            raise ValueError
+    except (TypeError, ValueError):
+        errors["quantity"] = ["A valid number is required."]
+        return None
+    if quantity < 0:
+        errors["quantity"] = ["Ensure this value is greater than or equal to 0."]
+    return quantity
+
+
+class References:
+    """
+    Id maps an import resolves its rows against, each built with one query the
+    first time it is needed. ``user`` narrows them like the API does: agents
+    only reach the farms they manage; ``None`` or an admin reaches everything.
+    """
+    def __init__(self, user=None):
+        self.user = user
+        self._farm_ids = None
+        self._farms_by_name = None
+        self._farmers = None
+        self._active_farms = None
+        self._cows = None
+        self._tags = None
+
+    @property
+    def scoped(self):
+        return self.user is not None and getattr(self.user, "role", None) != "admin"
+
+    @property
+    def farm_ids(self):
+        if self._farm_ids is None:
+            farms = Farm.objects.all()
+            if self.scoped:
+                farms = farms.filter(agent=self.user) if self.user.role == "agent" else farms.none()
+            self._farm_ids = set(farms.values_list("id", flat=True))
+        return self._farm_ids
+
+    @property
+    def farms_by_name(self):
+        """Farm name -> id, or None where the name is shared by several farms."""
+        if self._farms_by_name is None:
+            self._farms_by_name = {}
+            for farm_id, name in Farm.objects.filter(id__in=self.farm_ids).values_list("id", "name"):
+                self._farms_by_name[name] = None if name in self._farms_by_name else farm_id
+        return self._farms_by_name
+
+    @property
+    def farmers(self):
+        if self._farmers is None:
+            self._farmers = dict(User.objects.filter(role="farmer").values_list("username", "id"))
+        return self._farmers
+
+    @property
+    def active_farms(self):
+        """Farmer id -> farm of their latest active enrollment."""
+        if self._active_farms is None:
+            self._active_farms = dict(
+                Enrollment.objects.filter(is_active=True)
+                .order_by("user_id", "enrolled_at")
+                .values_list("user_id", "farm_id")
+            )
+        return self._active_farms
+
+    @property
+    def cows(self):
+        """Tag -> (cow id, farm id, farmer id) for the cows rows may refer to."""
+        if self._cows is None:
+            cows = Cow.objects.all()
+            if self.scoped:
+                cows = cows.filter(farm_id__in=self.farm_ids)
+            self._cows = {
+                tag: (cow_id, farm_id, farmer_id)
+                for cow_id, tag, farm_id, farmer_id in cows.values_list("id", "tag_number", "farm_id", "farmer_id")
+            }
+        return self._cows
+
+    @property
+    def tags(self):
+        """Every tag in use, whoever's cow it is (tags are unique across farms)."""
+        if self._tags is None:
+            self._tags = set(Cow.objects.values_list("tag_number", flat=True))
+        return self._tags
+
+    def add_cow(self, cow):
+        self.tags.add(cow.tag_number)
+        if self._cows is not None:
+            self._cows[cow.tag_number] = (cow.id, cow.farm_id, cow.farmer_id)
+
+    def farm(self, value, farmer_id, errors):
+        value = (value or "").strip()
+        if not value:
+            farm_id = self.active_farms.get(farmer_id)
+            if farm_id is None:
+                errors["farm"] = ["Farmer has no active enrollment; give the farm."]
+            elif farm_id not in self.farm_ids:
+                errors["farm"] = ["You can only add cows to the farm(s) you manage."]
+            return farm_id
+        farm_id = int(value) if value.isdigit() else self.farms_by_name.get(value)
+        if value in self.farms_by_name and farm_id is None:
+            errors["farm"] = [f'Farm name "{value}" is ambiguous; use the farm id.']
+        elif farm_id not in self.farm_ids:
+            errors["farm"] = [f'Unknown farm "{value}".']
+        return farm_id
+
+    def cow(self, tag, errors):
+        cow = self.cows.get(tag)
+        if tag and cow is None:
+            errors["tag_number"] = [f'Unknown cow tag "{tag}".']
+        return cow
+
+
+def _build_cow(row, refs, seen, errors):
+    tag = _required(row.get("tag_number"), "tag_number", errors)
+    breed = _required(row.get("breed"), "breed", errors)
+    birth_date = _parse_date(row.get("birth_date"), "birth_date", errors)
+    username = _required(row.get("farmer"), "farmer", errors)
+    farmer_id = refs.farmers.get(username)
+    if username and farmer_id is None:
+        errors["farmer"] = [f'Unknown farmer "{username}".']
+    farm_id = refs.farm(row.get("farm"), farmer_id, errors) if farmer_id else None
+    if tag in refs.tags or tag in seen:
+        errors["tag_number"] = ["cow with this tag number already exists."]
+    if errors:
+        return None
+    seen.add(tag)
+    return Cow(
+        tag_number=tag, breed=breed, birth_date=birth_date, farmer_id=farmer_id, farm_id=farm_id,
+        health_status=(row.get("health_status") or "").strip() or None,
+        is_active=(row.get("is_active") or "true").strip().lower() not in ("0", "false", "no"),
+    )
+
+
+def _build_milk(row, refs, seen, errors):
+    cow = refs.cow(_required(row.get("tag_number"), "tag_number", errors), errors)
+    day = _parse_date(row.get("date"), "date", errors)
+    quantity = _parse_quantity(row.get("quantity"), errors)
+    if errors:
+        return None
+    cow_id, farm_id, farmer_id = cow
+    # historical readings are filed under the cow's farmer, so they show up in the farmer's own lists
+    return MilkProduction(cow_id=cow_id, farm_id=farm_id, date=day, quantity=quantity, recorded_by_id=farmer_id)
+
+
+def _build_activity(row, refs, seen, errors):
+    cow = refs.cow(_required(row.get("tag_number"), "tag_number", errors), errors)
+    activity_type = _required(row.get("activity_type"), "activity_type", errors)
+    day = _parse_date(row.get("date"), "date", errors, required=False)
+    if errors:
+        return None
+    cow_id, farm_id, farmer_id = cow
+    return Activity(
+        cow_id=cow_id, farm_id=farm_id, recorded_by_id=farmer_id, activity_type=activity_type, date=day,
+        description=(row.get("description") or "").strip() or None,
+        category=(row.get("category") or "").strip() or None,
+    )
+
+
+def _save_cows(objs, refs, stats):
+    created = Cow.objects.bulk_create(objs)
+    for cow in created:
+        refs.add_cow(cow)
+    data_changed()
+    return len(created)
+
+
+def _save_milk(objs, refs, stats):
+    # a later row for the same cow/day wins, here and (by upsert) across chunks
+    records = {(m.cow_id, m.date): m for m in objs}
+    stats.replaced += len(objs) - len(records)
+    for key in archived_keys(records):
+        stats.reject(records.pop(key).line, {"non_field_errors": [
+            "This cow already has an archived milk record for that date."]})
+    if records:
+        # an existing reading for the same cow/day is replaced, as in the bulk endpoint
+        MilkProduction.objects.bulk_create(
+            records.values(),
+            update_conflicts=True,
+            unique_fields=["cow", "date"],
+            update_fields=["quantity", "farm", "updated_at"],
+        )
+        milk_bulk_written(records.keys())
+    return len(records)
+
+
+def _save_activities(objs, refs, stats):
+    return len(Activity.objects.bulk_create(objs))
+
+
+_BUILDERS = {
+    "cows": (_build_cow, _save_cows),
+    "milk": (_build_milk, _save_milk),
+    "activities": (_build_activity, _save_activities),
+}
+
+
+def _rows(reader):
+    for row in reader:
+        if any((value or "").strip() for value in row.values() if isinstance(value, str)):
+            yield reader.line_num, row
+
+
+def _next_chunk(rows, chunk_size, reader, stats):
+    try:
+        return list(islice(rows, chunk_size))
+    except (UnicodeDecodeError, csv.Error) as e:
+        # earlier chunks are committed; say how far the import got
+        raise ImportFileError(f"Could not read the file after line {reader.line_num} ({e}); "
+                              f"the {stats.saved} rows saved before that were kept.") from e
+
+
+def import_csv(kind, stream, user=None, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Stream ``kind`` rows ("cows", "milk" or "activities") from the CSV text
+    ``stream`` into the database, ``chunk_size`` rows per transaction. Rows
+    refer to cows by tag and farmers by username; bad rows are reported by
+    line and skipped. ``progress(stats)`` is called after each chunk.
+    Returns an ImportStats.
+    """
+    if kind not in IMPORT_COLUMNS:
+        raise ImportFileError(f"Unknown import kind {kind!r}; expected one of {', '.join(IMPORT_KINDS)}.")
+    reader = csv.DictReader(stream)
+    try:
+        header = reader.fieldnames
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ImportFileError(f"Could not read the header row ({e}).") from e
+    if header is None:
+        raise ImportFileError("The file is empty.")
+    reader.fieldnames = [(name or "").strip().lower() for name in header]
+    required, _ = IMPORT_COLUMNS[kind]
+    missing = [name for name in required if name not in reader.fieldnames]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}.")
+
+    build, save = _BUILDERS[kind]
+    refs = References(user)
+    stats = ImportStats(kind)
+    started = time.perf_counter()
+    rows = _rows(reader)
+    while chunk := _next_chunk(rows, chunk_size, reader, stats):
+        objs, seen = [], set()  # tags of earlier chunks are in refs.tags by now
+        for line, row in chunk:
+            errors = {}
+            obj = build(row, refs, seen, errors)
+            if obj is None:
+                stats.reject(line, errors)
+            else:
+                obj.line = line
+                objs.append(obj)
+        stats.rows += len(chunk)
+        if objs:
+            with transaction.atomic():
+                stats.saved += save(objs, refs, stats)
+        stats.seconds = time.perf_counter() - started
+        if progress:
+            progress(stats)
+    stats.seconds = time.perf_counter() - started
+    stats.errors.sort(key=lambda e: e["line"])
+    return stats
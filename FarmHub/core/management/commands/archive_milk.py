@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.archive import ARCHIVE_BATCH_SIZE, archive_cutoff, archive_milk
+
+
+class Command(BaseCommand):
+    help = (
+        "Move milk records older than MILK_ARCHIVE_AFTER_DAYS from MilkProduction "
+        "into ArchivedMilkProduction. Reports keep reading both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--before", help="Archive records dated before this day (YYYY-MM-DD); "
+                                             "may only be earlier than the configured cutoff.")
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true", help="Only count the records that are due.")
+
+    def handle(self, *args, **opts):
+        cutoff = archive_cutoff()
+        if opts["before"]:
+            before = parse_date(opts["before"])
+            if before is None:
+                raise CommandError("--before must be a date (YYYY-MM-DD).")
+            if before > cutoff:
+                # writes are only checked against the archive before the configured cutoff
+                raise CommandError(f"--before must not be later than {cutoff} (MILK_ARCHIVE_AFTER_DAYS).")
+            cutoff = before
+        moved = archive_milk(cutoff, batch_size=opts["batch_size"], dry_run=opts["dry_run"])
+        if opts["dry_run"]:
+            self.stdout.write(f"{moved} milk records dated before {cutoff} are due for archiving.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Archived {moved} milk records dated before {cutoff}."))
@@ -0,0 +1,89 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Activity, Cow, Enrollment, Farm, MilkProduction, User
+from core.serializers import (
+    FAST_LIST_SERIALIZERS, ActivitySerializer, EnrollmentSerializer, MilkProductionSerializer,
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows/second of the DRF ModelSerializer list path against the "
+        "FastListSerializer (.values()) path. Synthetic rows are created when "
+        "the database has fewer than --rows records and rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        try:
+            with transaction.atomic():
+                self._ensure_rows(rows)
+                for serializer_class, model in (
+                    (MilkProductionSerializer, MilkProduction),
+                    (ActivitySerializer, Activity),
+                    (EnrollmentSerializer, Enrollment),
+                ):
+                    self._bench(serializer_class, model.objects.order_by("-id")[:rows], repeat)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _bench(self, serializer_class, qs, repeat):
+        fast = FAST_LIST_SERIALIZERS[serializer_class]
+        n = len(list(qs))
+
+        def drf():
+            return serializer_class(list(qs), many=True).data
+
+        def fast_path():
+            return fast.serialize(fast.values(qs))
+
+        drf_time = min(self._time(drf) for _ in range(repeat))
+        fast_time = min(self._time(fast_path) for _ in range(repeat))
+        self.stdout.write(
+            f"{serializer_class.__name__:<26} rows={n:<7} "
+            f"drf={n / drf_time:>10.0f} rows/s  fast={n / fast_time:>10.0f} rows/s  "
+            f"speedup={drf_time / fast_time:.1f}x"
+        )
+
+    @staticmethod
+    def _time(fn):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+    def _ensure_rows(self, rows):
+        if min(MilkProduction.objects.count(), Activity.objects.count(), Enrollment.objects.count()) >= rows:
+            return
+        agent = User.objects.create(username="bench-agent", role="agent")
+        farm = Farm.objects.create(name="Bench farm", location="bench", agent=agent)
+        farmers = User.objects.bulk_create(
+            [User(username=f"bench-farmer-{i}", role="farmer") for i in range(rows)]
+        )
+        farm2 = [Farm(name=f"Bench farm {i}", location="bench", agent=agent) for i in range(rows)]
+        farms = Farm.objects.bulk_create(farm2)
+        Enrollment.objects.bulk_create(
+            [Enrollment(user=u, farm=f) for u, f in zip(farmers, farms)]
+        )
+        cow = Cow.objects.create(tag_number="bench-cow", breed="bench", birth_date=date(2020, 1, 1),
+                                 farm=farm, farmer=farmers[0])
+        start = date(2000, 1, 1)
+        MilkProduction.objects.bulk_create(
+            [MilkProduction(cow=cow, farm_id=cow.farm_id, date=start + timedelta(days=i), quantity=10.5, recorded_by=farmers[0])
+             for i in range(rows)]
+        )
+        Activity.objects.bulk_create(
+            [Activity(cow=cow, farm_id=cow.farm_id, activity_type="bench", date=start, recorded_by=farmers[0]) for _ in range(rows)]
+        )
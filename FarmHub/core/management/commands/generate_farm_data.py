@@ -0,0 +1,120 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.enrollments import reconcile_enrollments
+from core.models import Activity, Cow, Enrollment, Farm, MilkProduction, User
+from core.rollups import rebuild_daily_rollups
+from core.signals import data_changed
+
+ACTIVITY_TYPES = (
+    ("vaccination", "health"),
+    ("deworming", "health"),
+    ("feeding", "nutrition"),
+    ("hoof trimming", "care"),
+    ("insemination", "breeding"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic FarmHub dataset: agents, farms, farmers enrolled "
+        "in those farms, cows, and years of daily milk records and activities, "
+        "plus one admin. "
+        "Everything is written with bulk_create in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--farms", type=int, default=10)
+        parser.add_argument("--agents", type=int, default=3)
+        parser.add_argument("--farmers-per-farm", type=int, default=5)
+        parser.add_argument("--cows-per-farmer", type=int, default=4)
+        parser.add_argument("--years", type=float, default=1.0, help="Days of milk history, in years.")
+        parser.add_argument("--activity-every", type=int, default=30, help="One activity per cow every N days.")
+        parser.add_argument("--prefix", default="gen", help="Prefix for generated usernames and tag numbers.")
+        parser.add_argument("--password", default=None, help="Password for generated users (default: unusable).")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        prefix = opts["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}-").exists():
+            raise CommandError(f'Users prefixed "{prefix}-" already exist; pick another --prefix.')
+        rng = random.Random(opts["seed"])
+        batch = opts["batch_size"]
+        password = make_password(opts["password"]) if opts["password"] else make_password(None)
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            User.objects.create(username=f"{prefix}-admin", role="admin", password=password)
+            agents = User.objects.bulk_create([
+                User(username=f"{prefix}-agent-{i}", role="agent", password=password)
+                for i in range(opts["agents"])
+            ])
+            farms = Farm.objects.bulk_create([
+                Farm(name=f"{prefix} farm {i}", location=f"district {i % 7}",
+                     agent=agents[i % len(agents)], farm_type="dairy", farm_size=rng.uniform(2, 40))
+                for i in range(opts["farms"])
+            ])
+            farmers, enrollments = [], []
+            for farm in farms:
+                for j in range(opts["farmers_per_farm"]):
+                    farmers.append(User(username=f"{prefix}-farmer-{farm.id}-{j}", role="farmer", password=password))
+            farmers = User.objects.bulk_create(farmers, batch_size=batch)
+            per_farm = opts["farmers_per_farm"]
+            for i, farmer in enumerate(farmers):
+                enrollments.append(Enrollment(user=farmer, farm=farms[i // per_farm]))
+            Enrollment.objects.bulk_create(enrollments, batch_size=batch)
+
+            cows = Cow.objects.bulk_create([
+                Cow(tag_number=f"{prefix}-{e.farm_id}-{e.user_id}-{k}", breed=rng.choice(["Sahiwal", "Holstein", "Jersey"]),
+                    birth_date=date(2018, 1, 1) + timedelta(days=rng.randrange(1500)),
+                    farm_id=e.farm_id, farmer_id=e.user_id, health_status="healthy")
+                for e in enrollments
+                for k in range(opts["cows_per_farmer"])
+            ], batch_size=batch)
+        self.stdout.write(f"{len(agents)} agents, {len(farms)} farms, {len(farmers)} farmers, {len(cows)} cows")
+
+        days = int(opts["years"] * 365)
+        first_day = date.today() - timedelta(days=days - 1)
+        milk = self._write(MilkProduction, (
+            MilkProduction(cow_id=cow.id, farm_id=cow.farm_id, recorded_by_id=cow.farmer_id, date=first_day + timedelta(days=d),
+                           quantity=round(max(0.0, rng.gauss(12, 3)), 2))
+            for cow in cows for d in range(days)
+        ), batch)
+        every = max(1, opts["activity_every"])
+        activities = self._write(Activity, (
+            Activity(cow_id=cow.id, farm_id=cow.farm_id, recorded_by_id=cow.farmer_id, date=first_day + timedelta(days=d),
+                     activity_type=kind, category=category)
+            for cow in cows for d in range(rng.randrange(every), days, every)
+            for kind, category in [rng.choice(ACTIVITY_TYPES)]
+        ), batch)
+        self.stdout.write(f"{milk} milk records, {activities} activities")
+
+        rebuild_daily_rollups()
+        reconcile_enrollments()
+        data_changed()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.1f}s ({(milk + activities) / elapsed:.0f} records/s)."
+        ))
+
+    def _write(self, model, objects, batch_size):
+        """bulk_create from a generator, one transaction per batch, never holding more than a batch."""
+        written, chunk = 0, []
+        for obj in objects:
+            chunk.append(obj)
+            if len(chunk) >= batch_size:
+                written += self._flush(model, chunk)
+                chunk = []
+        return written + self._flush(model, chunk)
+
+    @staticmethod
+    def _flush(model, chunk):
+        with transaction.atomic():
+            model.objects.bulk_create(chunk)
+        return len(chunk)
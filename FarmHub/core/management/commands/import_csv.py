@@ -0,0 +1,49 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import IMPORT_CHUNK_SIZE, IMPORT_COLUMNS, IMPORT_KINDS, ImportFileError, import_csv
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Import cows, milk records or activities from a CSV file in batched transactions. "
+        "Rows refer to cows by tag_number and farmers by username. Columns per kind: "
+        + "; ".join(f"{kind}: {', '.join(req)} [{', '.join(opt)}]" for kind, (req, opt) in IMPORT_COLUMNS.items())
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=IMPORT_KINDS)
+        parser.add_argument("path", help="CSV file with a header row ('-' for stdin).")
+        parser.add_argument("--user", help="Import as this admin/agent username; agents only reach their farms.")
+        parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **opts):
+        user = None
+        if opts["user"]:
+            user = User.objects.filter(username=opts["user"], role__in=("admin", "agent")).first()
+            if user is None:
+                raise CommandError(f"No admin or agent named {opts['user']!r}.")
+
+        def progress(stats):
+            self.stdout.write(f"{stats.rows} rows, {stats.saved} saved, {stats.failed} failed, "
+                              f"{stats.replaced} replaced ({stats.rows_per_second:.0f} rows/s)")
+
+        try:
+            if opts["path"] == "-":
+                stats = import_csv(opts["kind"], sys.stdin, user, opts["chunk_size"], progress)
+            else:
+                with open(opts["path"], newline="", encoding="utf-8-sig") as f:
+                    stats = import_csv(opts["kind"], f, user, opts["chunk_size"], progress)
+        except (ImportFileError, OSError) as e:
+            raise CommandError(str(e))
+
+        for error in stats.errors:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        if stats.failed > len(stats.errors):
+            self.stderr.write(f"... and {stats.failed - len(stats.errors)} more rejected rows")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats.saved} of {stats.rows} {opts['kind']} rows in {stats.seconds:.1f}s "
+            f"({stats.rows_per_second:.0f} rows/s)."
+        ))
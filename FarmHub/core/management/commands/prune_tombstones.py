@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Tombstone
+from core.sync import tombstone_horizon
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete sync tombstones older than SYNC_TOMBSTONE_DAYS. Clients whose "
+        "last sync is older than that get a full snapshot from /api/sync/."
+    )
+
+    def handle(self, *args, **options):
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=tombstone_horizon()).delete()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} tombstones."))
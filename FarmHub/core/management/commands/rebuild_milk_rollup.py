@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.rollups import REBUILD_BATCH_SIZE, rebuild_daily_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyMilkRollup table from MilkProduction and its archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        written = rebuild_daily_rollups(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} daily milk rollup rows."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.enrollments import RECONCILE_BATCH_SIZE, reconcile_enrollments
+
+
+class Command(BaseCommand):
+    help = "Recompute every enrollment's total_yield, progress and certificate flag from the milk rollup."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=RECONCILE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        changed = reconcile_enrollments(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {changed} enrollments."))
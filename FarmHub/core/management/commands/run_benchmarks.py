@@ -0,0 +1,204 @@
+import json
+import subprocess
+import threading
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import Activity, Cow, Enrollment, Farm, MilkProduction, User
+
+
+class QueryCounter:
+    """Counts queries on every database connection, in any thread."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection=None, **kwargs):
+        targets = [connection] if connection is not None else connections.all()
+        for conn in targets:
+            if self not in conn.execute_wrappers:
+                conn.execute_wrappers.append(self)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the DRF list/detail/create views and the FastAPI report endpoints "
+        "in-process. Writes p50/p95/p99 latency and queries per request as JSON. "
+        "Writes made by the benchmark are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout.")
+        parser.add_argument("--skip-reports", action="store_true", help="Only benchmark the DRF API.")
+
+    def handle(self, *args, **opts):
+        self.iterations, self.warmup = opts["iterations"], opts["warmup"]
+        self.counter = QueryCounter()
+        self.counter.install()
+        connection_created.connect(self.counter.install, weak=False)
+        try:
+            results = self._api_results()
+            if not opts["skip_reports"]:
+                results += self._report_results()
+        finally:
+            connection_created.disconnect(self.counter.install)
+
+        report = {"meta": self._meta(), "results": results}
+        payload = json.dumps(report, indent=2)
+        if opts["output"]:
+            with open(opts["output"], "w") as fh:
+                fh.write(payload + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {opts['output']}"))
+        else:
+            self.stdout.write(payload)
+
+    def _measure(self, name, call):
+        for _ in range(self.warmup):
+            call()
+        timings, queries, statuses = [], [], set()
+        for _ in range(self.iterations):
+            before = self.counter.count
+            start = time.perf_counter()
+            response = call()
+            timings.append((time.perf_counter() - start) * 1000)
+            queries.append(self.counter.count - before)
+            statuses.add(response.status_code)
+        timings.sort()
+        return {
+            "name": name,
+            "iterations": self.iterations,
+            "status": sorted(statuses),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+            "mean_ms": round(sum(timings) / len(timings), 3),
+            "queries_per_request": round(sum(queries) / len(queries), 2),
+        }
+
+    def _users(self):
+        users = {}
+        for role in ("admin", "agent", "farmer"):
+            user = User.objects.filter(role=role).order_by("id").first()
+            if user is None:
+                raise CommandError(f"No {role} user found; run generate_farm_data first.")
+            users[role] = user
+        return users
+
+    def _api_results(self):
+        users = self._users()
+        farmer = users["farmer"]
+        cow = Cow.objects.filter(farmer=farmer).first()
+        if cow is None:
+            raise CommandError("The first farmer has no cows; run generate_farm_data first.")
+        details = {
+            "farms": Farm.objects.filter(agent=users["agent"]).values_list("id", flat=True).first(),
+            "cows": cow.id,
+            "milk": MilkProduction.objects.filter(cow=cow).values_list("id", flat=True).first(),
+            "activities": Activity.objects.filter(cow=cow).values_list("id", flat=True).first(),
+            "enrollments": Enrollment.objects.filter(user=farmer).values_list("id", flat=True).first(),
+        }
+        results = []
+        try:
+            with transaction.atomic():
+                for role, user in users.items():
+                    client = APIClient()
+                    client.force_authenticate(user)
+                    for resource, pk in details.items():
+                        url = f"/api/{resource}/"
+                        results.append(self._measure(f"GET {url} as {role}", lambda u=url: client.get(u)))
+                        results.append(self._measure(
+                            f"GET {url}?cursor= as {role}", lambda u=url: client.get(u, {"cursor": ""})))
+                        if pk:
+                            detail = f"{url}{pk}/"
+                            results.append(self._measure(f"GET {detail} as {role}", lambda u=detail: client.get(u)))
+
+                client = APIClient()
+                client.force_authenticate(farmer)
+                days = iter(range(1, 10 ** 6))
+                results.append(self._measure("POST /api/milk/ as farmer", lambda: client.post(
+                    "/api/milk/", {"cow": cow.id, "date": str(date(3000, 1, 1) + timedelta(days=next(days))),
+                                   "quantity": 11.5}, format="json")))
+                results.append(self._measure("POST /api/milk/bulk/ (100 records) as farmer", lambda: client.post(
+                    "/api/milk/bulk/",
+                    [{"cow": cow.id, "date": str(date(3000, 1, 1) + timedelta(days=next(days))), "quantity": 9.0}
+                     for _ in range(100)], format="json")))
+                results.append(self._measure("POST /api/activities/ as farmer", lambda: client.post(
+                    "/api/activities/", {"cow": cow.id, "activity_type": "benchmark"}, format="json")))
+                raise Rollback
+        except Rollback:
+            pass
+        return results
+
+    def _report_results(self):
+        from fastapi.testclient import TestClient
+        from reporting.main import app
+
+        users = self._users()
+        client = TestClient(app)
+        year_ago = str(date.today() - timedelta(days=365))
+        month_ago = str(date.today() - timedelta(days=30))
+        farm_id = Farm.objects.values_list("id", flat=True).first()
+        paths = [
+            ("/reports/farm-summary", {}),
+            ("/reports/milk-production", {"start_date": month_ago, "farm_id": farm_id}),
+            ("/reports/milk-production", {"start_date": month_ago, "farm_id": farm_id, "format": "ndjson"}),
+            ("/reports/milk-production/grouped", {"group_by": "month", "start_date": year_ago}),
+            ("/reports/milk-production/grouped", {"group_by": "cow", "farm_id": farm_id}),
+            ("/reports/recent-activities", {"limit": 50}),
+        ]
+        results = []
+        for role, user in users.items():
+            headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+            for path, params in paths:
+                query = "&".join(f"{k}={v}" for k, v in params.items())
+                name = f"GET {path}{'?' + query if query else ''} as {role}"
+                results.append(self._measure(
+                    name, lambda p=path, q=params: client.get(p, params=q, headers=headers)))
+        return results
+
+    def _meta(self):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "database": connections["default"].vendor,
+            "iterations": self.iterations,
+            "rows": {
+                "farms": Farm.objects.count(),
+                "cows": Cow.objects.count(),
+                "milk_records": MilkProduction.objects.count(),
+                "activities": Activity.objects.count(),
+                "enrollments": Enrollment.objects.count(),
+            },
+        }
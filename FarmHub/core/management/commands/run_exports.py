@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core.exports import work
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued exports from the ExportJob table (EXPORT_BACKEND = \"db\"). "
+        "Jobs left running by a dead worker for EXPORT_STALE_AFTER seconds are "
+        "queued again. With --once, also picks up what a restarted web process "
+        "left behind under the thread backend."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+
+    def handle(self, *args, **options):
+        work(options["poll"], options["once"])
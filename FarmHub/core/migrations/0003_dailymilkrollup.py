@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rollups(apps, schema_editor):
+    MilkProduction = apps.get_model('core', 'MilkProduction')
+    DailyMilkRollup = apps.get_model('core', 'DailyMilkRollup')
+    rows = (MilkProduction.objects
+            .order_by()
+            .values('cow_id', 'cow__farm_id', 'date')
+            .annotate(total=Sum('quantity'), n=Count('id')))
+    DailyMilkRollup.objects.bulk_create(
+        [
+            DailyMilkRollup(
+                farm_id=r['cow__farm_id'], cow_id=r['cow_id'], date=r['date'],
+                total_quantity=r['total'] or 0, record_count=r['n'],
+            )
+            for r in rows.iterator()
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_milkproduction_options_activity_category_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyMilkRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True)),
+                ('total_quantity', models.FloatField(default=0)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('cow', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='milk_rollups', to='core.cow')),
+                ('farm', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='milk_rollups', to='core.farm')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('farm', 'cow', 'date'), name='uq_farm_cow_date_rollup')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_dailymilkrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='activity',
+            name='cow',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='activities', to='core.cow'),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='recorded_by',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='activities', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='cow',
+            name='farm',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cows', to='core.farm'),
+        ),
+        migrations.AlterField(
+            model_name='cow',
+            name='farmer',
+            field=models.ForeignKey(db_index=False, limit_choices_to={'role': 'farmer'}, on_delete=django.db.models.deletion.CASCADE, related_name='cows', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='dailymilkrollup',
+            name='farm',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='milk_rollups', to='core.farm'),
+        ),
+        migrations.AlterField(
+            model_name='enrollment',
+            name='farm',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='enrollments', to='core.farm'),
+        ),
+        migrations.AlterField(
+            model_name='enrollment',
+            name='user',
+            field=models.ForeignKey(db_index=False, limit_choices_to={'role': 'farmer'}, on_delete=django.db.models.deletion.CASCADE, related_name='enrollments', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='farm',
+            name='agent',
+            field=models.ForeignKey(db_index=False, limit_choices_to={'role': 'agent'}, on_delete=django.db.models.deletion.CASCADE, related_name='farms', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='milkproduction',
+            name='cow',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='milk_records', to='core.cow'),
+        ),
+        migrations.AlterField(
+            model_name='milkproduction',
+            name='recorded_by',
+            field=models.ForeignKey(db_index=False, limit_choices_to={'role': 'farmer'}, on_delete=django.db.models.deletion.CASCADE, related_name='milk_records', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['recorded_by', 'date', 'created_at'], name='activity_recorder_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['cow', 'date', 'created_at'], name='activity_cow_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['date', 'created_at'], name='activity_date_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cow',
+            index=models.Index(fields=['farm', 'is_active'], name='cow_farm_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cow',
+            index=models.Index(fields=['farmer', 'is_active'], name='cow_farmer_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailymilkrollup',
+            index=models.Index(fields=['farm', 'date'], name='rollup_farm_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['user', 'enrolled_at'], name='enroll_user_enrolled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['farm', 'is_active'], name='enroll_farm_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='farm',
+            index=models.Index(fields=['agent', 'is_active'], name='farm_agent_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milkproduction',
+            index=models.Index(fields=['recorded_by', 'date', 'created_at'], name='milk_recorder_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milkproduction',
+            index=models.Index(fields=['cow', 'date', 'created_at'], name='milk_cow_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milkproduction',
+            index=models.Index(fields=['date', 'created_at'], name='milk_date_created_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_farm_from_cow(apps, schema_editor):
+    Cow = apps.get_model("core", "Cow")
+    for name in ("MilkProduction", "Activity"):
+        model = apps.get_model("core", name)
+        model.objects.update(
+            farm_id=Subquery(Cow.objects.filter(pk=OuterRef("cow_id")).values("farm_id")[:1])
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='farm',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activities', to='core.farm'),
+        ),
+        migrations.AddField(
+            model_name='milkproduction',
+            name='farm',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='milk_records', to='core.farm'),
+        ),
+        migrations.RunPython(copy_farm_from_cow, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='activity',
+            name='farm',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='activities', to='core.farm'),
+        ),
+        migrations.AlterField(
+            model_name='milkproduction',
+            name='farm',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='milk_records', to='core.farm'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['farm', 'date', 'created_at'], name='activity_farm_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='milkproduction',
+            index=models.Index(fields=['farm', 'date', 'created_at'], name='milk_farm_date_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_milk_activity_farm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMilkProduction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('quantity', models.FloatField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('cow', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_milk_records', to='core.cow')),
+                ('farm', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_milk_records', to='core.farm')),
+                ('recorded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_milk_records', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date', '-created_at'],
+                'indexes': [models.Index(fields=['cow', 'date'], name='archived_milk_cow_date_idx'), models.Index(fields=['farm', 'date'], name='archived_milk_farm_date_idx'), models.Index(fields=['date'], name='archived_milk_date_idx')],
+            },
+        ),
+    ]
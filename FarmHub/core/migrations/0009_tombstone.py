@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('farms', 'Farm'), ('cows', 'Cow'), ('milk', 'Milk production'), ('activities', 'Activity'), ('enrollments', 'Enrollment')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('farm_id', models.BigIntegerField(blank=True, null=True)),
+                ('owner_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'), models.Index(fields=['farm_id', 'deleted_at'], name='tombstone_farm_idx'), models.Index(fields=['owner_id', 'deleted_at'], name='tombstone_owner_idx')],
+            },
+        ),
+    ]
@@ -39,12 +39,18 @@ class Farm(TimestampedModel):
         User,
         related_name='farms',
         on_delete=models.CASCADE,
-        limit_choices_to={'role': 'agent'}
+        limit_choices_to={'role': 'agent'},
+        db_index=False,  # farm_agent_active_idx
     )
     is_active = models.BooleanField(default=True)
     farm_type = models.CharField(max_length=100, blank=True, null=True)  
     farm_size = models.FloatField(blank=True, null=True)  
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['agent', 'is_active'], name='farm_agent_active_idx'),
+        ]
+
     def __str__(self):
         return f"self.name (id {self.id})"
 
@@ -53,15 +59,22 @@ class Cow(TimestampedModel):
     breed = models.CharField(max_length=100)
     birth_date = models.DateField()
     health_status = models.CharField(max_length=100, blank=True, null=True)  
-    farm = models.ForeignKey(Farm, related_name='cows', on_delete=models.CASCADE)
+    farm = models.ForeignKey(Farm, related_name='cows', on_delete=models.CASCADE, db_index=False)  # cow_farm_active_idx
     farmer = models.ForeignKey(
         User,
         related_name='cows',
         on_delete=models.CASCADE,
-        limit_choices_to={'role': 'farmer'}
+        limit_choices_to={'role': 'farmer'},
+        db_index=False,  # cow_farmer_active_idx
     )
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['farm', 'is_active'], name='cow_farm_active_idx'),
+            models.Index(fields=['farmer', 'is_active'], name='cow_farmer_active_idx'),
+        ]
+
     def __str__(self):
         return f"Cow {self.tag_number} - {self.breed} (id{self.id})"
 
@@ -69,41 +82,108 @@ class Activity(TimestampedModel):
     activity_type = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
     date = models.DateField(null=True, blank=True, db_index=True)
-    cow = models.ForeignKey(Cow, related_name='activities', on_delete=models.CASCADE)
-    recorded_by = models.ForeignKey(User, related_name='activities', on_delete=models.CASCADE)  
+    cow = models.ForeignKey(Cow, related_name='activities', on_delete=models.CASCADE, db_index=False)  # activity_cow_date_idx
+    recorded_by = models.ForeignKey(User, related_name='activities', on_delete=models.CASCADE, db_index=False)  # activity_recorder_date_idx
+    # copy of cow.farm so farm scoping needs no join; kept in step by core.signals
+    farm = models.ForeignKey(Farm, related_name='activities', on_delete=models.CASCADE, editable=False, db_index=False)  # activity_farm_date_idx
     category = models.CharField(max_length=100, null=True, blank=True) 
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['recorded_by', 'date', 'created_at'], name='activity_recorder_date_idx'),
+            models.Index(fields=['cow', 'date', 'created_at'], name='activity_cow_date_idx'),
+            models.Index(fields=['farm', 'date', 'created_at'], name='activity_farm_date_idx'),
+            models.Index(fields=['date', 'created_at'], name='activity_date_created_idx'),
+        ]
+
     def __str__(self):
         return f"Activity for Cow {self.cow.tag_number} - {self.activity_type}"
 
 class MilkProduction(TimestampedModel):
     date = models.DateField(db_index=True)
     quantity = models.FloatField()  # liters
-    cow = models.ForeignKey(Cow, related_name='milk_records', on_delete=models.CASCADE)
+    cow = models.ForeignKey(Cow, related_name='milk_records', on_delete=models.CASCADE, db_index=False)  # milk_cow_date_idx
     recorded_by = models.ForeignKey(
         User,
         related_name='milk_records',
         on_delete=models.CASCADE,
-        limit_choices_to={'role': 'farmer'}
+        limit_choices_to={'role': 'farmer'},
+        db_index=False,  # milk_recorder_date_idx
     )
+    # copy of cow.farm so farm scoping needs no join; kept in step by core.signals
+    farm = models.ForeignKey(Farm, related_name='milk_records', on_delete=models.CASCADE, editable=False, db_index=False)  # milk_farm_date_idx
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['cow', 'date'], name='uq_cow_date_milk')
         ]
+        indexes = [
+            models.Index(fields=['recorded_by', 'date', 'created_at'], name='milk_recorder_date_idx'),
+            models.Index(fields=['cow', 'date', 'created_at'], name='milk_cow_date_idx'),
+            models.Index(fields=['farm', 'date', 'created_at'], name='milk_farm_date_idx'),
+            models.Index(fields=['date', 'created_at'], name='milk_date_created_idx'),
+        ]
         ordering = ['-date', '-created_at']
 
     def __str__(self):
         return f"Milk Production for Cow {self.cow.tag_number} on {self.date}"
 
+class ArchivedMilkProduction(models.Model):
+    """
+    MilkProduction rows older than MILK_ARCHIVE_AFTER_DAYS, moved here by
+    `manage.py archive_milk` with their original ids. (cow, date) stays
+    unique across both tables; reports read them together.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    date = models.DateField()
+    quantity = models.FloatField()  # liters
+    cow = models.ForeignKey(Cow, related_name='archived_milk_records', on_delete=models.CASCADE, db_index=False)  # archived_milk_cow_date_idx
+    farm = models.ForeignKey(Farm, related_name='archived_milk_records', on_delete=models.CASCADE, db_index=False)  # archived_milk_farm_date_idx
+    recorded_by = models.ForeignKey(User, related_name='archived_milk_records', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cow', 'date'], name='archived_milk_cow_date_idx'),
+            models.Index(fields=['farm', 'date'], name='archived_milk_farm_date_idx'),
+            models.Index(fields=['date'], name='archived_milk_date_idx'),
+        ]
+        ordering = ['-date', '-created_at']
+
+    def __str__(self):
+        return f"Archived milk production for cow id {self.cow_id} on {self.date}"
+
+class DailyMilkRollup(models.Model):
+    """Per cow per day milk totals, kept up to date from MilkProduction writes."""
+    farm = models.ForeignKey(Farm, related_name='milk_rollups', on_delete=models.CASCADE, db_index=False)  # rollup_farm_date_idx
+    cow = models.ForeignKey(Cow, related_name='milk_rollups', on_delete=models.CASCADE)
+    date = models.DateField(db_index=True)
+    total_quantity = models.FloatField(default=0)  # liters
+    record_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['farm', 'cow', 'date'], name='uq_farm_cow_date_rollup')
+        ]
+        indexes = [
+            models.Index(fields=['farm', 'date'], name='rollup_farm_date_idx'),
+        ]
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"Milk rollup for cow id {self.cow_id} on {self.date}"
+
 class Enrollment(TimestampedModel):
     user = models.ForeignKey(
         User,
         related_name='enrollments',
         on_delete=models.CASCADE,
-        limit_choices_to={'role': 'farmer'}
+        limit_choices_to={'role': 'farmer'},
+        db_index=False,  # enroll_user_enrolled_idx
     )
-    farm = models.ForeignKey(Farm, related_name='enrollments', on_delete=models.CASCADE)
+    farm = models.ForeignKey(Farm, related_name='enrollments', on_delete=models.CASCADE, db_index=False)  # enroll_farm_active_idx
     is_active = models.BooleanField(default=True)
     progress = models.IntegerField(default=0)
     is_completed = models.BooleanField(default=False)
@@ -115,8 +195,126 @@ class Enrollment(TimestampedModel):
         constraints = [
             models.UniqueConstraint(fields=['user', 'farm'], name='uq_user_farm_enrollment')
         ]
+        indexes = [
+            models.Index(fields=['user', 'enrolled_at'], name='enroll_user_enrolled_idx'),
+            models.Index(fields=['farm', 'is_active'], name='enroll_farm_active_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} enrolled in {self.farm.name}"
 
 
+
+EXPORT_DATASETS = (
+    ("milk", "Milk production"),
+    ("activities", "Activities"),
+    ("cows", "Cows"),
+    ("enrollments", "Enrollments"),
+)
+EXPORT_FORMATS = (
+    ("csv", "Gzipped CSV"),
+    ("parquet", "Parquet"),
+)
+EXPORT_STATUSES = (
+    ("pending", "Pending"),
+    ("running", "Running"),
+    ("done", "Done"),
+    ("failed", "Failed"),
+)
+
+class ExportJob(TimestampedModel):
+    """A requested data export; the file is written under MEDIA_ROOT by core.exports."""
+    requested_by = models.ForeignKey(User, related_name='export_jobs', on_delete=models.CASCADE)
+    dataset = models.CharField(max_length=20, choices=EXPORT_DATASETS)
+    format = models.CharField(max_length=10, choices=EXPORT_FORMATS, default="csv")
+    filters = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=EXPORT_STATUSES, default="pending")
+    file = models.FileField(upload_to="exports/", blank=True)
+    rows = models.BigIntegerField(default=0)
+    size = models.BigIntegerField(default=0)  # bytes
+    error = models.TextField(blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.dataset} export #{self.id} ({self.status})"
+
+class DataVersion(models.Model):
+    """
+    A single row counting writes to the data behind the reports (farms,
+    cows, users and milk). The write signals bump it, so every process reads
+    the same version with one primary-key lookup.
+    """
+    version = models.BigIntegerField(default=0)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+
+    @classmethod
+    def bump(cls):
+        if not cls.objects.filter(pk=1).update(version=models.F("version") + 1):
+            cls.objects.get_or_create(pk=1, defaults={"version": 1})
+
+    def __str__(self):
+        return f"data version {self.version}"
+
+class ReportJob(TimestampedModel):
+    """
+    A report queued on the reporting service (reporting.jobs). Jobs with the
+    same report, parameters and caller scope share one row per data version,
+    and its gzipped JSON result under MEDIA_ROOT is served until data changes.
+    """
+    report = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    principal = models.JSONField(default=dict)  # who it runs as: user_id, username, role, farm_ids
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=64)  # sha256 of report, params and scope
+    data_version = models.BigIntegerField()  # DataVersion.version when it was submitted
+    status = models.CharField(max_length=10, choices=EXPORT_STATUSES, default="pending")
+    result = models.FileField(upload_to="report-jobs/", blank=True)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key', 'data_version'], condition=~models.Q(status='failed'), name='uq_report_job_key_version'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='report_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.report} job #{self.id} ({self.status})"
+
+SYNC_MODELS = (
+    ("farms", "Farm"),
+    ("cows", "Cow"),
+    ("milk", "Milk production"),
+    ("activities", "Activity"),
+    ("enrollments", "Enrollment"),
+)
+
+class Tombstone(models.Model):
+    """
+    A row that was deleted, or left a farm or farmer's view, so /api/sync/
+    can tell offline clients to drop it. farm_id and owner_id (the farmer,
+    recorder or enrolled user) are copied from the row, which is gone.
+    """
+    model = models.CharField(max_length=20, choices=SYNC_MODELS)
+    object_id = models.BigIntegerField()
+    farm_id = models.BigIntegerField(null=True, blank=True)
+    owner_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+            models.Index(fields=['farm_id', 'deleted_at'], name='tombstone_farm_idx'),
+            models.Index(fields=['owner_id', 'deleted_at'], name='tombstone_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
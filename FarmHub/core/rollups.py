@@ -0,0 +1,98 @@
+from itertools import chain
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import ArchivedMilkProduction, DailyMilkRollup, MilkProduction
+
+REBUILD_BATCH_SIZE = 2000
+
+
+def apply_rollup_delta(cow_id, farm_id, day, quantity, records):
+    """Add ``quantity`` liters and ``records`` rows to the (cow, day) rollup."""
+    rollups = DailyMilkRollup.objects.filter(cow_id=cow_id, date=day)
+    updated = rollups.update(
+        total_quantity=F("total_quantity") + quantity,
+        record_count=F("record_count") + records,
+    )
+    if updated:
+        if records < 0:
+            rollups.filter(record_count__lte=0).delete()
+        return
+    if records <= 0:
+        return
+    try:
+        with transaction.atomic():
+            DailyMilkRollup.objects.create(
+                farm_id=farm_id, cow_id=cow_id, date=day,
+                total_quantity=quantity, record_count=records,
+            )
+    except IntegrityError:
+        # created concurrently by another writer
+        rollups.update(
+            total_quantity=F("total_quantity") + quantity,
+            record_count=F("record_count") + records,
+        )
+
+
+def _grouped_milk(qs):
+    return (qs.order_by()
+              .values("cow_id", "farm_id", "date")
+              .annotate(total=Sum("quantity"), n=Count("id")))
+
+
+def refresh_daily_rollups(keys):
+    """
+    Recompute the rollups for the given (cow_id, date) pairs from source rows.
+    Used after bulk writes, which do not send model signals. Writes never land
+    on an archived (cow, date), so only MilkProduction is read.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    cow_ids = {cow_id for cow_id, _ in keys}
+    days = {day for _, day in keys}
+
+    fresh = [
+        DailyMilkRollup(
+            farm_id=row["farm_id"], cow_id=row["cow_id"], date=row["date"],
+            total_quantity=row["total"] or 0, record_count=row["n"],
+        )
+        for row in _grouped_milk(MilkProduction.objects.filter(cow_id__in=cow_ids, date__in=days))
+        if (row["cow_id"], row["date"]) in keys
+    ]
+    stale = [
+        pk for pk, cow_id, day in DailyMilkRollup.objects
+        .filter(cow_id__in=cow_ids, date__in=days)
+        .values_list("id", "cow_id", "date")
+        if (cow_id, day) in keys
+    ]
+    with transaction.atomic():
+        DailyMilkRollup.objects.filter(id__in=stale).delete()
+        DailyMilkRollup.objects.bulk_create(fresh, batch_size=REBUILD_BATCH_SIZE)
+
+
+def rebuild_daily_rollups(batch_size=REBUILD_BATCH_SIZE):
+    """
+    Drop and regenerate every rollup row from hot and archived milk records,
+    one grouped scan each (they never share a (cow, date)). Returns the row count.
+    """
+    written = 0
+    batch = []
+    with transaction.atomic():
+        DailyMilkRollup.objects.all().delete()
+        for row in chain(
+            _grouped_milk(MilkProduction.objects.all()).iterator(chunk_size=batch_size),
+            _grouped_milk(ArchivedMilkProduction.objects.all()).iterator(chunk_size=batch_size),
+        ):
+            batch.append(DailyMilkRollup(
+                farm_id=row["farm_id"], cow_id=row["cow_id"], date=row["date"],
+                total_quantity=row["total"] or 0, record_count=row["n"],
+            ))
+            if len(batch) >= batch_size:
+                DailyMilkRollup.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        DailyMilkRollup.objects.bulk_create(batch)
+        written += len(batch)
+    return written
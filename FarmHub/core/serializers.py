@@ -1,8 +1,13 @@
+from functools import partial
+
 from rest_framework import serializers
-from .models import User, Farm, Cow, Activity, MilkProduction, Enrollment
+from rest_framework.settings import ISO_8601, api_settings
+from .models import User, Farm, Cow, Activity, MilkProduction, Enrollment, ExportJob
+from .archive import archived_keys
 from django.contrib.auth.hashers import make_password
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.urls import reverse
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -86,6 +91,36 @@ class ActivitySerializer(serializers.ModelSerializer):
         validated_data["recorded_by"] = self.context["request"].user
         return super().create(validated_data)
 
+# Compact (flat) representations: foreign keys stay as ids.
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'email', 'role', 'mobile_no']
+
+class FarmCompactSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Farm
+        fields = '__all__'
+
+class CowCompactSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Cow
+        fields = '__all__'
+
+class ActivityBulkSerializer(serializers.Serializer):
+    """One activity applied to many cows, addressed by id and/or tag number."""
+    activity_type = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+    date = serializers.DateField(required=False, allow_null=True)
+    category = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    cows = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    tag_numbers = serializers.ListField(child=serializers.CharField(max_length=255), required=False, default=list)
+
+    def validate(self, attrs):
+        if not attrs["cows"] and not attrs["tag_numbers"]:
+            raise serializers.ValidationError("Provide at least one cow id or tag number.")
+        return attrs
+
 class MilkProductionSerializer(serializers.ModelSerializer):
     cow = serializers.PrimaryKeyRelatedField(queryset=Cow.objects.all())
     recorded_by = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -102,6 +137,45 @@ class MilkProductionSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     "You can only record milk for your own cows."
                 )
+        day = attrs.get("date") or getattr(self.instance, "date", None)
+        if cow and day and archived_keys({(cow.id, day)}):
+            raise serializers.ValidationError(
+                "This cow already has an archived milk record for that date."
+            )
+        return attrs
+
+class MilkProductionBulkItemSerializer(serializers.Serializer):
+    """One entry of a bulk milk upload; the cow is resolved by the view in one query."""
+    cow = serializers.IntegerField(min_value=1)
+    date = serializers.DateField()
+    quantity = serializers.FloatField()
+
+class ExportFiltersSerializer(serializers.Serializer):
+    farm_id = serializers.IntegerField(required=False, min_value=1)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    filters = ExportFiltersSerializer(required=False)
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ['id', 'dataset', 'format', 'filters', 'status', 'rows', 'size', 'error',
+                  'created_at', 'finished_at', 'download_url']
+        read_only_fields = ['status', 'rows', 'size', 'error', 'created_at', 'finished_at']
+
+    def get_download_url(self, obj):
+        if obj.status != "done":
+            return None
+        return reverse("core:export-download", kwargs={"pk": obj.pk})
+
+    def validate(self, attrs):
+        filters = attrs.get("filters") or {}
+        if attrs["dataset"] not in ("milk", "activities") and ({"start_date", "end_date"} & set(filters)):
+            raise serializers.ValidationError({"filters": "Date filters only apply to milk and activities."})
+        # stored as JSON
+        attrs["filters"] = {k: v.isoformat() if hasattr(v, "isoformat") else v for k, v in filters.items()}
         return attrs
 
 ADMIN, AGENT, FARMER = "admin", "agent", "farmer"
@@ -144,4 +218,91 @@ class LogoutSerializer(serializers.Serializer):
     def validate_refresh(self, value):
         if not value:
             raise serializers.ValidationError("Refresh token is required.")
-        return value
\ No newline at end of file
+        return value
+
+class FastListSerializer:
+    """
+    Read-only twin of a ModelSerializer for list responses. The field list is
+    compiled once from the wrapped serializer and rows are read with
+    ``.values()`` and converted to plain dicts, so the output matches
+    ``Serializer(objs, many=True).data`` without building model instances or
+    walking DRF's per-field machinery.
+    """
+    _plain = {
+        serializers.IntegerField: int,
+        getattr(serializers, "BigIntegerField", serializers.IntegerField): int,  # DRF >= 3.15
+        serializers.FloatField: float,
+        serializers.CharField: str,
+        serializers.BooleanField: bool,
+    }
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._columns = None
+
+    @property
+    def columns(self):
+        """(output name, model attname, DRF field) for every readable field."""
+        # compiled lazily: instantiating serializer fields needs the app registry
+        if self._columns is None:
+            model = self.serializer_class.Meta.model
+            self._columns = [
+                (name, model._meta.get_field(field.source).attname, field)
+                for name, field in self.serializer_class().fields.items()
+                if not field.write_only
+            ]
+        return self._columns
+
+    def values(self, queryset, *extra):
+        """The queryset reduced to the columns this serializer (and the caller) needs."""
+        attnames = [attname for _, attname, _ in self.columns]
+        return queryset.select_related(None).values(*attnames, *[f for f in dict.fromkeys(extra) if f not in attnames])
+
+    def _converter(self, field):
+        """A one-argument function equivalent to ``field.to_representation`` for non-null values."""
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+            return None
+        if type(field) in self._plain and not getattr(field, "coerce_to_string", False):
+            return self._plain[type(field)]
+        if isinstance(field, serializers.DateTimeField):
+            output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+            if isinstance(output_format, str) and output_format.lower() == ISO_8601:
+                # resolved per call: the current timezone is request state
+                tz = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+                return partial(_iso_datetime, tz, field.to_representation)
+        elif isinstance(field, serializers.DateField):
+            output_format = getattr(field, "format", api_settings.DATE_FORMAT)
+            if isinstance(output_format, str) and output_format.lower() == ISO_8601:
+                return _iso_date
+        return field.to_representation
+
+    def serialize(self, rows):
+        columns = [(name, attname, self._converter(field)) for name, attname, field in self.columns]
+        return [
+            {
+                name: row[attname] if convert is None or row[attname] is None else convert(row[attname])
+                for name, attname, convert in columns
+            }
+            for row in rows
+        ]
+
+
+def _iso_date(value):
+    return value.isoformat()
+
+
+def _iso_datetime(tz, fallback, value):
+    if tz is None or value.tzinfo is None:
+        return fallback(value)
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+
+FAST_LIST_SERIALIZERS = {
+    serializer_class: FastListSerializer(serializer_class)
+    for serializer_class in (MilkProductionSerializer, ActivitySerializer, EnrollmentSerializer)
+}
+
+class ActivitySyncSerializer(ActivitySerializer):
+    # offline copies link activities to their cow
+    cow = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -0,0 +1,233 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import invalidate_farm_summary
+from .enrollments import apply_yield_delta, reconcile_enrollments, sync_enrollment_yield, yield_pairs_for_cows
+from .models import (
+    Activity, ArchivedMilkProduction, Cow, DailyMilkRollup, DataVersion, Enrollment, Farm, MilkProduction,
+    Tombstone, User,
+)
+from .rollups import apply_rollup_delta, refresh_daily_rollups
+from .sync import record_departures, tombstone, tombstones_for
+
+_local = threading.local()
+
+
+@contextmanager
+def milk_signals_muted():
+    """
+    Skip rollup and summary upkeep for MilkProduction deletes in this thread,
+    for moves (archiving) that leave every total unchanged.
+    """
+    _local.milk_muted = True
+    try:
+        yield
+    finally:
+        _local.milk_muted = False
+
+
+def _milk_muted():
+    return getattr(_local, "milk_muted", False)
+
+
+def _in_cascade(origin):
+    # a farm or cow deleted on its own: its rows are handled once, around the whole delete
+    return isinstance(origin, (Farm, Cow))
+
+
+def data_changed():
+    """
+    Farms, cows, users or milk were written: move the stored data version
+    (queued reports key on it) and retire this cache's reports.
+    """
+    DataVersion.bump()
+    invalidate_farm_summary()
+
+
+def milk_bulk_written(keys):
+    """
+    Bring derived data up to date after a bulk MilkProduction write
+    (bulk_create/update send no model signals). ``keys`` are the touched
+    (cow_id, date) pairs.
+    """
+    refresh_daily_rollups(keys)
+    reconcile_enrollments(yield_pairs_for_cows(cow_id for cow_id, _ in keys))
+    data_changed()
+
+
+@receiver(pre_save, sender=MilkProduction)
+@receiver(pre_save, sender=Activity)
+def copy_farm_from_cow(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance.farm_id = instance.cow.farm_id
+
+
+@receiver(pre_save, sender=MilkProduction)
+def remember_previous_milk(sender, instance, raw=False, **kwargs):
+    instance._previous_milk = None
+    if raw or instance._state.adding or not instance.pk:
+        return
+    instance._previous_milk = (
+        MilkProduction.objects
+        .filter(pk=instance.pk)
+        .values("cow_id", "cow__farmer_id", "farm_id", "date", "quantity")
+        .first()
+    )
+
+
+@receiver(post_save, sender=MilkProduction)
+def rollup_milk_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    prev = getattr(instance, "_previous_milk", None)
+    if prev and (prev["cow_id"], prev["date"]) == (instance.cow_id, instance.date):
+        apply_rollup_delta(instance.cow_id, prev["farm_id"], instance.date,
+                           instance.quantity - prev["quantity"], 0)
+        return
+    if prev:
+        apply_rollup_delta(prev["cow_id"], prev["farm_id"], prev["date"], -prev["quantity"], -1)
+    apply_rollup_delta(instance.cow_id, instance.farm_id, instance.date, instance.quantity, 1)
+
+
+@receiver(post_delete, sender=MilkProduction)
+def rollup_milk_deleted(sender, instance, origin=None, **kwargs):
+    # the rollups of a deleted farm or cow go with it
+    if _milk_muted() or _in_cascade(origin):
+        return
+    apply_rollup_delta(instance.cow_id, None, instance.date, -instance.quantity, -1)
+
+
+@receiver(post_save, sender=MilkProduction)
+def yield_milk_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    prev = getattr(instance, "_previous_milk", None)
+    key = (instance.cow.farmer_id, instance.farm_id)
+    if prev and (prev["cow__farmer_id"], prev["farm_id"]) == key:
+        apply_yield_delta(*key, instance.quantity - prev["quantity"])
+        return
+    if prev:
+        apply_yield_delta(prev["cow__farmer_id"], prev["farm_id"], -prev["quantity"])
+    apply_yield_delta(*key, instance.quantity)
+
+
+@receiver(post_delete, sender=MilkProduction)
+def yield_milk_deleted(sender, instance, origin=None, **kwargs):
+    if _milk_muted() or _in_cascade(origin):
+        return
+    farmer_id = Cow.objects.filter(pk=instance.cow_id).values_list("farmer_id", flat=True).first()
+    apply_yield_delta(farmer_id, instance.farm_id, -instance.quantity)
+
+
+@receiver(pre_save, sender=Cow)
+def remember_previous_cow(sender, instance, raw=False, **kwargs):
+    instance._previous_owner = None
+    if raw or instance._state.adding or not instance.pk:
+        return
+    instance._previous_owner = (
+        Cow.objects.filter(pk=instance.pk).values_list("farmer_id", "farm_id").first()
+    )
+
+
+@receiver(post_save, sender=Cow)
+def records_follow_cow_farm(sender, instance, created, raw=False, **kwargs):
+    """A cow moved to another farm takes its milk, activities and rollups along."""
+    if raw or created:
+        return
+    previous = getattr(instance, "_previous_owner", None)
+    left_farm = previous is not None and previous[1] != instance.farm_id
+    for model in (MilkProduction, ArchivedMilkProduction, Activity, DailyMilkRollup):
+        moved = model.objects.filter(cow_id=instance.id).exclude(farm_id=instance.farm_id)
+        if left_farm and model in (MilkProduction, Activity):
+            # synced clients of the old farm drop them; those of the new one see them as changed
+            record_departures(moved)
+            moved.update(farm_id=instance.farm_id, updated_at=timezone.now())
+        else:
+            moved.update(farm_id=instance.farm_id)
+
+
+@receiver(post_save, sender=Cow)
+def tombstone_moved_cow(sender, instance, created, raw=False, **kwargs):
+    """A cow given to another farm or farmer leaves the old one's synced view."""
+    previous = getattr(instance, "_previous_owner", None)
+    if raw or created or previous is None or previous == (instance.farmer_id, instance.farm_id):
+        return
+    farmer_id, farm_id = previous
+    Tombstone.objects.create(model="cows", object_id=instance.pk, farm_id=farm_id, owner_id=farmer_id)
+
+
+@receiver(post_save, sender=Cow)
+def yields_follow_cow(sender, instance, created, raw=False, **kwargs):
+    """A cow that changed farm or farmer moves its milk to another enrollment."""
+    previous = getattr(instance, "_previous_owner", None)
+    if raw or created or previous is None or previous == (instance.farmer_id, instance.farm_id):
+        return
+    reconcile_enrollments({previous, (instance.farmer_id, instance.farm_id)})
+
+
+@receiver(post_save, sender=Enrollment)
+def yield_on_enrollment(sender, instance, created, raw=False, **kwargs):
+    # (re-)enrolling picks up milk already recorded for the farmer's cows on that farm
+    if created and not raw:
+        sync_enrollment_yield(instance)
+
+
+@receiver(post_delete, sender=Cow)
+def yields_after_cow_deleted(sender, instance, origin=None, **kwargs):
+    # its milk skipped the per-row upkeep; a farm's enrollments are deleted with it
+    if origin is instance:
+        reconcile_enrollments({(instance.farmer_id, instance.farm_id)})
+
+
+@receiver(pre_delete, sender=Farm)
+@receiver(pre_delete, sender=Cow)
+def tombstone_cascade(sender, instance, origin=None, **kwargs):
+    """
+    Tombstone a farm or cow deleted on its own together with the rows its
+    delete cascades to, in one INSERT, before they are gone.
+    """
+    if origin is not instance:
+        return
+    if sender is Farm:
+        on_farm = Q(farm_id=instance.pk) | Q(cow__farm_id=instance.pk)
+        rows = [Cow.objects.filter(farm_id=instance.pk), MilkProduction.objects.filter(on_farm),
+                Activity.objects.filter(on_farm), Enrollment.objects.filter(farm_id=instance.pk)]
+    else:
+        rows = [MilkProduction.objects.filter(cow_id=instance.pk), Activity.objects.filter(cow_id=instance.pk)]
+    Tombstone.objects.bulk_create([tombstone(instance), *(t for qs in rows for t in tombstones_for(qs))])
+
+
+def tombstone_deleted(sender, instance, origin=None, **kwargs):
+    # archiving moves milk rather than deleting it
+    if sender is MilkProduction and _milk_muted():
+        return
+    if _in_cascade(origin):
+        return
+    tombstone(instance).save()
+
+
+for _model in (Farm, Cow, MilkProduction, Activity, Enrollment):
+    post_delete.connect(tombstone_deleted, sender=_model, dispatch_uid=f"tombstone_{_model.__name__}")
+
+
+def summary_changed(sender, instance, update_fields=None, origin=None, **kwargs):
+    # logins only touch last_login, which the summary does not use
+    if sender is User and update_fields and set(update_fields) <= {"last_login"}:
+        return
+    # the deleted farm or cow itself invalidates once for the rows it takes along
+    if origin is not instance and _in_cascade(origin):
+        return
+    if sender is MilkProduction and _milk_muted():
+        return
+    data_changed()
+
+
+for _model in (Farm, User, Cow, MilkProduction):
+    post_save.connect(summary_changed, sender=_model, dispatch_uid=f"summary_save_{_model.__name__}")
+    post_delete.connect(summary_changed, sender=_model, dispatch_uid=f"summary_delete_{_model.__name__}")
@@ -0,0 +1,192 @@
+import base64
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Activity, Cow, Enrollment, Farm, MilkProduction, Tombstone
+from .serializers import (
+    ActivitySyncSerializer, CowCompactSerializer, EnrollmentSerializer, FarmCompactSerializer,
+    FastListSerializer, MilkProductionSerializer,
+)
+
+SYNC_PAGE_SIZE = 1000
+# changes this close before a client's watermark are sent again, so a
+# transaction that committed just after the last sync is not missed
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+@dataclass(frozen=True)
+class SyncSource:
+    model: type
+    serializer: FastListSerializer
+    # the farmer a row belongs to (farmers see their own rows), None for farms
+    owner_field: Optional[str]
+    farm_field: str = "farm_id"
+
+
+# response key -> source; the keys are Tombstone.model values
+SOURCES = {
+    "farms": SyncSource(Farm, FastListSerializer(FarmCompactSerializer), None, farm_field="id"),
+    "cows": SyncSource(Cow, FastListSerializer(CowCompactSerializer), "farmer_id"),
+    "milk": SyncSource(MilkProduction, FastListSerializer(MilkProductionSerializer), "recorded_by_id"),
+    "activities": SyncSource(Activity, FastListSerializer(ActivitySyncSerializer), "recorded_by_id"),
+    "enrollments": SyncSource(Enrollment, FastListSerializer(EnrollmentSerializer), "user_id"),
+}
+SOURCE_NAMES = {source.model: name for name, source in SOURCES.items()}
+
+
+def tombstone(instance):
+    """The Tombstone recording that ``instance`` is gone from its current farm and owner."""
+    name = SOURCE_NAMES[type(instance)]
+    source = SOURCES[name]
+    return Tombstone(
+        model=name, object_id=instance.pk, farm_id=getattr(instance, source.farm_field),
+        owner_id=getattr(instance, source.owner_field) if source.owner_field else None,
+    )
+
+
+def tombstones_for(queryset):
+    """Unsaved Tombstones for the rows of ``queryset``, read with only the columns they need."""
+    source = SOURCES[SOURCE_NAMES[queryset.model]]
+    fields = [f for f in ("id", source.farm_field, source.owner_field) if f]
+    return [tombstone(row) for row in queryset.only(*fields)]
+
+
+def record_departures(queryset):
+    """Tombstones for the rows of ``queryset``, before they move out of their farm or owner's view."""
+    Tombstone.objects.bulk_create(tombstones_for(queryset))
+
+
+def scoped(name, scope):
+    """Rows of source ``name`` the caller sees in the list endpoints; ``scope`` is views.AccessScope."""
+    source = SOURCES[name]
+    qs = source.model.objects.all()
+    if scope.is_admin:
+        return qs
+    if scope.is_agent:
+        return qs.filter(**{f"{source.farm_field}__in": scope.managed_farm_ids})
+    if scope.is_farmer:
+        if source.owner_field is None:
+            farm = scope.active_farm
+            return qs.filter(pk=farm.pk) if farm else qs.none()
+        return qs.filter(**{source.owner_field: scope.user.id})
+    return qs.none()
+
+
+def _scoped_tombstones(scope):
+    tombstones = Tombstone.objects.all()
+    if scope.is_admin:
+        return tombstones
+    if scope.is_agent:
+        return tombstones.filter(farm_id__in=scope.managed_farm_ids)
+    if scope.is_farmer:
+        # a farmer's farm leaving their view changes the fingerprint instead
+        return tombstones.filter(owner_id=scope.user.id)
+    return tombstones.none()
+
+
+def fingerprint(scope):
+    """
+    Short hash of what bounds the caller's view: role, user and farms. When
+    it changes, rows may have left the view without a tombstone (a farm
+    reassigned, a farmer moved), so the client is sent a full snapshot.
+    """
+    farms = sorted(scope.managed_farm_ids) if scope.is_agent else (
+        [scope.active_farm.pk] if scope.is_farmer and scope.active_farm else [])
+    key = json.dumps([scope.role, getattr(scope.user, "pk", None), farms])
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def tombstone_horizon():
+    """Oldest watermark a delta can start from; older tombstones may have been pruned."""
+    return timezone.now() - timedelta(days=getattr(settings, "SYNC_TOMBSTONE_DAYS", 90))
+
+
+def _after(updated_at, pk):
+    return Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=pk)
+
+
+def _deleted(scope, since, until):
+    ids = {name: set() for name in SOURCES}
+    for name, object_id in (_scoped_tombstones(scope)
+                            .filter(deleted_at__gt=since, deleted_at__lte=until)
+                            .values_list("model", "object_id")):
+        ids[name].add(object_id)
+    for name, gone in ids.items():
+        if gone:
+            # a row that left one view may still be in this one (a cow moved between two of its farms)
+            gone -= set(scoped(name, scope).filter(pk__in=gone).values_list("pk", flat=True))
+    return {name: sorted(gone) for name, gone in ids.items()}
+
+
+def changes(scope, since=None, until=None, positions=None, page_size=None):
+    """
+    One page of the rows in ``scope`` changed in (since, until], read per
+    source in (updated_at, id) order from ``positions[name]`` (a
+    (updated_at, id) pair, or False once the source is exhausted). Deleted
+    ids come with the first page of a delta. Returns (changes, deleted,
+    positions of the next page, or None when this was the last).
+    """
+    page_size = page_size or getattr(settings, "SYNC_PAGE_SIZE", SYNC_PAGE_SIZE)
+    positions = dict(positions or {})
+    first_page = not positions
+    data = {}
+    for name, source in SOURCES.items():
+        position = positions.get(name)
+        if position is False:
+            data[name] = []
+            continue
+        qs = scoped(name, scope).filter(updated_at__lte=until)
+        if since is not None:
+            qs = qs.filter(updated_at__gt=since)
+        if position:
+            qs = qs.filter(_after(*position))
+        rows = list(source.serializer.values(qs, "updated_at", "pk").order_by("updated_at", "pk")[:page_size + 1])
+        page = rows[:page_size]
+        data[name] = source.serializer.serialize(page)
+        positions[name] = (page[-1]["updated_at"], page[-1]["pk"]) if len(rows) > page_size else False
+    deleted = _deleted(scope, since, until) if since is not None and first_page else None
+    more = any(position is not False for position in positions.values())
+    return data, deleted, positions if more else None
+
+
+def encode_cursor(state):
+    """``state`` holds since/until datetimes and per-source (updated_at, id) positions."""
+    def plain(value):
+        return value.isoformat() if hasattr(value, "isoformat") else value
+    payload = {
+        "since": plain(state["since"]),
+        "until": plain(state["until"]),
+        "scope": state["scope"],
+        "positions": {name: [plain(p[0]), p[1]] if p else p for name, p in state["positions"].items()},
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(token):
+    """The state from encode_cursor, or None if ``token`` is not one."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        until = parse_datetime(payload["until"])
+        since = parse_datetime(payload["since"]) if payload["since"] else None
+        positions = {
+            name: (parse_datetime(p[0]), int(p[1])) if p else False
+            for name, p in payload["positions"].items() if name in SOURCES
+        }
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError):
+        return None
+    if until is None or any(p and p[0] is None for p in positions.values()):
+        return None
+    return {"since": since, "until": until, "scope": payload.get("scope"), "positions": positions}
+
+
+def delta_start(since):
+    """Where a delta from the client's watermark ``since`` starts reading."""
+    return since - SYNC_OVERLAP
@@ -1,3 +1,1438 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from fastapi.testclient import TestClient
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from reporting import analytics, database as reporting_db, executor as report_executor, jobs as report_jobs
+from reporting.auth import InvalidToken, TokenVerifier, issue_access_token, verifier
+from reporting.main import app as report_app
+from reporting.report import _csv_lines, _ndjson_lines, router as report_router
+from reporting.executor import stream_from_db
+
+from . import urls as core_urls
+from .views import SIDELOADS
+from .caching import report_cache
+from .archive import archive_milk
+from .enrollments import progress_for, reconcile_enrollments
+from .exports import WRITERS, requeue_stale_exports, run_export
+from .imports import ImportFileError, import_csv
+from .models import (
+    User, Farm, Cow, MilkProduction, Activity, Enrollment, DailyMilkRollup, ArchivedMilkProduction, ExportJob,
+    ReportJob,
+)
+from .rollups import rebuild_daily_rollups
+from .serializers import (
+    MilkProductionSerializer, ActivitySerializer, EnrollmentSerializer,
+    FAST_LIST_SERIALIZERS,
+)
+
+
+def seed_farms(n_farms=2, cows_per_farm=3, days=5):
+    """Small but complete dataset: one agent per farm, one enrolled farmer per farm."""
+    admin = User.objects.create(username="admin", role="admin")
+    agents, farmers = [], []
+    start = date(2024, 1, 1)
+    for i in range(n_farms):
+        agent = User.objects.create(username=f"agent{i}", role="agent")
+        farmer = User.objects.create(username=f"farmer{i}", role="farmer")
+        farm = Farm.objects.create(name=f"Farm {i}", location="somewhere", agent=agent)
+        Enrollment.objects.create(user=farmer, farm=farm, total_yield=1.5 * i)
+        for c in range(cows_per_farm):
+            cow = Cow.objects.create(tag_number=f"T{i}-{c}", breed="Sahiwal",
+                                     birth_date=date(2020, 1, 1), farm=farm, farmer=farmer)
+            for d in range(days):
+                MilkProduction.objects.create(cow=cow, date=start + timedelta(days=d),
+                                              quantity=10 + c + d * 0.25, recorded_by=farmer)
+            Activity.objects.create(cow=cow, activity_type="vaccination", date=start,
+                                    category="health", recorded_by=farmer)
+            Activity.objects.create(cow=cow, activity_type="note", description=None,
+                                    date=None, category=None, recorded_by=farmer)
+        agents.append(agent)
+        farmers.append(farmer)
+    return admin, agents, farmers
+
+
+class FastListSerializerParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms()
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def assert_parity(self, serializer_class, qs):
+        fast = FAST_LIST_SERIALIZERS[serializer_class]
+        expected = serializer_class(list(qs), many=True).data
+        actual = fast.serialize(fast.values(qs))
+        self.assertTrue(expected)
+        self.assertEqual(self.render(actual), self.render(expected))
+
+    def test_milk_production(self):
+        self.assert_parity(MilkProductionSerializer, MilkProduction.objects.order_by("id"))
+
+    def test_activity(self):
+        self.assert_parity(ActivitySerializer, Activity.objects.order_by("id"))
+
+    def test_enrollment(self):
+        self.assert_parity(EnrollmentSerializer, Enrollment.objects.order_by("id"))
+
+    def test_list_endpoints_match_model_serializers(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        cases = [
+            ("/api/milk/", MilkProductionSerializer, MilkProduction),
+            ("/api/activities/", ActivitySerializer, Activity),
+            ("/api/enrollments/", EnrollmentSerializer, Enrollment),
+        ]
+        for url, serializer_class, model in cases:
+            for query in ("?page_size=100", "?cursor=&page_size=100"):
+                with self.subTest(url=url, query=query):
+                    response = client.get(url + query)
+                    self.assertEqual(response.status_code, 200)
+                    results = response.json()["results"]
+                    self.assertEqual(len(results), model.objects.count())
+                    by_id = model.objects.in_bulk([r["id"] for r in results])
+                    objs = [by_id[r["id"]] for r in results]
+                    self.assertEqual(
+                        self.render(results),
+                        self.render(serializer_class(objs, many=True).data),
+                    )
+
+
+# list route -> the side-loads it declares
+LIST_INCLUDES = {
+    "farm-list-create": ("agent",),
+    "cow-list-create": ("farm", "farmer", "agent"),
+    "milkproduction-list-create": ("cow", "farm", "recorded_by"),
+    "activity-list-create": ("cow", "farm", "recorded_by"),
+    "enrollment-list-create": ("user", "farm"),
+}
+LIST_MODELS = {
+    "farm-list-create": Farm,
+    "cow-list-create": Cow,
+    "milkproduction-list-create": MilkProduction,
+    "activity-list-create": Activity,
+    "enrollment-list-create": Enrollment,
+}
+
+
+class SideloadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=2, days=2)
+        cls.users = {"admin": cls.admin, "agent": cls.agents[0], "farmer": cls.farmers[0]}
+
+    def get(self, role, name, **params):
+        client = APIClient()
+        client.force_authenticate(self.users[role])
+        response = client.get(reverse(f"core:{name}"), params)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.data
+
+    def test_every_declared_include_is_served(self):
+        for name, includes in LIST_INCLUDES.items():
+            for role in self.users:
+                for compact in ("0", "1"):
+                    with self.subTest(route=name, role=role, compact=compact):
+                        data = self.get(role, name, include=",".join(includes), compact=compact)
+                        self.assertTrue(data["results"])
+                        buckets = {SIDELOADS[include][0] for include in includes}
+                        self.assertEqual(set(data["included"]), buckets)
+
+    def test_included_objects_are_the_referenced_ones(self):
+        for name, includes in LIST_INCLUDES.items():
+            model = LIST_MODELS[name]
+            attnames = {f.attname for f in model._meta.concrete_fields}
+            for role in self.users:
+                with self.subTest(route=name, role=role):
+                    data = self.get(role, name, include=",".join(includes), page_size=100)
+                    rows = model.objects.filter(id__in=[row["id"] for row in data["results"]])
+                    expected = {}
+                    for include in includes:
+                        bucket, attr = SIDELOADS[include]
+                        lookup = attr if attr in attnames else "farm__agent_id"
+                        expected.setdefault(bucket, set()).update(rows.values_list(lookup, flat=True))
+                    included = {bucket: {int(pk) for pk in objs} for bucket, objs in data["included"].items()}
+                    self.assertEqual(included, expected)
+                    for pk, obj in data["included"].get("users", {}).items():
+                        self.assertEqual(obj["id"], int(pk))
+                        self.assertNotIn("password", obj)
+                    for pk, obj in data["included"].get("farms", {}).items():
+                        self.assertEqual(obj["name"], Farm.objects.get(pk=pk).name)
+
+    def test_compact_lists_keep_foreign_keys_as_ids(self):
+        for name, fields in (("farm-list-create", ("agent",)), ("cow-list-create", ("farm", "farmer"))):
+            with self.subTest(route=name):
+                nested = self.get("admin", name)["results"][0]
+                compact = self.get("admin", name, compact="1")["results"]
+                by_id = {row["id"]: row for row in compact}
+                for field in fields:
+                    self.assertIsInstance(nested[field], dict)
+                    self.assertEqual(by_id[nested["id"]][field], nested[field]["id"])
+                    self.assertTrue(all(isinstance(row[field], int) for row in compact))
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=3, days=3)
+        # rows written in the same instant only differ in the trailing keys
+        now = timezone.now()
+        for model in (Cow, MilkProduction, Activity):
+            model.objects.update(created_at=now)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def test_next_links_cover_every_row_once(self):
+        for url, model in (("/api/cows/", Cow), ("/api/milk/", MilkProduction), ("/api/activities/", Activity)):
+            with self.subTest(url=url):
+                ids, next_url = [], f"{url}?cursor=&page_size=4"
+                while next_url:
+                    response = self.client.get(next_url)
+                    self.assertEqual(response.status_code, 200, response.content[:500])
+                    ids += [row["id"] for row in response.data["results"]]
+                    next_url = response.data["next"]
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(set(ids), set(model.objects.values_list("id", flat=True)))
+
+    def test_malformed_cursors_are_not_found(self):
+        cases = [
+            ("/api/cows/", "not base64 json"),
+            ("/api/cows/", self.cursor({"a": 1})),
+            ("/api/cows/", self.cursor([1])),
+            ("/api/cows/", self.cursor(["garbage", "x"])),
+            ("/api/cows/", self.cursor([{"a": 1}, 1])),
+            ("/api/cows/", self.cursor([1, "zz"])),
+            ("/api/cows/", self.cursor(["2024-01-01T00:00:00+00:00", None])),
+            ("/api/milk/", self.cursor(["x", "y", "z"])),
+            ("/api/milk/", self.cursor(["2024-13-45", "2024-01-01T00:00:00+00:00", 1])),
+        ]
+        for url, token in cases:
+            with self.subTest(url=url, token=token):
+                self.assertEqual(self.client.get(url, {"cursor": token}).status_code, 404)
+
+
+class TempMediaMixin:
+    """Point MEDIA_ROOT at a scratch directory for the test class."""
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp(prefix="farmhub-media-")
+        cls.addClassCleanup(shutil.rmtree, media_root, True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+
+# (method, route name) -> {role: max queries}. Budgets must not grow with the
+# number of rows; the seeded dataset is big enough for an N+1 to exceed them.
+RESPONSE_TIME_BUDGET = 1.0  # seconds, per request
+
+QUERY_BUDGETS = {
+    ("GET", "register"): {"anonymous": 0},
+    ("POST", "register"): {"anonymous": 3},
+    ("GET", "user-list"): {"admin": 2, "agent": 3, "farmer": 2},
+    ("POST", "farmer-create"): {"admin": 9, "agent": 10},
+    ("POST", "agent-create"): {"admin": 3},
+    ("GET", "farm-list-create"): {"admin": 2, "agent": 3, "farmer": 3},
+    ("POST", "farm-list-create"): {"admin": 3, "agent": 2},
+    ("GET", "farm-detail"): {"admin": 1, "agent": 2, "farmer": 2},
+    ("PUT", "farm-detail"): {"admin": 3, "agent": 4},
+    ("DELETE", "farm-detail"): {"admin": 23, "agent": 24},
+    ("GET", "cow-list-create"): {"admin": 2, "agent": 3, "farmer": 2},
+    ("POST", "cow-list-create"): {"admin": 6, "agent": 7, "farmer": 5},
+    ("GET", "cow-detail"): {"admin": 1, "agent": 2, "farmer": 1},
+    ("PUT", "cow-detail"): {"admin": 9, "agent": 10, "farmer": 9},
+    ("DELETE", "cow-detail"): {"admin": 15, "agent": 16, "farmer": 15},
+    ("GET", "milkproduction-list-create"): {"admin": 2, "agent": 3, "farmer": 2},
+    ("POST", "milkproduction-list-create"): {"admin": 9, "farmer": 9},
+    ("POST", "milkproduction-bulk-create"): {"admin": 14, "farmer": 14},
+    ("GET", "milkproduction-detail"): {"admin": 1, "agent": 2, "farmer": 1},
+    ("PUT", "milkproduction-detail"): {"admin": 8, "farmer": 8},
+    ("DELETE", "milkproduction-detail"): {"admin": 8, "farmer": 8},
+    ("GET", "activity-list-create"): {"admin": 2, "agent": 3, "farmer": 2},
+    ("POST", "activity-list-create"): {"admin": 2, "farmer": 2},
+    ("POST", "activity-bulk-create"): {"admin": 4, "farmer": 4},
+    ("GET", "activity-detail"): {"admin": 1, "agent": 2, "farmer": 1},
+    ("PUT", "activity-detail"): {"admin": 3, "farmer": 3},
+    ("DELETE", "activity-detail"): {"admin": 3, "farmer": 3},
+    ("GET", "enrollment-list-create"): {"admin": 2, "agent": 3, "farmer": 2},
+    ("POST", "enrollment-list-create"): {"admin": 5, "agent": 6},
+    ("GET", "enrollment-detail"): {"admin": 1, "agent": 2, "farmer": 1},
+    ("PUT", "enrollment-detail"): {"admin": 4, "agent": 5},
+    ("DELETE", "enrollment-detail"): {"admin": 3, "agent": 3},
+    ("POST", "import-upload"): {"admin": 14, "agent": 15},
+    ("GET", "sync"): {"admin": 5, "agent": 6, "farmer": 6},
+    ("GET", "export-list-create"): {"admin": 2, "agent": 2, "farmer": 2},
+    ("POST", "export-list-create"): {"admin": 1, "agent": 1, "farmer": 1},
+    ("GET", "export-detail"): {"admin": 1, "farmer": 1},
+    ("GET", "export-download"): {"admin": 1, "farmer": 1},
+}
+
+# report route (as in reporting.report.router) -> {role: max queries}, measured
+# through the app with a token already verified, as for any repeat caller
+REPORT_QUERY_BUDGETS = {
+    "/reports/farm-summary": {"admin": 4, "agent": 4, "farmer": 4},
+    "/reports/cache-stats": {"admin": 0, "agent": 0, "farmer": 0},
+    "/reports/milk-production": {"admin": 1, "agent": 1, "farmer": 1},
+    "/reports/milk-production/grouped": {"admin": 1, "agent": 1, "farmer": 1},
+    "/reports/recent-activities": {"admin": 1, "agent": 1, "farmer": 1},
+    "/reports/analytics/cows/{cow_id}": {"admin": 1, "agent": 1, "farmer": 1},
+    "/reports/analytics/farms/{farm_id}": {"admin": 1, "agent": 1, "farmer": 1},
+    "/reports/jobs": {"admin": 5, "agent": 5, "farmer": 5},
+    "/reports/jobs/{job_id}": {"admin": 2, "agent": 2, "farmer": 2},
+    "/reports/jobs/{job_id}/result": {"admin": 1, "agent": 1, "farmer": 1},
+}
+REPORT_QUERY_PARAMS = {
+    "/reports/milk-production/grouped": {"group_by": "farm"},
+    "/reports/recent-activities": {"limit": 50},
+}
+
+class QueryBudgetMixin:
+    def assert_within_budget(self, label, budget, fn):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - start
+        queries = ctx.captured_queries
+        if len(queries) > budget:
+            sql = "\n".join(f"  {i}. {q['sql']}" for i, q in enumerate(queries, 1))
+            self.fail(f"{label}: {len(queries)} queries, budget is {budget}:\n{sql}")
+        self.assertLess(elapsed, RESPONSE_TIME_BUDGET, f"{label} took {elapsed:.3f}s")
+        return result
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class ApiQueryBudgetTests(TempMediaMixin, QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=3, cows_per_farm=8, days=15)
+        cls.users = {"admin": cls.admin, "agent": cls.agents[0], "farmer": cls.farmers[0], "anonymous": None}
+        farm = Farm.objects.get(agent=cls.agents[0])
+        cow = Cow.objects.filter(farm=farm).first()
+        cls.milk = MilkProduction.objects.filter(cow=cow).first()
+        cls.detail_kwargs = {
+            "farm-detail": {"pk": farm.pk},
+            "cow-detail": {"pk": cow.pk},
+            "milkproduction-detail": {"pk": cls.milk.pk},
+            "activity-detail": {"pk": Activity.objects.filter(cow=cow).first().pk},
+            "enrollment-detail": {"pk": Enrollment.objects.get(farm=farm).pk},
+            "import-upload": {"kind": "milk"},
+        }
+        cls.cow = cow
+        export = run_export(ExportJob.objects.create(requested_by=cls.farmers[0], dataset="milk").pk)
+        cls.detail_kwargs["export-detail"] = cls.detail_kwargs["export-download"] = {"pk": export.pk}
+        # farms and cows are deleted with all their rows: a cascade must not cost a query per row
+        cls.spare_farmer = User.objects.create(username="spare-farmer", role="farmer")
+        spare_farm = Farm.objects.create(name="Spare farm", location="somewhere", agent=cls.agents[0])
+        cls.delete_kwargs = {
+            **cls.detail_kwargs,
+            "enrollment-detail": {"pk": Enrollment.objects.create(user=cls.spare_farmer, farm=spare_farm,
+                                                                  is_active=False).pk},
+        }
+
+    def payload(self, method, name, role):
+        farm_pk = self.detail_kwargs["farm-detail"]["pk"]
+        if method == "PUT":
+            if name == "farm-detail":
+                return {"name": "Renamed farm", "location": "elsewhere"}
+            if name == "cow-detail":
+                return {"tag_number": self.cow.tag_number, "breed": "Holstein", "birth_date": "2020-01-01"}
+            if name == "milkproduction-detail":
+                return {"cow": self.cow.pk, "date": self.milk.date.isoformat(), "quantity": 12.5}
+            if name == "activity-detail":
+                return {"cow": self.cow.pk, "activity_type": "checkup"}
+            if name == "enrollment-detail":
+                return {"user": self.farmers[0].pk, "farm": farm_pk, "is_active": True}
+        if method != "POST":
+            return None
+        if name == "register":
+            return {"username": "budget-signup", "password": "long-enough", "password2": "long-enough"}
+        if name == "farmer-create":
+            return {"username": f"budget-farmer-{role}", "password": "pw", "role": "farmer", "farm": farm_pk}
+        if name == "agent-create":
+            return {"username": "budget-agent", "password": "pw", "role": "agent"}
+        if name == "farm-list-create":
+            return {"name": "Budget farm", "location": "somewhere", "agent": self.agents[0].pk}
+        if name == "cow-list-create":
+            return {"tag_number": "budget-cow", "breed": "Sahiwal", "birth_date": "2021-01-01",
+                    "farmer": self.farmers[0].pk}
+        if name == "milkproduction-list-create":
+            return {"cow": self.cow.pk, "date": "2031-01-01", "quantity": 7.5}
+        if name == "activity-list-create":
+            return {"cow": self.cow.pk, "activity_type": "deworming"}
+        if name == "enrollment-list-create":
+            return {"user": self.spare_farmer.pk, "farm": farm_pk}
+        if name == "milkproduction-bulk-create":
+            return [{"cow": self.cow.pk, "date": f"2030-01-{d:02d}", "quantity": 9.5} for d in range(1, 26)]
+        if name == "activity-bulk-create":
+            cows = list(Cow.objects.filter(farmer=self.farmers[0]).values_list("id", flat=True))
+            return {"activity_type": "vaccination", "cows": cows}
+        if name == "export-list-create":
+            return {"dataset": "milk", "format": "parquet", "filters": {"start_date": "2024-01-01"}}
+        if name == "import-upload":
+            rows = "".join(f"{self.cow.tag_number},2032-{m:02d}-{d:02d},8.5\n" for m in (1, 2) for d in range(1, 29))
+            return {"file": SimpleUploadedFile("milk.csv", f"tag_number,date,quantity\n{rows}".encode())}
+        return None
+
+    def test_every_route_has_a_budget(self):
+        routes = set()
+        for pattern in core_urls.urlpatterns:
+            view = pattern.callback.cls
+            routes |= {(m.upper(), pattern.name) for m in view.http_method_names
+                       if m not in ("head", "options") and hasattr(view, m)}
+        self.assertEqual(routes, set(QUERY_BUDGETS))
+
+    def test_routes_stay_within_query_budget(self):
+        for (method, name), budgets in QUERY_BUDGETS.items():
+            for role, budget in budgets.items():
+                with self.subTest(route=name, method=method, role=role), transaction.atomic():
+                    client = APIClient()
+                    if self.users[role] is not None:
+                        client.force_authenticate(self.users[role])
+                    kwargs = (self.delete_kwargs if method == "DELETE" else self.detail_kwargs).get(name)
+                    url = reverse(f"core:{name}", kwargs=kwargs)
+                    call = getattr(client, method.lower())
+                    payload = self.payload(method, name, role)
+                    fmt = "multipart" if name == "import-upload" else "json"
+                    response = self.assert_within_budget(
+                        f"{method} {url} as {role}", budget,
+                        lambda: call(url, payload, format=fmt) if payload is not None else call(url),
+                    )
+                    self.assertLess(response.status_code, 300,
+                                    b"" if response.streaming else response.content[:500])
+                    # every call starts from the seeded rows
+                    transaction.set_rollback(True)
+
+
+@override_settings(REPORTING_JOB_BACKEND="db")
+class ReportQueryBudgetTests(TempMediaMixin, QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        admin, agents, farmers = seed_farms(n_farms=3, cows_per_farm=8, days=15)
+        cls.users = {"admin": admin, "agent": agents[0], "farmer": farmers[0]}
+        cls.cow = Cow.objects.filter(farmer=farmers[0]).first()
+
+    def setUp(self):
+        report_cache().clear()
+        # the app's database pool runs on this test's connection, so it sees the
+        # test transaction and its queries are captured
+        conn = connections[DEFAULT_DB_ALIAS]
+        conn.inc_thread_sharing()
+        self.addCleanup(conn.dec_thread_sharing)
+        pool = ThreadPoolExecutor(max_workers=1, initializer=connections.__setitem__, initargs=(DEFAULT_DB_ALIAS, conn))
+        self.addCleanup(pool.shutdown)
+        patcher = mock.patch.object(report_executor, "_executor", pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(verifier.clear)
+        self.app = TestClient(report_app)
+        self.tokens, self.jobs = {}, {}
+        for role, user in self.users.items():
+            self.tokens[role] = str(RefreshToken.for_user(user).access_token)
+            job, _ = report_jobs.submit_job("milk-production", {}, verifier.verify(self.tokens[role]))
+            report_jobs.run_job(job.pk)
+            self.jobs[role] = job.pk
+
+    def request(self, role, path):
+        url = path.format(cow_id=self.cow.id, farm_id=self.cow.farm_id, job_id=self.jobs[role])
+        headers = {"Authorization": f"Bearer {self.tokens[role]}"}
+        if path == "/reports/jobs":
+            return self.app.post(url, json={"report": "milk-production/grouped", "group_by": "cow"}, headers=headers)
+        return self.app.get(url, params=REPORT_QUERY_PARAMS.get(path), headers=headers)
+
+    def test_every_report_route_has_a_budget(self):
+        self.assertEqual(set(REPORT_QUERY_BUDGETS), {r.path for r in report_router.routes})
+
+    def test_reports_stay_within_query_budget(self):
+        for path, budgets in REPORT_QUERY_BUDGETS.items():
+            for role, budget in budgets.items():
+                with self.subTest(report=path, role=role):
+                    report_cache().clear()
+                    response = self.assert_within_budget(
+                        f"{path} as {role}", budget, lambda: self.request(role, path))
+                    self.assertLess(response.status_code, 300, response.text[:500])
+
+    def test_job_results_follow_accept_encoding(self):
+        with gzip.open(report_jobs.result_path(ReportJob.objects.get(pk=self.jobs["admin"])), "rt") as f:
+            expected = json.load(f)
+        for accept, encoding in (("gzip, deflate", "gzip"), ("identity", None), ("gzip;q=0", None)):
+            with self.subTest(accept=accept):
+                response = self.app.get(f"/reports/jobs/{self.jobs['admin']}/result",
+                                        headers={"Authorization": f"Bearer {self.tokens['admin']}",
+                                                 "Accept-Encoding": accept})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.headers.get("content-encoding"), encoding)
+                self.assertEqual(response.json(), expected)
+
+    def test_grouped_report_budget_for_every_grouping(self):
+        for group_by in reporting_db.MILK_GROUPINGS:
+            with self.subTest(group_by=group_by):
+                self.assert_within_budget(
+                    f"grouped by {group_by}", 1,
+                    lambda: reporting_db.get_milk_production_grouped(group_by),
+                )
+
+    def test_cached_farm_summary_costs_no_queries(self):
+        reporting_db.get_farm_summary()
+        self.assert_within_budget("cached farm summary", 0, reporting_db.get_farm_summary)
+
+
+class IndexUsageTests(TestCase):
+    """
+    Runs the hot list and report queries, EXPLAINs the SQL they actually
+    issued and checks the planner picks the composite index meant for them.
+    """
+
+    VIEW_INDEXES = [
+        ("milkproduction-list-create", "farmer", "milk_recorder_date_idx"),
+        ("milkproduction-list-create", "agent", "milk_farm_date_idx"),
+        ("milkproduction-list-create", "admin", "milk_date_created_idx"),
+        ("activity-list-create", "farmer", "activity_recorder_date_idx"),
+        ("activity-list-create", "agent", "activity_farm_date_idx"),
+        ("cow-list-create", "farmer", "cow_farmer_active_idx"),
+        ("cow-list-create", "agent", "cow_farm_active_idx"),
+        ("farm-list-create", "agent", "farm_agent_active_idx"),
+        ("farm-list-create", "farmer", "enroll_user_enrolled_idx"),
+        ("enrollment-list-create", "agent", "enroll_farm_active_idx"),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=3, cows_per_farm=4, days=10)
+        cls.users = {"admin": cls.admin, "agent": cls.agents[0], "farmer": cls.farmers[0]}
+        cls.farm = Farm.objects.get(agent=cls.agents[0])
+
+    def setUp(self):
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest(f"no plan assertions for {connection.vendor}")
+        report_cache().clear()
+
+    def plans(self, fn):
+        with CaptureQueriesContext(connection) as ctx:
+            fn()
+        prefix = connection.ops.explain_query_prefix()
+        plans = []
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # tiny test tables would otherwise always be seq-scanned
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            for q in ctx.captured_queries:
+                if q["sql"].lstrip().upper().startswith("SELECT"):
+                    cursor.execute(f"{prefix} {q['sql']}")
+                    plans.append(f"{q['sql']}\n    " + "\n    ".join(str(r) for r in cursor.fetchall()))
+        return plans
+
+    def assert_uses_index(self, label, index, fn):
+        plans = self.plans(fn)
+        if not any(index in p for p in plans):
+            self.fail(f"{label} does not use {index}:\n" + "\n".join(plans))
+
+    def test_list_views_use_composite_indexes(self):
+        for name, role, index in self.VIEW_INDEXES:
+            for params in ({}, {"cursor": ""}):
+                with self.subTest(route=name, role=role, params=params):
+                    client = APIClient()
+                    client.force_authenticate(self.users[role])
+                    url = reverse(f"core:{name}")
+                    self.assert_uses_index(f"GET {url} {params} as {role}", index,
+                                           lambda: client.get(url, params))
+
+    def test_reports_use_composite_indexes(self):
+        start = date(2024, 1, 3)
+        calls = [
+            ("milk report by farm", "milk_farm_date_idx",
+             lambda: reporting_db.get_milk_production_report(farm_id=self.farm.id, start_date=start)),
+            ("grouped report by farm", "rollup_farm_date_idx",
+             lambda: reporting_db.get_milk_production_grouped("day", farm_id=self.farm.id, start_date=start)),
+            ("recent activities by farm", "activity_farm_date_idx",
+             lambda: reporting_db.get_recent_activities(limit=5, farm_id=self.farm.id)),
+        ]
+        for label, index, fn in calls:
+            with self.subTest(report=label):
+                self.assert_uses_index(label, index, fn)
+
+
+class DenormalizedFarmTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=2, days=3)
+        cls.cow = Cow.objects.filter(farmer=cls.farmers[0]).first()
+        cls.other_farm = Farm.objects.get(agent=cls.agents[1])
+
+    def farms_of(self, model):
+        return set(model.objects.filter(cow=self.cow).values_list("farm_id", flat=True))
+
+    def test_writes_copy_the_cows_farm(self):
+        client = APIClient()
+        client.force_authenticate(self.farmers[0])
+        client.post(reverse("core:milkproduction-list-create"),
+                    {"cow": self.cow.pk, "date": "2030-01-01", "quantity": 5}, format="json")
+        client.post(reverse("core:milkproduction-bulk-create"),
+                    [{"cow": self.cow.pk, "date": "2030-01-02", "quantity": 6}], format="json")
+        client.post(reverse("core:activity-bulk-create"),
+                    {"activity_type": "deworming", "cows": [self.cow.pk]}, format="json")
+        self.assertEqual(self.farms_of(MilkProduction), {self.cow.farm_id})
+        self.assertEqual(self.farms_of(Activity), {self.cow.farm_id})
+
+    def test_records_follow_a_moved_cow(self):
+        self.cow.farm = self.other_farm
+        self.cow.save()
+        self.assertEqual(self.farms_of(MilkProduction), {self.other_farm.id})
+        self.assertEqual(self.farms_of(Activity), {self.other_farm.id})
+        self.assertEqual(set(DailyMilkRollup.objects.filter(cow=self.cow).values_list("farm_id", flat=True)),
+                         {self.other_farm.id})
+        report = reporting_db.get_milk_production_report(farm_id=self.other_farm.id)
+        self.assertIn(self.cow.id, {row["cow_id"] for row in report["items"]})
+
+
+class MilkArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=2, days=6)
+        cls.cutoff = date(2024, 1, 4)  # seeded days run 2024-01-01 .. 2024-01-06
+
+    def setUp(self):
+        report_cache().clear()
+
+    def snapshot(self):
+        rollups = set(DailyMilkRollup.objects.values_list("cow_id", "date", "total_quantity", "record_count"))
+        return {
+            "report": reporting_db.get_milk_production_report(),
+            "by_farmer": reporting_db.get_milk_production_grouped("farmer"),
+            "by_day_for_farmer": reporting_db.get_milk_production_grouped("day", farmer_id=self.farmers[0].id),
+            "summary": reporting_db.get_farm_summary(),
+            "rollups": rollups,
+        }
+
+    def test_reports_read_through_the_archive(self):
+        before = self.snapshot()
+        moved = archive_milk(self.cutoff)
+        report_cache().clear()
+        self.assertEqual(moved, 2 * 2 * 3)
+        self.assertFalse(MilkProduction.objects.filter(date__lt=self.cutoff).exists())
+        self.assertEqual(ArchivedMilkProduction.objects.count(), moved)
+        self.assertEqual(self.snapshot(), before)
+        rebuild_daily_rollups()
+        self.assertEqual(self.snapshot()["rollups"], before["rollups"])
+
+    def test_archived_days_reject_new_readings(self):
+        archive_milk(self.cutoff)
+        cow = Cow.objects.filter(farmer=self.farmers[0]).first()
+        client = APIClient()
+        client.force_authenticate(self.farmers[0])
+        single = client.post(reverse("core:milkproduction-list-create"),
+                             {"cow": cow.pk, "date": "2024-01-02", "quantity": 5}, format="json")
+        bulk = client.post(reverse("core:milkproduction-bulk-create"),
+                           [{"cow": cow.pk, "date": "2024-01-02", "quantity": 5},
+                            {"cow": cow.pk, "date": "2024-01-05", "quantity": 5}], format="json")
+        self.assertEqual(single.status_code, 400)
+        self.assertEqual(bulk.status_code, 201)
+        self.assertEqual(bulk.data["saved"], 1)
+        self.assertEqual([e["index"] for e in bulk.data["errors"]], [0])
+
+
+@override_settings(ENROLLMENT_YIELD_TARGET=100)
+class EnrollmentYieldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=2, days=3)
+        cls.cow = Cow.objects.filter(farmer=cls.farmers[0]).first()
+
+    def enrollment(self, farmer=None, farm=None):
+        farmer = farmer or self.farmers[0]
+        return Enrollment.objects.get(user=farmer, farm=farm or self.cow.farm)
+
+    def assert_matches_reconcile(self):
+        before = set(Enrollment.objects.values_list("id", "total_yield", "progress", "is_certificate_ready"))
+        self.assertEqual(reconcile_enrollments(), 0)
+        self.assertEqual(set(Enrollment.objects.values_list("id", "total_yield", "progress", "is_certificate_ready")),
+                         before)
+
+    def test_single_writes_adjust_the_total(self):
+        start = self.enrollment().total_yield
+        record = MilkProduction.objects.create(cow=self.cow, date=date(2030, 1, 1), quantity=40,
+                                               recorded_by=self.farmers[0])
+        record.quantity = 60
+        record.save()
+        enrollment = self.enrollment()
+        self.assertAlmostEqual(enrollment.total_yield, start + 60)
+        self.assertEqual(enrollment.progress, progress_for(start + 60))
+        self.assert_matches_reconcile()
+        record.delete()
+        self.assertAlmostEqual(self.enrollment().total_yield, start)
+        self.assert_matches_reconcile()
+
+    def test_a_deleted_cow_takes_its_milk_off_the_total(self):
+        start = self.enrollment().total_yield
+        milk = sum(MilkProduction.objects.filter(cow=self.cow).values_list("quantity", flat=True))
+        self.cow.delete()
+        self.assertAlmostEqual(self.enrollment().total_yield, start - milk)
+        self.assert_matches_reconcile()
+
+    def test_bulk_writes_reach_the_certificate(self):
+        client = APIClient()
+        client.force_authenticate(self.farmers[0])
+        client.post(reverse("core:milkproduction-bulk-create"),
+                    [{"cow": self.cow.pk, "date": f"2030-01-0{d}", "quantity": 30} for d in range(1, 5)],
+                    format="json")
+        enrollment = self.enrollment()
+        self.assertEqual(enrollment.progress, 100)
+        self.assertTrue(enrollment.is_certificate_ready)
+        self.assert_matches_reconcile()
+
+    def test_moved_cow_takes_its_milk_along(self):
+        other_farm = Farm.objects.get(agent=self.agents[1])
+        Enrollment.objects.create(user=self.farmers[0], farm=other_farm)
+        old_farm = self.cow.farm
+        self.cow.farm = other_farm
+        self.cow.save()
+        self.assertGreater(self.enrollment(farm=other_farm).total_yield, 0)
+        self.assert_matches_reconcile()
+        self.cow.farm = old_farm
+        self.cow.save()
+        self.assertEqual(self.enrollment(farm=other_farm).total_yield, 0)
+        self.assert_matches_reconcile()
+
+    def test_updates_through_the_api(self):
+        enrollment = self.enrollment()
+        other_farm = Farm.objects.get(agent=self.agents[1])
+        url = reverse("core:enrollment-detail", kwargs={"pk": enrollment.pk})
+        client = APIClient()
+        client.force_authenticate(self.agents[0])
+        response = client.put(url, {"user": self.farmers[1].pk, "farm": other_farm.pk, "is_active": False},
+                              format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.data["user"], response.data["farm"], response.data["is_active"]),
+                         (self.farmers[0].pk, self.cow.farm_id, False))
+        client.force_authenticate(self.admin)
+        response = client.put(url, {"user": self.farmers[0].pk, "farm": self.cow.farm_id, "is_active": True},
+                              format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(Enrollment.objects.get(pk=enrollment.pk).is_active)
+
+    def test_reconcile_repairs_drift(self):
+        Enrollment.objects.update(total_yield=0, progress=0, is_certificate_ready=False)
+        self.assertEqual(reconcile_enrollments(), Enrollment.objects.count())
+        self.assert_matches_reconcile()
+
+
+class MilkAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=2, days=1)
+        cls.cow = Cow.objects.filter(farmer=cls.farmers[0]).first()
+        start = date(2024, 1, 2)
+        cls.quantities = [10, 12, 10, 11, 12, 10, 11, 2, 10, 11]
+        for d, quantity in enumerate(cls.quantities):
+            MilkProduction.objects.create(cow=cls.cow, date=start + timedelta(days=d),
+                                          quantity=quantity, recorded_by=cls.farmers[0])
+
+    def setUp(self):
+        report_cache().clear()
+
+    def test_rolling_stats_and_anomalies(self):
+        result = analytics.get_cow_analytics(self.cow.id, window=7)
+        series = result["series"]
+        quantities = [10.0] + [float(q) for q in self.quantities]  # seed_farms adds day one
+        self.assertEqual([row["quantity"] for row in series], quantities)
+        for i, row in enumerate(series):
+            window = quantities[max(0, i - 6):i + 1]
+            self.assertAlmostEqual(row["rolling_mean"], round(sum(window) / len(window), 3))
+        self.assertIsNone(series[0]["change"])
+        self.assertEqual(series[8]["change"], -9.0)
+        self.assertEqual([row["date"] for row in series if row["anomaly"]], ["2024-01-09"])
+        self.assertEqual(result["anomalies"], 1)
+        self.assertEqual(result["lactation"]["weekly"][0]["week"], 1)
+
+    def test_results_are_cached_until_milk_changes(self):
+        first = analytics.get_cow_analytics(self.cow.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(analytics.get_cow_analytics(self.cow.id), first)
+        MilkProduction.objects.create(cow=self.cow, date=date(2024, 1, 12), quantity=9,
+                                      recorded_by=self.farmers[0])
+        self.assertEqual(analytics.get_cow_analytics(self.cow.id)["days"], first["days"] + 1)
+
+    def test_farm_analytics_are_scoped(self):
+        farm_id = self.cow.farm_id
+        outsider = TokenVerifier().verify(str(RefreshToken.for_user(self.farmers[1]).access_token))
+        self.assertEqual(analytics.get_farm_analytics(farm_id, principal=outsider)["cows"], [])
+        cows = analytics.get_farm_analytics(farm_id)["cows"]
+        self.assertEqual({c["cow_id"] for c in cows},
+                         set(Cow.objects.filter(farm_id=farm_id).values_list("id", flat=True)))
+        self.assertEqual(next(c for c in cows if c["cow_id"] == self.cow.id)["anomalies"], 1)
+
+
+class CsvImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=1, days=1)
+        cls.farm = Farm.objects.get(agent=cls.agents[0])
+
+    def run_import(self, kind, text, user=None, chunk_size=2):
+        return import_csv(kind, io.StringIO(text), user=user, chunk_size=chunk_size)
+
+    def test_cows_then_milk_and_activities(self):
+        cows = self.run_import("cows", (
+            "tag_number,breed,birth_date,farmer,farm\n"
+            "N-1,Sahiwal,2021-02-03,farmer0,\n"
+            "N-2,Jersey,2021-02-04,farmer0,Farm 1\n"
+            "N-1,Sahiwal,2021-02-03,farmer0,\n"
+            "N-3,Jersey,not-a-date,nobody,\n"
+        ))
+        self.assertEqual((cows.rows, cows.saved, cows.failed), (4, 2, 2))
+        self.assertEqual([e["line"] for e in cows.errors], [4, 5])
+        self.assertEqual(set(cows.errors[1]["errors"]), {"birth_date", "farmer"})
+        self.assertEqual(Cow.objects.get(tag_number="N-1").farm_id, self.farm.id)
+        self.assertEqual(Cow.objects.get(tag_number="N-2").farm.name, "Farm 1")
+
+        milk = self.run_import("milk", (
+            "tag_number,date,quantity\n"
+            + "".join(f"N-1,2030-01-{d:02d},10\n" for d in range(1, 6))
+            + "N-9,2030-01-01,10\nN-1,2030-01-06,-1\n"
+        ))
+        self.assertEqual((milk.saved, milk.failed), (5, 2))
+        self.assertEqual(DailyMilkRollup.objects.filter(cow__tag_number="N-1").count(), 5)
+        self.assertTrue(MilkProduction.objects.filter(cow__tag_number="N-1", recorded_by=self.farmers[0]).exists())
+        self.assertEqual(reconcile_enrollments(), 0)
+
+        activities = self.run_import("activities", "tag_number,activity_type,date\nN-1,vaccination,2030-01-02\n")
+        self.assertEqual(activities.saved, 1)
+        self.assertEqual(Activity.objects.get(cow__tag_number="N-1").farm_id, self.farm.id)
+
+    def test_agents_only_reach_their_farms(self):
+        other_tag = Cow.objects.exclude(farm=self.farm).values_list("tag_number", flat=True).first()
+        own_tag = Cow.objects.filter(farm=self.farm).values_list("tag_number", flat=True).first()
+        stats = self.run_import("milk", f"tag_number,date,quantity\n{own_tag},2030-01-01,5\n{other_tag},2030-01-01,5\n",
+                                user=self.agents[0])
+        self.assertEqual((stats.saved, stats.failed), (1, 1))
+        cows = self.run_import("cows", "tag_number,breed,birth_date,farmer\nA-1,Sahiwal,2021-01-01,farmer1\n",
+                               user=self.agents[0])
+        self.assertEqual(cows.failed, 1)
+
+    def test_every_row_is_accounted_for(self):
+        stats = self.run_import("milk", "tag_number,date,quantity\nT0-0,2030-01-01,5\nT0-0,2030-01-01,7\n"
+                                        "NOPE,2030-01-01,5\n")
+        self.assertEqual((stats.rows, stats.saved, stats.failed, stats.replaced), (3, 1, 1, 1))
+        self.assertEqual(stats.rows, stats.saved + stats.failed + stats.replaced)
+        self.assertEqual(MilkProduction.objects.get(cow__tag_number="T0-0", date=date(2030, 1, 1)).quantity, 7)
+
+    def test_bad_files_are_rejected(self):
+        with self.assertRaises(ImportFileError):
+            self.run_import("milk", "tag_number,quantity\nT0-0,1\n")
+        with self.assertRaises(ImportFileError):
+            self.run_import("horses", "tag_number\n")
+
+    def test_upload_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.farmers[0])
+        upload = SimpleUploadedFile("milk.csv", b"tag_number,date,quantity\nT0-0,2030-01-01,5\n")
+        self.assertEqual(client.post("/api/imports/milk/", {"file": upload}).status_code, 403)
+        client.force_authenticate(self.admin)
+        upload.seek(0)
+        response = client.post("/api/imports/milk/", {"file": upload})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["saved"], 1)
+        self.assertIn("rows_per_second", response.data)
+
+
+class ExportTests(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=2, days=6)
+        archive_milk(date(2024, 1, 3))
+
+    def export(self, user, dataset, format="csv", **filters):
+        job = ExportJob.objects.create(requested_by=user, dataset=dataset, format=format, filters=filters)
+        return run_export(job.pk)
+
+    def read_csv(self, job):
+        with gzip.open(job.file.path, "rt", newline="") as f:
+            return list(csv.DictReader(f))
+
+    def test_csv_covers_hot_and_archived_milk_in_scope(self):
+        farmer = self.farmers[0]
+        job = self.export(farmer, "milk")
+        self.assertEqual(job.status, "done", job.error)
+        rows = self.read_csv(job)
+        expected = (set(MilkProduction.objects.filter(recorded_by=farmer).values_list("id", flat=True))
+                    | set(ArchivedMilkProduction.objects.filter(recorded_by=farmer).values_list("id", flat=True)))
+        self.assertEqual({int(r["id"]) for r in rows}, expected)
+        self.assertEqual(job.rows, len(expected))
+        dated = self.read_csv(self.export(farmer, "milk", start_date="2024-01-05"))
+        self.assertTrue(dated and all(r["date"] >= "2024-01-05" for r in dated))
+
+    def test_parquet_is_typed_and_scoped(self):
+        import pyarrow.parquet as pq
+        agent = self.agents[0]
+        job = self.export(agent, "cows", format="parquet")
+        self.assertEqual(job.status, "done", job.error)
+        table = pq.read_table(job.file.path)
+        self.assertEqual(set(table.column("id").to_pylist()),
+                         set(Cow.objects.filter(farm__agent=agent).values_list("id", flat=True)))
+        self.assertEqual(str(table.schema.field("birth_date").type), "date32[day]")
+        self.assertEqual(str(table.schema.field("is_active").type), "bool")
+
+    def test_jobs_through_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.farmers[0])
+        response = client.post("/api/exports/", {"dataset": "activities"}, format="json")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], "pending")
+        self.assertIsNone(response.data["download_url"])
+        self.assertEqual(client.post("/api/exports/", {"dataset": "cows", "filters": {"start_date": "2024-01-01"}},
+                                     format="json").status_code, 400)
+        job_id = response.data["id"]
+        self.assertEqual(client.get(f"/api/exports/{job_id}/download/").status_code, 409)
+
+        run_export(job_id)
+        self.assertEqual(run_export(job_id).status, "done")  # a finished job is not run again
+        detail = client.get(f"/api/exports/{job_id}/").data
+        download = client.get(detail["download_url"])
+        self.assertEqual(download.status_code, 200)
+        lines = gzip.decompress(b"".join(download.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines) - 1, Activity.objects.filter(recorded_by=self.farmers[0]).count())
+
+        client.force_authenticate(self.farmers[1])
+        self.assertEqual(client.get(f"/api/exports/{job_id}/").status_code, 404)
+
+    @override_settings(EXPORT_BACKEND="db", EXPORT_STALE_AFTER=60)
+    def test_workers_claim_queued_and_orphaned_jobs(self):
+        client = APIClient()
+        client.force_authenticate(self.farmers[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            queued = client.post("/api/exports/", {"dataset": "cows"}, format="json").data["id"]
+        self.assertEqual(ExportJob.objects.get(pk=queued).status, "pending")
+        orphaned = ExportJob.objects.create(requested_by=self.farmers[0], dataset="milk", status="running")
+        ExportJob.objects.filter(pk=orphaned.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+        busy = ExportJob.objects.create(requested_by=self.farmers[0], dataset="milk", status="running")
+        call_command("run_exports", once=True)
+        statuses = dict(ExportJob.objects.filter(pk__in=[queued, orphaned.pk, busy.pk]).values_list("pk", "status"))
+        self.assertEqual(statuses, {queued: "done", orphaned.pk: "done", busy.pk: "running"})
+
+
+    @override_settings(EXPORT_STALE_AFTER=60)
+    def test_long_exports_keep_their_claim(self):
+        job = ExportJob.objects.create(requested_by=self.admin, dataset="milk")
+
+        def write(path, dataset, rows):
+            # claimed long ago, and slower than EXPORT_STALE_AFTER since
+            ExportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=2))
+            written = sum(1 for _ in rows)
+            self.assertEqual(requeue_stale_exports(), 0)
+            open(path, "w").close()
+            return written
+
+        with mock.patch("core.exports.EXPORT_CHUNK_SIZE", 4), mock.patch.dict(WRITERS, {"csv": (write, "csv")}):
+            job = run_export(job.pk)
+        self.assertEqual((job.status, job.rows), ("done", 24))
+
+@override_settings(REPORTING_JOB_BACKEND="db")
+class ReportJobTests(TempMediaMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=2, days=3)
+
+    def setUp(self):
+        report_cache().clear()
+
+    def principal(self, user):
+        return TokenVerifier().verify(str(RefreshToken.for_user(user).access_token))
+
+    def result(self, job):
+        job.refresh_from_db()
+        self.assertEqual(job.status, "done", job.error)
+        with gzip.open(report_jobs.result_path(job), "rt") as f:
+            return json.load(f)
+
+    def test_identical_submits_share_a_job(self):
+        principal = self.principal(self.admin)
+        job, created = report_jobs.submit_job("milk-production", {"farm_id": None}, principal)
+        again, created_again = report_jobs.submit_job("milk-production", {}, principal)
+        self.assertEqual((created, created_again, again.pk), (True, False, job.pk))
+        other, created = report_jobs.submit_job("milk-production", {"start_date": date(2024, 1, 2)}, principal)
+        self.assertTrue(created)
+        self.assertNotEqual(other.pk, job.pk)
+        agent_job, created = report_jobs.submit_job("milk-production", {}, self.principal(self.agents[0]))
+        self.assertTrue(created)
+        self.assertIsNone(report_jobs.get_job(job.pk, self.principal(self.agents[0])))
+        self.assertEqual(report_jobs.get_job(agent_job.pk, self.principal(self.agents[0])), agent_job)
+
+    def test_results_match_the_synchronous_reports(self):
+        principal = self.principal(self.farmers[0])
+        job, _ = report_jobs.submit_job("milk-production", {}, principal)
+        grouped, _ = report_jobs.submit_job("milk-production/grouped", {"group_by": "cow"}, principal)
+        report_jobs.work(once=True)
+        self.assertEqual(self.result(job), reporting_db.get_milk_production_report(principal=principal))
+        self.assertEqual(self.result(grouped), reporting_db.get_milk_production_grouped("cow", principal=principal))
+
+    def test_a_write_retires_the_stored_result(self):
+        principal = self.principal(self.admin)
+        job, _ = report_jobs.submit_job("milk-production", {}, principal)
+        report_jobs.run_job(job.pk)
+        job.refresh_from_db()
+        self.assertFalse(report_jobs.job_status(job)["stale"])
+        self.assertEqual(report_jobs.submit_job("milk-production", {}, principal), (job, False))
+        cow = Cow.objects.first()
+        MilkProduction.objects.create(cow=cow, date=date(2024, 2, 1), quantity=7, recorded_by=cow.farmer)
+        self.assertTrue(report_jobs.job_status(job)["stale"])
+        fresh, created = report_jobs.submit_job("milk-production", {}, principal)
+        self.assertTrue(created)
+        report_jobs.run_job(fresh.pk)
+        self.assertEqual(self.result(fresh)["count"], self.result(job)["count"] + 1)
+
+    def test_writes_move_the_stored_version(self):
+        version = report_jobs.data_version()
+        report_cache().clear()  # the reporting process has a cache of its own
+        with self.assertNumQueries(1):
+            self.assertEqual(report_jobs.data_version(), version)
+        milk = MilkProduction.objects.first()
+        writes = [
+            lambda: MilkProduction.objects.filter(pk=milk.pk).first().save(),
+            lambda: MilkProduction.objects.filter(pk=milk.pk).delete(),
+            lambda: User.objects.get(pk=self.farmers[0].pk).save(),
+            lambda: import_csv("milk", io.StringIO("tag_number,date,quantity\nT0-0,2031-01-01,5\n")),
+        ]
+        for write in writes:
+            write()
+            self.assertGreater(report_jobs.data_version(), version)
+            version = report_jobs.data_version()
+
+    @override_settings(REPORTING_JOB_STALE_AFTER=60)
+    def test_jobs_stuck_running_are_run_again(self):
+        principal = self.principal(self.admin)
+        stuck, _ = report_jobs.submit_job("milk-production", {}, principal)
+        busy, _ = report_jobs.submit_job("milk-production/grouped", {"group_by": "cow"}, principal)
+        long_ago = timezone.now() - timedelta(minutes=5)
+        ReportJob.objects.filter(pk=stuck.pk).update(status="running", started_at=long_ago, updated_at=long_ago)
+        ReportJob.objects.filter(pk=busy.pk).update(status="running", started_at=long_ago, updated_at=timezone.now())
+        again, created = report_jobs.submit_job("milk-production", {}, principal)
+        self.assertEqual((again.pk, again.status, created), (stuck.pk, "pending", False))
+        ReportJob.objects.filter(pk=stuck.pk).update(status="running", started_at=long_ago, updated_at=long_ago)
+        report_jobs.work(once=True)
+        stuck.refresh_from_db()
+        busy.refresh_from_db()
+        self.assertEqual((stuck.status, busy.status), ("done", "running"))
+
+    @override_settings(REPORTING_JOB_STALE_AFTER=60)
+    def test_long_jobs_keep_their_claim(self):
+        job, _ = report_jobs.submit_job("milk-production", {}, self.principal(self.admin))
+        write = report_jobs.JOB_REPORTS["milk-production"]
+
+        def report(f, params, principal, heartbeat):
+            # claimed long ago, and slower than REPORTING_JOB_STALE_AFTER since
+            ReportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=2))
+            write(f, params, principal, heartbeat)
+            self.assertEqual(report_jobs.requeue_stale_jobs(), 0)
+
+        with mock.patch.object(report_jobs, "HEARTBEAT_ROWS", 4), \
+                mock.patch.dict(report_jobs.JOB_REPORTS, {"milk-production": report}):
+            report_jobs.run_job(job.pk)
+        self.assertEqual(self.result(job)["count"], MilkProduction.objects.count())
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=3, days=2)
+        cls.cow = Cow.objects.filter(farmer=cls.farmers[0]).first()
+
+    def setUp(self):
+        report_cache().clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_unchanged_list_is_not_sent_again(self):
+        client = self.client_for(self.farmers[0])
+        url = reverse("core:cow-list-create")
+        first = client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["Cache-Control"], "private, no-cache")
+        with self.assertNumQueries(1):
+            again = client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual((again["ETag"], again.content), (first["ETag"], b""))
+        # lists are validated by ETag alone
+        self.assertNotIn("Last-Modified", first)
+        self.assertEqual(client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)).status_code, 200)
+
+        self.assertNotEqual(client.get(url, {"page_size": 2})["ETag"], first["ETag"])
+        self.assertNotEqual(self.client_for(self.farmers[1]).get(url)["ETag"], first["ETag"])
+        self.cow.breed = "Jersey"
+        self.cow.save()
+        changed = client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], first["ETag"])
+        Cow.objects.filter(farmer=self.farmers[0]).exclude(pk=self.cow.pk).first().delete()
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=changed["ETag"]).status_code, 200)
+
+    def test_enrollments_change_with_the_milk_they_count(self):
+        client = self.client_for(self.farmers[0])
+        url = reverse("core:enrollment-list-create")
+        etag = client.get(url)["ETag"]
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        MilkProduction.objects.create(cow=self.cow, date=date(2024, 3, 1), quantity=5, recorded_by=self.farmers[0])
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_views(self):
+        client = self.client_for(self.farmers[0])
+        for name, obj in (("cow-detail", self.cow), ("farm-detail", self.cow.farm),
+                          ("enrollment-detail", Enrollment.objects.filter(user=self.farmers[0]).first())):
+            with self.subTest(route=name):
+                url = reverse(f"core:{name}", kwargs={"pk": obj.pk})
+                etag = client.get(url)["ETag"]
+                self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                # access is checked first
+                self.assertEqual(self.client_for(self.farmers[1]).get(url, HTTP_IF_NONE_MATCH=etag).status_code, 403)
+                obj.save()
+                self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_details_follow_their_nested_rows(self):
+        client = self.client_for(self.farmers[0])
+        url = reverse("core:cow-detail", kwargs={"pk": self.cow.pk})
+        first = client.get(url)
+        self.assertNotIn("Last-Modified", first)
+        # UPDATEs skip the signals, as writes from another process skip this one's cache
+        Farm.objects.filter(pk=self.cow.farm_id).update(name="Renamed", updated_at=timezone.now())
+        renamed = client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual((renamed.status_code, renamed.data["farm"]["name"]), (200, "Renamed"))
+        for name, pk in (("cow-detail", self.cow.pk), ("farm-detail", self.cow.farm_id)):
+            with self.subTest(route=name):
+                url = reverse(f"core:{name}", kwargs={"pk": pk})
+                etag = client.get(url)["ETag"]
+                User.objects.filter(pk=self.agents[0].pk).update(email=f"{name}@example.com")
+                self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=2, days=3)
+        # well before any watermark in the tests (and all equal, as after a bulk import)
+        earlier = timezone.now() - timedelta(hours=1)
+        for model in (Farm, Cow, MilkProduction, Activity, Enrollment):
+            model.objects.update(updated_at=earlier)
+
+    def sync(self, user, url=None, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(url or reverse("core:sync"), params)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.json()
+
+    def ids(self, data, name):
+        return {row["id"] for row in data["changes"][name]}
+
+    def test_snapshot_matches_the_list_scope(self):
+        farmer = self.farmers[0]
+        data = self.sync(farmer)
+        self.assertTrue(data["reset"])
+        self.assertIsNone(data["next"])
+        self.assertEqual(self.ids(data, "farms"), {Enrollment.objects.get(user=farmer).farm_id})
+        self.assertEqual(self.ids(data, "cows"), set(Cow.objects.filter(farmer=farmer).values_list("id", flat=True)))
+        self.assertEqual(self.ids(data, "milk"),
+                         set(MilkProduction.objects.filter(recorded_by=farmer).values_list("id", flat=True)))
+        self.assertTrue(all(row["cow"] for row in data["changes"]["activities"]))
+        agent = self.sync(self.agents[1])
+        self.assertEqual(self.ids(agent, "enrollments"),
+                         set(Enrollment.objects.filter(farm__agent=self.agents[1]).values_list("id", flat=True)))
+
+    def test_delta_carries_only_changes_and_deletes(self):
+        farmer = self.farmers[0]
+        first = self.sync(farmer)
+        cow = Cow.objects.filter(farmer=farmer).first()
+        milk = MilkProduction.objects.create(cow=cow, date=date(2024, 2, 1), quantity=8, recorded_by=farmer)
+        activity = Activity.objects.filter(recorded_by=farmer).first()
+        activity_id = activity.pk
+        activity.delete()
+
+        delta = self.sync(farmer, since=first["until"], scope=first["scope"])
+        self.assertFalse(delta["reset"])
+        self.assertEqual(self.ids(delta, "milk"), {milk.pk})
+        # the milk moved the enrollment's yield
+        self.assertEqual(self.ids(delta, "enrollments"), {Enrollment.objects.get(user=farmer).pk})
+        self.assertEqual(self.ids(delta, "cows"), set())
+        self.assertEqual(delta["deleted"]["activities"], [activity_id])
+        other = self.sync(self.farmers[1], since=first["until"])
+        self.assertFalse(any(other["changes"].values()) or any(other["deleted"].values()))
+
+    def test_deleted_and_moved_cows_leave_the_old_farm(self):
+        first = {user.pk: self.sync(user) for user in (self.admin, *self.agents)}
+        doomed, moving = Cow.objects.filter(farm__agent=self.agents[0])
+        doomed_id = doomed.pk
+        doomed_milk = set(MilkProduction.objects.filter(cow=doomed).values_list("id", flat=True))
+        moving_milk = set(MilkProduction.objects.filter(cow=moving).values_list("id", flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            doomed.delete()
+        # the cow, its milk and its activities in one INSERT
+        self.assertEqual(sum('INSERT INTO "core_tombstone"' in q["sql"] for q in ctx.captured_queries), 1)
+        moving.farm = Farm.objects.get(agent=self.agents[1])
+        moving.save()
+
+        def delta(user):
+            return self.sync(user, since=first[user.pk]["until"], scope=first[user.pk]["scope"])
+
+        old = delta(self.agents[0])
+        self.assertEqual(set(old["deleted"]["cows"]), {doomed_id, moving.pk})
+        self.assertEqual(set(old["deleted"]["milk"]), doomed_milk | moving_milk)
+        new = delta(self.agents[1])
+        self.assertEqual((self.ids(new, "cows"), self.ids(new, "milk")), ({moving.pk}, moving_milk))
+        self.assertEqual(new["deleted"]["cows"], [])
+        # still visible to the admin, so only changed
+        admin = delta(self.admin)
+        self.assertEqual(admin["deleted"]["cows"], [doomed_id])
+        self.assertEqual(self.ids(admin, "cows"), {moving.pk})
+
+    def test_a_deleted_farm_takes_its_rows_along(self):
+        first = self.sync(self.admin)
+        farm = Farm.objects.get(agent=self.agents[0])
+        expected = {"farms": {farm.pk}}
+        for name, model in (("cows", Cow), ("milk", MilkProduction), ("activities", Activity),
+                            ("enrollments", Enrollment)):
+            expected[name] = set(model.objects.filter(farm=farm).values_list("id", flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            farm.delete()
+        self.assertEqual(sum('INSERT INTO "core_tombstone"' in q["sql"] for q in ctx.captured_queries), 1)
+        deleted = self.sync(self.admin, since=first["until"], scope=first["scope"])["deleted"]
+        self.assertEqual({name: set(ids) for name, ids in deleted.items()}, expected)
+
+    def test_full_snapshot_when_the_view_changed(self):
+        farmer = self.farmers[0]
+        first = self.sync(farmer)
+        Enrollment.objects.filter(user=farmer).update(is_active=False)
+        other_farm = Farm.objects.get(agent=self.agents[1])
+        Enrollment.objects.create(user=farmer, farm=other_farm)
+        again = self.sync(farmer, since=first["until"], scope=first["scope"])
+        self.assertTrue(again["reset"])
+        self.assertEqual(self.ids(again, "farms"), {other_farm.pk})
+        self.assertTrue(self.sync(farmer, since="2000-01-01T00:00:00Z")["reset"])
+        client = APIClient()
+        client.force_authenticate(farmer)
+        for since in ("yesterday", "2024-13-45T00:00:00"):
+            response = client.get(reverse("core:sync"), {"since": since})
+            self.assertEqual((response.status_code, list(response.data)), (400, ["since"]))
+        self.assertEqual(client.get(reverse("core:sync"), {"cursor": "nope"}).status_code, 404)
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_pages_follow_next(self):
+        pages = [self.sync(self.admin)]
+        while pages[-1]["next"]:
+            pages.append(self.sync(self.admin, url=pages[-1]["next"]))
+        self.assertGreater(len(pages), 3)
+        self.assertEqual({page["until"] for page in pages}, {pages[0]["until"]})
+        milk = [row["id"] for page in pages for row in page["changes"]["milk"]]
+        self.assertEqual(len(milk), len(set(milk)))
+        self.assertEqual(set(milk), set(MilkProduction.objects.values_list("id", flat=True)))
+
+
+class StreamFromDbTests(SimpleTestCase):
+    def collect(self, make_chunks, take=None):
+        async def run():
+            out = []
+            stream = stream_from_db(make_chunks)
+            async for chunk in stream:
+                out.append(chunk)
+                if take is not None and len(out) == take:
+                    await stream.aclose()
+                    break
+            return out
+        return asyncio.run(run())
+
+    def test_chunks_arrive_in_order_from_one_thread(self):
+        threads = set()
+
+        def chunks():
+            for i in range(50):
+                threads.add(threading.get_ident())
+                yield str(i)
+
+        self.assertEqual(self.collect(chunks), [str(i) for i in range(50)])
+        self.assertEqual(len(threads), 1)
+
+    def test_producer_errors_reach_the_consumer(self):
+        def chunks():
+            yield "a"
+            raise ValueError("boom")
+
+        with self.assertRaisesMessage(ValueError, "boom"):
+            self.collect(chunks)
+
+    def test_closing_the_stream_stops_the_producer(self):
+        finished = threading.Event()
+
+        def chunks():
+            try:
+                for i in range(10 ** 6):
+                    yield str(i)
+            finally:
+                finished.set()
+
+        self.assertEqual(self.collect(chunks, take=3), ["0", "1", "2"])
+        self.assertTrue(finished.wait(5))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class TokenVerifierTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=2, cows_per_farm=1, days=1)
+
+    def setUp(self):
+        self.verifier = TokenVerifier()
+
+    def test_principal_is_resolved_once(self):
+        agent = self.agents[0]
+        token = str(RefreshToken.for_user(agent).access_token)
+        principal = self.verifier.verify(token)
+        self.assertEqual((principal.user_id, principal.role), (agent.id, "agent"))
+        self.assertEqual(principal.farm_ids, set(Farm.objects.filter(agent=agent).values_list("id", flat=True)))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verifier.cached(token), principal)
+            self.assertEqual(self.verifier.verify(token), principal)
+
+    def test_rejects_refresh_expired_and_garbage_tokens(self):
+        refresh = RefreshToken.for_user(self.farmers[0])
+        expired = refresh.access_token
+        expired.set_exp(lifetime=-timedelta(seconds=1))
+        for token in (str(refresh), str(expired), "not-a-token"):
+            with self.subTest(token=token[:20]):
+                with self.assertRaises(InvalidToken):
+                    self.verifier.verify(token)
+
+    def test_inactive_user_is_rejected(self):
+        farmer = self.farmers[0]
+        farmer.is_active = False
+        farmer.save(update_fields=["is_active"])
+        with self.assertRaises(InvalidToken):
+            self.verifier.verify(str(RefreshToken.for_user(farmer).access_token))
+
+    def test_logout_revokes_the_access_token(self):
+        refresh = RefreshToken.for_user(self.farmers[0])
+        access = str(refresh.access_token)
+        self.verifier.verify(access)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = client.post(reverse("auth_logout"), {"refresh": str(refresh)}, format="json")
+        self.assertEqual(response.status_code, 205)
+        self.verifier.revoked.reload()  # what the periodic refresh does
+        with self.assertRaises(InvalidToken):
+            self.verifier.cached(access)
+        with self.assertRaises(InvalidToken):
+            self.verifier.verify(access)
+
+    def test_issue_access_token(self):
+        farmer = self.farmers[0]
+        farmer.set_password("pw")
+        farmer.save()
+        self.assertIsNone(issue_access_token(farmer.username, "wrong"))
+        principal = self.verifier.verify(issue_access_token(farmer.username, "pw"))
+        self.assertEqual(principal.user_id, farmer.id)
+
+
+class ReportScopingTests(TestCase):
+    """Reports show each role exactly the rows the DRF list views show it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin, cls.agents, cls.farmers = seed_farms(n_farms=3, cows_per_farm=2, days=3)
+        cls.users = {"admin": cls.admin, "agent": cls.agents[0], "farmer": cls.farmers[1]}
+
+    def setUp(self):
+        report_cache().clear()
+
+    def principal(self, role):
+        return TokenVerifier().verify(str(RefreshToken.for_user(self.users[role]).access_token))
+
+    def api_ids(self, role, name):
+        client = APIClient()
+        client.force_authenticate(self.users[role])
+        response = client.get(reverse(f"core:{name}"), {"page_size": 100})
+        return {row["id"] for row in response.data["results"]}
+
+    def test_rows_match_the_api(self):
+        for role in self.users:
+            with self.subTest(role=role):
+                principal = self.principal(role)
+                with self.assertNumQueries(1):
+                    report = reporting_db.get_milk_production_report(principal=principal)
+                self.assertEqual({r["id"] for r in report["items"]},
+                                 self.api_ids(role, "milkproduction-list-create"))
+                activities = reporting_db.get_recent_activities(limit=100, principal=principal)
+                self.assertEqual({a["id"] for a in activities}, self.api_ids(role, "activity-list-create"))
+                grouped = reporting_db.get_milk_production_grouped("day", principal=principal)
+                self.assertAlmostEqual(sum(i["total_liters"] for i in grouped["items"]), report["total_liters"])
+
+    def test_summary_is_scoped(self):
+        agent_farm = Farm.objects.get(agent=self.agents[0])
+        agent = reporting_db.get_farm_summary(self.principal("agent"))
+        farmer = reporting_db.get_farm_summary(self.principal("farmer"))
+        admin = reporting_db.get_farm_summary(self.principal("admin"))
+        self.assertEqual((agent["farms"], agent["farmers"], agent["cows"]), (1, 1, 2))
+        self.assertEqual((farmer["farms"], farmer["farmers"], farmer["cows"]), (1, 1, 2))
+        self.assertEqual((admin["farms"], admin["cows"]), (3, 6))
+        self.assertAlmostEqual(
+            agent["total_milk_liters"],
+            sum(MilkProduction.objects.filter(farm=agent_farm).values_list("quantity", flat=True)),
+        )
+
+    def test_summary_total_matches_the_report(self):
+        # a reading on the farmer's cow that someone else recorded is not theirs
+        cow = Cow.objects.filter(farmer=self.users["farmer"]).first()
+        MilkProduction.objects.create(cow=cow, date=date(2024, 3, 1), quantity=50, recorded_by=self.admin)
+        archive_milk(cutoff=date(2024, 1, 2))
+        for role in self.users:
+            with self.subTest(role=role):
+                principal = self.principal(role)
+                report = reporting_db.get_milk_production_report(principal=principal)
+                summary = reporting_db.get_farm_summary(principal=principal)
+                self.assertAlmostEqual(summary["total_milk_liters"], report["total_liters"])
+
+    def test_streamed_formats_match_the_report(self):
+        for role in self.users:
+            with self.subTest(role=role):
+                principal = self.principal(role)
+                report = reporting_db.get_milk_production_report(principal=principal)
+                stream = lambda: reporting_db.stream_milk_production_report(principal=principal)
+                *rows, last = [json.loads(line) for line in "".join(_ndjson_lines(stream())).splitlines()]
+                self.assertEqual(rows, report["items"])
+                self.assertEqual(last, {"summary": {"count": report["count"], "total_liters": report["total_liters"]}})
+                csv_rows = list(csv.DictReader(io.StringIO("".join(_csv_lines(stream())))))
+                self.assertEqual([int(row["id"]) for row in csv_rows], [item["id"] for item in report["items"]])
+                self.assertAlmostEqual(sum(float(row["quantity"]) for row in csv_rows), report["total_liters"])
+
+    def test_filters_cannot_widen_the_scope(self):
+        other_farm = Farm.objects.exclude(agent=self.agents[0]).first()
+        principal = self.principal("agent")
+        self.assertEqual(reporting_db.get_milk_production_report(farm_id=other_farm.id, principal=principal)["count"], 0)
+        self.assertEqual(reporting_db.get_milk_production_grouped("cow", farm_id=other_farm.id,
+                                                                  principal=principal)["count"], 0)
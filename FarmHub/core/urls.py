@@ -21,14 +21,27 @@ urlpatterns = [
 
     # Milk Production
     path("milk/", views.milkproduction_list_create, name="milkproduction-list-create"),
+    path("milk/bulk/", views.milkproduction_bulk_create, name="milkproduction-bulk-create"),
     path("milk/<int:pk>/", views.milkproduction_detail, name="milkproduction-detail"),
 
     # Activities
     path("activities/", views.activity_list_create, name="activity-list-create"),
+    path("activities/bulk/", views.activity_bulk_create, name="activity-bulk-create"),
     path("activities/<int:pk>/", views.activity_detail, name="activity-detail"),
 
     # Enrollments
     path("enrollments/", views.enrollment_list_create, name="enrollment-list-create"),
     path("enrollments/<int:pk>/", views.enrollment_detail, name="enrollment-detail"),
+
+    # Exports
+    path("exports/", views.export_list_create, name="export-list-create"),
+    path("exports/<int:pk>/", views.export_detail, name="export-detail"),
+    path("exports/<int:pk>/download/", views.export_download, name="export-download"),
+
+    # Imports
+    path("imports/<str:kind>/", views.import_upload, name="import-upload"),
+
+    # Offline sync
+    path("sync/", views.sync, name="sync"),
     
 ]
@@ -1,22 +1,51 @@
+import base64
+import hashlib
+import io
+import json
+import os
+from datetime import timezone as dt_timezone
+
+from django.core.paginator import Paginator
+from django.http import FileResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Sum
+from django.db import models, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.decorators import api_view, permission_classes 
+from rest_framework.parsers import MultiPartParser
+from rest_framework.decorators import api_view, parser_classes, permission_classes
 from rest_framework.permissions import IsAuthenticated
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.views import APIView
 from rest_framework import status
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
 from rest_framework.generics import CreateAPIView 
 from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import replace_query_param
 
 
-from .models import Farm, Cow, MilkProduction, Activity, User, Enrollment
+from .models import Farm, Cow, MilkProduction, Activity, User, Enrollment, ExportJob
 from .serializers import (
     FarmSerializer, CowSerializer, MilkProductionSerializer,
-    ActivitySerializer, UserSerializer, EnrollmentSerializer, RegistrationSerializer
+    ActivitySerializer, UserSerializer, EnrollmentSerializer, RegistrationSerializer,
+    MilkProductionBulkItemSerializer, ActivityBulkSerializer, ExportJobSerializer,
+    UserSummarySerializer, FarmCompactSerializer, CowCompactSerializer,
+    FAST_LIST_SERIALIZERS,
 )
+from .signals import milk_bulk_written
+from .archive import archived_keys
+from .caching import cache_generation
+from .exports import start_export
+from .imports import ImportFileError, import_csv
+from . import sync as delta_sync
 from .permissions import (
     IsSuperAdmin, IsAgent, IsFarmer,
     IsAdminOrAgent, IsFarmerOrAdmin,
@@ -30,26 +59,255 @@ class MyPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
+    # set when the row count is already known, so the page skips its COUNT(*)
+    known_count = None
+
+    def django_paginator_class(self, object_list, per_page):
+        paginator = Paginator(object_list, per_page)
+        if self.known_count is not None:
+            paginator.count = self.known_count
+        return paginator
+
+class KeysetPagination(MyPagination):
+    """
+    Opt-in ``?cursor=`` pagination. Walks an indexed, unique descending
+    ordering with a WHERE clause instead of OFFSET and never runs COUNT(*).
+    An empty cursor starts at the first page; follow ``next`` from there.
+    """
+    cursor_query_param = "cursor"
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        qs = queryset.order_by(*[f"-{f}" for f in self.fields])
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            qs = qs.filter(self._after(self._decode(token, queryset.model)))
+        rows = list(qs[:size + 1])
+        page = rows[:size]
+        self.next_token = self._encode(page[-1]) if len(rows) > size else None
+        return page
+
+    def get_paginated_response(self, data):
+        next_url = None
+        if self.next_token:
+            next_url = replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param, self.next_token
+            )
+        return Response({"next": next_url, "results": data})
+
+    def _after(self, values):
+        # (a, b, c) < (va, vb, vc), spelled out for databases without row comparison
+        cond = Q()
+        for i, field in enumerate(self.fields):
+            step = Q(**{f"{field}__lt": values[i]})
+            for prev, value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev: value})
+            cond |= step
+        return cond
+
+    def _encode(self, obj):
+        values = []
+        for field in self.fields:
+            value = _row_attr(obj, field)
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def _decode(self, token, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError(token)
+            return [self._parse(model._meta.get_field(f), v) for f, v in zip(self.fields, values)]
+        except (ValueError, TypeError):
+            raise NotFound("Invalid cursor.")
+
+    @staticmethod
+    def _parse(field, value):
+        # cursors come from the client: every value must parse as its field's type
+        if isinstance(field, models.DateTimeField):
+            parsed = parse_datetime(value)
+        elif isinstance(field, models.DateField):
+            parsed = parse_date(value)
+        else:
+            parsed = value if type(value) is int else None
+        if parsed is None:
+            raise ValueError(value)
+        return parsed
+
+# keyset orderings (all descending); every one ends in the primary key
+KEYSET_ORDERINGS = {
+    MilkProduction: ("date", "created_at", "id"),
+}
+
+def _keyset_fields(model):
+    if model in KEYSET_ORDERINGS:
+        return KEYSET_ORDERINGS[model]
+    if any(f.name == "created_at" for f in model._meta.get_fields()):
+        return ("created_at", "id")
+    return ("id",)
+
+# ?include=<name> -> (bucket in "included", id attribute on the listed rows)
+SIDELOADS = {
+    "farm": ("farms", "farm_id"),
+    "farmer": ("users", "farmer_id"),
+    "user": ("users", "user_id"),
+    "recorded_by": ("users", "recorded_by_id"),
+    "cow": ("cows", "cow_id"),
+    "agent": ("users", "agent_id"),
+}
+SIDELOAD_SOURCES = {
+    "farms": (Farm, FarmCompactSerializer),
+    "users": (User, UserSummarySerializer),
+    "cows": (Cow, CowCompactSerializer),
+}
+
+def _row_attr(row, name):
+    # page rows are model instances, or dicts on the fast (.values()) path
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+def _query_flag(request, name):
+    return request.query_params.get(name, "").lower() in {"1", "true", "yes"}
+
+def _requested_includes(request, allowed):
+    raw = request.query_params.get("include", "")
+    return [name for name in raw.split(",") if name in allowed]
+
+def _sideload_columns(model, includes):
+    """Attnames ``_sideload`` reads off rows of ``model`` for ``includes``."""
+    attnames = {f.attname for f in model._meta.concrete_fields}
+    columns = []
+    for name in includes:
+        attr = SIDELOADS[name][1]
+        # agents of rows without an agent_id are found through their farm
+        columns.append(attr if attr in attnames else "farm_id")
+    return columns
+
+def _sideload(rows, includes):
+    """
+    Build the ``included`` map: every farm/user/cow referenced by ``rows``
+    exactly once, with one query per kind. ``agent`` on rows without an
+    agent_id (cows) is resolved through their farms.
+    """
+    agents_via_farms = "agent" in includes and bool(rows) and not (
+        "agent_id" in rows[0] if isinstance(rows[0], dict) else hasattr(rows[0], "agent_id"))
+    ids = {bucket: set() for bucket in SIDELOAD_SOURCES}
+    for name in includes:
+        if name == "agent" and agents_via_farms:
+            continue
+        bucket, attr = SIDELOADS[name]
+        ids[bucket].update(_row_attr(r, attr) for r in rows)
 
-def _paginate(qs, request, Serializer):
-    paginator = MyPagination()
+    objects = {}
+    if ids["farms"] or agents_via_farms:
+        farms = Farm.objects.in_bulk(
+            ids["farms"] | {_row_attr(r, "farm_id") for r in rows} if agents_via_farms else ids["farms"])
+        if agents_via_farms:
+            ids["users"].update(f.agent_id for f in farms.values())
+        if "farm" in includes:
+            objects["farms"] = farms
+    for bucket in ("cows", "users"):
+        if ids[bucket]:
+            objects[bucket] = SIDELOAD_SOURCES[bucket][0].objects.in_bulk(ids[bucket])
+
+    return {
+        bucket: {str(pk): SIDELOAD_SOURCES[bucket][1](obj).data for pk, obj in objs.items()}
+        for bucket, objs in objects.items()
+    }
+
+def _paginate(qs, request, Serializer, CompactSerializer=None, includes=(), count=None):
+    """
+    ``?compact=1`` swaps in ``CompactSerializer`` (foreign keys as ids) and
+    ``?include=a,b`` side-loads the referenced objects under ``included``.
+    Serializers with a FastListSerializer twin are served from ``.values()``.
+    ``count`` is the number of rows in ``qs``, when the caller already has it.
+    """
+    compact = CompactSerializer is not None and _query_flag(request, "compact")
+    if compact:
+        qs = qs.select_related(None)
+        Serializer = CompactSerializer
+    keyset = _keyset_fields(qs.model)
+    wanted = _requested_includes(request, includes)
+    fast = FAST_LIST_SERIALIZERS.get(Serializer)
+    if fast is not None:
+        # side-loads read their ids off the rows, whether or not the serializer outputs them
+        qs = fast.values(qs, *keyset, *_sideload_columns(qs.model, wanted))
+    if KeysetPagination.cursor_query_param in request.query_params:
+        paginator = KeysetPagination(keyset)
+    else:
+        paginator = MyPagination()
+        paginator.known_count = count
     page = paginator.paginate_queryset(qs, request)
-    return paginator.get_paginated_response(Serializer(page, many=True).data)
+    data = fast.serialize(page) if fast is not None else Serializer(page, many=True).data
+    response = paginator.get_paginated_response(data)
+    if wanted:
+        response.data["included"] = _sideload(list(page), wanted)
+    return response
+
+# Conditional GET
+def _etag(request, *parts):
+    """
+    Weak ETag over ``parts`` and what else shapes the response: the caller
+    (lists are scoped to them) and the renderer.
+    """
+    user = request.user
+    key = [getattr(user, "pk", None), getattr(user, "role", None), request.accepted_renderer.format, *parts]
+    return 'W/"%s"' % hashlib.sha1(json.dumps(key, default=str).encode()).hexdigest()
+
+def _list_validators(request, qs):
+    """
+    (etag, count) of a scoped list, from one aggregate over the indexed
+    updated_at column. Query parameters are part of the tag, so each page,
+    filter and include set is validated on its own. Lists carry no
+    Last-Modified: a deleted row, or one that left the caller's scope,
+    changes the list without moving its newest updated_at. The nested farm,
+    agent and farmer objects are covered by the report cache generation,
+    which moves on farm, user, cow and milk writes.
+    """
+    stats = qs.order_by().aggregate(count=Count("pk"), last_modified=Max("updated_at"))
+    etag = _etag(request, request.get_full_path(), cache_generation(), stats["count"], stats["last_modified"])
+    return etag, stats["count"]
+
+def _object_etag(request, obj, *nested):
+    """
+    ETag of a detail response: ``obj`` and the ``nested`` rows serialized
+    with it, each by its updated_at. Users have none, so the fields they are
+    shown with stand in. Details carry no Last-Modified either: an edit to a
+    nested row does not move the object's own updated_at.
+    """
+    parts = []
+    for row in (obj, *nested):
+        version = UserSerializer(row).data if isinstance(row, User) else row.updated_at
+        parts += [row._meta.label, row.pk, version]
+    return _etag(request, *parts)
+
+def _conditional_get(request, etag, respond):
+    """
+    Answer with 304 Not Modified when the client's If-None-Match still
+    matches, before anything is serialized; else with ``respond()``. Both
+    carry the ETag.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = respond()
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+        # per user, and always revalidated
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ("Authorization",))
+    return response
 
 # Helping
 def _err(msg="Permission denied.", code=403):
     return Response({"detail": msg}, status=code)
 
-def _is_admin(u):  return getattr(u, "role", None) == ADMIN
-def _is_agent(u):  return getattr(u, "role", None) == AGENT
-def _is_farmer(u): return getattr(u, "role", None) == FARMER
-
 def _farms_managed(user):
     return Farm.objects.filter(agent=user)
 
 def _active_farm_for_farmer(user):
-    if not _is_farmer(user):
-        return None
     e = (Enrollment.objects
          .filter(user=user, is_active=True)
          .select_related("farm")
@@ -57,23 +315,63 @@ def _active_farm_for_farmer(user):
          .first())
     return e.farm if e else getattr(user, "farm", None)
 
-def _agent_owns_farm(agent, farm):
-    return farm.agent_id == agent.id
+_UNRESOLVED = object()
+
+class AccessScope:
+    """
+    Role and farm scoping of the requesting user. Each piece is looked up at
+    most once per request; get it with ``_scope(request)``.
+    """
+    def __init__(self, user):
+        self.user = user
+        self.role = getattr(user, "role", None)
+        self._managed_farm_ids = None
+        self._active_farm = _UNRESOLVED
 
-def _cow_access_ok(user, cow):
+    is_admin = property(lambda self: self.role == ADMIN)
+    is_agent = property(lambda self: self.role == AGENT)
+    is_farmer = property(lambda self: self.role == FARMER)
+
+    @property
+    def managed_farm_ids(self):
+        """Ids of the farms an agent manages (empty for other roles)."""
+        if self._managed_farm_ids is None:
+            self._managed_farm_ids = (
+                frozenset(_farms_managed(self.user).values_list("id", flat=True)) if self.is_agent else frozenset()
+            )
+        return self._managed_farm_ids
+
+    @property
+    def active_farm(self):
+        """A farmer's current farm (latest active enrollment), else None."""
+        if self._active_farm is _UNRESOLVED:
+            self._active_farm = _active_farm_for_farmer(self.user) if self.is_farmer else None
+        return self._active_farm
+
+    def manages(self, farm_id):
+        return self.is_agent and farm_id in self.managed_farm_ids
+
+def _scope(request):
+    scope = getattr(request, "farmhub_scope", None)
+    if scope is None or scope.user is not request.user:
+        scope = AccessScope(request.user)
+        request.farmhub_scope = scope
+    return scope
+
+def _cow_access_ok(scope, cow):
     return (
-        _is_admin(user)
-        or (_is_agent(user) and _agent_owns_farm(user, cow.farm))
-        or (_is_farmer(user) and cow.farmer_id == user.id)
+        scope.is_admin
+        or scope.manages(cow.farm_id)
+        or (scope.is_farmer and cow.farmer_id == scope.user.id)
     )
 
-def _record_access_ok(user, cow, recorder=None):
-    if _is_admin(user):
+def _record_access_ok(scope, cow, recorder_id=None):
+    if scope.is_admin:
         return True
-    if _is_agent(user):
-        return _agent_owns_farm(user, cow.farm)
-    if _is_farmer(user):
-        return recorder and recorder.id == user.id
+    if scope.is_agent:
+        return scope.manages(cow.farm_id)
+    if scope.is_farmer:
+        return recorder_id is not None and recorder_id == scope.user.id
     return False
 
 # Users
@@ -82,14 +380,14 @@ def _record_access_ok(user, cow, recorder=None):
 @permission_classes([IsAuthenticated]) 
 def user_list(request):
     u = request.user
-    if _is_admin(u):
+    scope = _scope(request)
+    if scope.is_admin:
         users = User.objects.all()
-    elif _is_agent(u):
-        farms = _farms_managed(u)
+    elif scope.is_agent:
         users = User.objects.filter(
-            Q(id=u.id) | Q(role=FARMER, enrollments__farm__in=farms)
+            Q(id=u.id) | Q(role=FARMER, enrollments__farm__in=scope.managed_farm_ids)
         ).distinct()
-    elif _is_farmer(u):
+    elif scope.is_farmer:
         users = User.objects.filter(id=u.id)
     else:
         return _err()
@@ -99,12 +397,12 @@ def user_list(request):
 @api_view(["POST"])
 @permission_classes([IsAuthenticated, IsAdminOrAgent])  
 def farmer_create(request):
-    u = request.user
+    scope = _scope(request)
     farm_id = request.data.get("farm")
     if not farm_id:
         return Response({"farm": ["This field is required."]}, status=400)
     farm = get_object_or_404(Farm, id=farm_id)
-    if _is_agent(u) and not _agent_owns_farm(u, farm):
+    if scope.is_agent and not scope.manages(farm.id):
         return _err("You can only assign farmers to your own farm(s).")
 
     ser = UserSerializer(data=request.data)
@@ -134,23 +432,26 @@ def agent_create(request):
 @permission_classes([PostAdminOrAgentElseAuth])   
 def farm_list_create(request):
     u = request.user
+    scope = _scope(request)
 
     if request.method == "GET":
-        if _is_admin(u):
+        if scope.is_admin:
             farms = Farm.objects.all().select_related("agent")
-        elif _is_agent(u):
-            farms = _farms_managed(u).select_related("agent")
-        elif _is_farmer(u):
-            f = _active_farm_for_farmer(u)
+        elif scope.is_agent:
+            farms = Farm.objects.filter(id__in=scope.managed_farm_ids).select_related("agent")
+        elif scope.is_farmer:
+            f = scope.active_farm
             farms = Farm.objects.filter(id=f.id).select_related("agent") if f else Farm.objects.none()
         else:
             return _err()
-        return _paginate(farms, request, FarmSerializer)
+        etag, count = _list_validators(request, farms)
+        return _conditional_get(request, etag, lambda: _paginate(
+            farms, request, FarmSerializer, FarmCompactSerializer, includes=("agent",), count=count))
 
     ser = FarmSerializer(data=request.data)
     if not ser.is_valid():
         return Response(ser.errors, status=400)
-    if _is_agent(u):
+    if scope.is_agent:
         farm = ser.save(agent=u)
     else: 
         agent_id = request.data.get("agent")
@@ -168,33 +469,34 @@ def farm_list_create(request):
 @api_view(["GET", "PUT", "DELETE"])
 @permission_classes([AuthenticatedOrReadOnly]) 
 def farm_detail(request, pk):
-    u = request.user
+    scope = _scope(request)
     farm = get_object_or_404(Farm.objects.select_related("agent"), pk=pk)
 
     if request.method == "GET":
-        if (_is_admin(u)
-            or (_is_agent(u) and _agent_owns_farm(u, farm))
-            or (_is_farmer(u) and _active_farm_for_farmer(u) and _active_farm_for_farmer(u).id == farm.id)):
-            return Response(FarmSerializer(farm).data)
+        if (scope.is_admin
+            or scope.manages(farm.id)
+            or (scope.is_farmer and scope.active_farm and scope.active_farm.id == farm.id)):
+            return _conditional_get(request, _object_etag(request, farm, farm.agent),
+                                    lambda: Response(FarmSerializer(farm).data))
         return _err()
 
     if request.method == "PUT":
-        if not (_is_admin(u) or (_is_agent(u) and _agent_owns_farm(u, farm))):
+        if not (scope.is_admin or scope.manages(farm.id)):
             return _err("Only the SuperAdmin or the farm's Agent can update this farm.")
         data = request.data.copy()
-        if _is_agent(u):
+        if scope.is_agent:
             data.pop("agent", None)
         ser = FarmSerializer(farm, data=data)
         if not ser.is_valid():
             return Response(ser.errors, status=400)
-        if _is_admin(u) and data.get("agent"):
+        if scope.is_admin and data.get("agent"):
             new_agent = get_object_or_404(User, id=data["agent"], role=AGENT)
             updated = ser.save(agent=new_agent)
         else:
             updated = ser.save(agent=farm.agent)
         return Response(FarmSerializer(updated).data)
 
-    if not (_is_admin(u) or (_is_agent(u) and _agent_owns_farm(u, farm))):
+    if not (scope.is_admin or scope.manages(farm.id)):
         return _err("Only the SuperAdmin or the farm's Agent can delete this farm.")
     farm.delete()
     return Response({"detail": "Farm deleted."}, status=204)
@@ -206,21 +508,24 @@ def farm_detail(request, pk):
 @permission_classes([AuthenticatedOrReadOnly]) 
 def cow_list_create(request):
     u = request.user
+    scope = _scope(request)
 
     if request.method == "GET":
-        if _is_farmer(u):
-            cows = Cow.objects.filter(farmer=u).select_related("farm", "farmer")
-        elif _is_agent(u):
-            cows = Cow.objects.filter(farm__in=_farms_managed(u)).select_related("farm", "farmer")
-        elif _is_admin(u):
-            cows = Cow.objects.all().select_related("farm", "farmer")
+        if scope.is_farmer:
+            cows = Cow.objects.filter(farmer=u).select_related("farm", "farm__agent", "farmer")
+        elif scope.is_agent:
+            cows = Cow.objects.filter(farm__in=scope.managed_farm_ids).select_related("farm", "farm__agent", "farmer")
+        elif scope.is_admin:
+            cows = Cow.objects.all().select_related("farm", "farm__agent", "farmer")
         else:
             return _err()
-        return _paginate(cows, request, CowSerializer)
+        etag, count = _list_validators(request, cows)
+        return _conditional_get(request, etag, lambda: _paginate(
+            cows, request, CowSerializer, CowCompactSerializer, includes=("farm", "farmer", "agent"), count=count))
 
     ser = CowSerializer(data=request.data)
-    if _is_farmer(u):
-        farm = _active_farm_for_farmer(u)
+    if scope.is_farmer:
+        farm = scope.active_farm
         if not farm:
             return _err("No active enrollment found for this farmer.", code=400)
         if not ser.is_valid():
@@ -228,7 +533,7 @@ def cow_list_create(request):
         cow = ser.save(farmer=u, farm=farm)
         return Response(CowSerializer(cow).data, status=201)
 
-    if _is_agent(u) or _is_admin(u):
+    if scope.is_agent or scope.is_admin:
         farmer_id = request.data.get("farmer")
         if not farmer_id:
             return Response({"farmer": ["This field is required."]}, status=400)
@@ -236,7 +541,7 @@ def cow_list_create(request):
         farm = _active_farm_for_farmer(farmer) or getattr(farmer, "farm", None)
         if not farm:
             return _err("Target farmer has no active farm/enrollment.", code=400)
-        if _is_agent(u) and not _agent_owns_farm(u, farm):
+        if scope.is_agent and not scope.manages(farm.id):
             return _err("You can only add cows for farmers in your assigned farm(s).")
         if not ser.is_valid():
             return Response(ser.errors, status=400)
@@ -250,23 +555,26 @@ def cow_list_create(request):
 @api_view(["GET", "PUT", "DELETE"])
 @permission_classes([AuthenticatedOrReadOnly]) 
 def cow_detail(request, pk):
-    u = request.user
-    cow = get_object_or_404(Cow.objects.select_related("farm", "farmer"), pk=pk)
+    scope = _scope(request)
+    cow = get_object_or_404(Cow.objects.select_related("farm", "farm__agent", "farmer"), pk=pk)
 
     if request.method == "GET":
-        return Response(CowSerializer(cow).data) if _cow_access_ok(u, cow) else _err()
+        if not _cow_access_ok(scope, cow):
+            return _err()
+        return _conditional_get(request, _object_etag(request, cow, cow.farm, cow.farm.agent, cow.farmer),
+                                lambda: Response(CowSerializer(cow).data))
 
     if request.method == "PUT":
-        if not _cow_access_ok(u, cow):
+        if not _cow_access_ok(scope, cow):
             return _err("Only the owner (farmer), farm manager (agent), or SuperAdmin can update this cow.")
         data = request.data.copy()
-        if not _is_admin(u):
+        if not scope.is_admin:
             data.pop("farmer", None)
             data.pop("farm", None)
         ser = CowSerializer(cow, data=data)
         if not ser.is_valid():
             return Response(ser.errors, status=400)
-        if _is_admin(u) and ("farmer" in data or "farm" in data):
+        if scope.is_admin and ("farmer" in data or "farm" in data):
             new_farmer = cow.farmer
             new_farm = cow.farm
             if "farmer" in data:
@@ -279,7 +587,7 @@ def cow_detail(request, pk):
             updated = ser.save(farmer=cow.farmer, farm=cow.farm)
         return Response(CowSerializer(updated).data)
 
-    if not _cow_access_ok(u, cow):
+    if not _cow_access_ok(scope, cow):
         return _err("Only the owner (farmer), farm manager (agent), or SuperAdmin can delete this cow.")
     cow.delete()
     return Response({"detail": "Cow deleted."}, status=204)
@@ -291,45 +599,101 @@ def cow_detail(request, pk):
 @permission_classes([PostFarmerOrAdminElseAuth])   
 def milkproduction_list_create(request):
     u = request.user
+    scope = _scope(request)
 
     if request.method == "GET":
-        if _is_farmer(u):
+        if scope.is_farmer:
             records = MilkProduction.objects.filter(recorded_by=u).select_related("cow", "cow__farmer", "cow__farm")
-        elif _is_agent(u):
+        elif scope.is_agent:
             records = (MilkProduction.objects
-                       .filter(cow__farm__in=_farms_managed(u))
+                       .filter(farm__in=scope.managed_farm_ids)
                        .select_related("cow", "cow__farmer", "cow__farm"))
-        elif _is_admin(u):
+        elif scope.is_admin:
             records = MilkProduction.objects.all().select_related("cow", "cow__farmer", "cow__farm")
         else:
             return _err()
-        return _paginate(records, request, MilkProductionSerializer)
+        return _paginate(records, request, MilkProductionSerializer, includes=("cow", "farm", "recorded_by"))
 
     ser = MilkProductionSerializer(data=request.data)
     if not ser.is_valid():
         return Response(ser.errors, status=400)
-    record = ser.save(recorded_by=u if _is_farmer(u) else ser.validated_data.get("recorded_by", u))
+    record = ser.save(recorded_by=u if scope.is_farmer else ser.validated_data.get("recorded_by", u))
     return Response(MilkProductionSerializer(record).data, status=201)
 
+MILK_BULK_MAX_ITEMS = 1000
+
+@swagger_auto_schema(method="post", request_body=MilkProductionBulkItemSerializer(many=True))
+@api_view(["POST"])
+@permission_classes([IsAuthenticated, IsFarmerOrAdmin])
+def milkproduction_bulk_create(request):
+    u = request.user
+    scope = _scope(request)
+    items = request.data
+    if not isinstance(items, list):
+        return Response({"detail": "Expected a list of milk records."}, status=400)
+    if len(items) > MILK_BULK_MAX_ITEMS:
+        return Response({"detail": f"At most {MILK_BULK_MAX_ITEMS} records per request."}, status=400)
+
+    errors, valid = [], []
+    for i, item in enumerate(items):
+        ser = MilkProductionBulkItemSerializer(data=item)
+        if ser.is_valid():
+            valid.append((i, ser.validated_data))
+        else:
+            errors.append({"index": i, "errors": ser.errors})
+
+    cows = Cow.objects.only("id", "farm_id", "farmer_id").in_bulk({d["cow"] for _, d in valid})
+    records, positions = {}, {}
+    for i, d in valid:
+        cow = cows.get(d["cow"])
+        key = (d["cow"], d["date"])
+        if cow is None:
+            errors.append({"index": i, "errors": {"cow": [f'Invalid pk "{d["cow"]}" - object does not exist.']}})
+        elif scope.is_farmer and cow.farmer_id != u.id:
+            errors.append({"index": i, "errors": {"non_field_errors": ["You can only record milk for your own cows."]}})
+        elif key in records:
+            errors.append({"index": i, "errors": {"non_field_errors": ["Duplicate cow/date in this batch."]}})
+        else:
+            records[key] = MilkProduction(cow=cow, farm_id=cow.farm_id, date=d["date"], quantity=d["quantity"], recorded_by=u)
+            positions[key] = i
+    for key in archived_keys(records):
+        del records[key]
+        errors.append({"index": positions[key], "errors": {"non_field_errors": [
+            "This cow already has an archived milk record for that date."]}})
+
+    if records:
+        # upsert on uq_cow_date_milk: an existing reading for the same cow/day is replaced
+        with transaction.atomic():
+            MilkProduction.objects.bulk_create(
+                records.values(),
+                update_conflicts=True,
+                unique_fields=["cow", "date"],
+                update_fields=["quantity", "farm", "updated_at"],
+            )
+            milk_bulk_written(records.keys())
+    errors.sort(key=lambda e: e["index"])
+    return Response({"saved": len(records), "errors": errors}, status=201 if records else 400)
+
 @swagger_auto_schema(method="get", responses={200: MilkProductionSerializer})
 @swagger_auto_schema(method="put", request_body=MilkProductionSerializer)
 @api_view(["GET", "PUT", "DELETE"])
 @permission_classes([AuthenticatedOrReadOnly]) 
 def milkproduction_detail(request, pk):
     u = request.user
+    scope = _scope(request)
     rec = get_object_or_404(
-        MilkProduction.objects.select_related("cow", "recorded_by", "cow__farm"),
+        MilkProduction.objects.select_related("cow", "recorded_by"),
         pk=pk
     )
 
     if request.method == "GET":
-        return Response(MilkProductionSerializer(rec).data) if _record_access_ok(u, rec.cow, rec.recorded_by) else _err()
+        return Response(MilkProductionSerializer(rec).data) if _record_access_ok(scope, rec.cow, rec.recorded_by_id) else _err()
 
     if request.method == "PUT":
-        if not (_is_admin(u) or (_is_farmer(u) and rec.recorded_by_id == u.id)):
+        if not (scope.is_admin or (scope.is_farmer and rec.recorded_by_id == u.id)):
             return _err("Only the original recording farmer or SuperAdmin can update this record.")
         data = request.data.copy()
-        if _is_farmer(u):
+        if scope.is_farmer:
             data.pop("recorded_by", None)
         ser = MilkProductionSerializer(rec, data=data)
         if not ser.is_valid():
@@ -337,7 +701,7 @@ def milkproduction_detail(request, pk):
         updated = ser.save(recorded_by=rec.recorded_by)
         return Response(MilkProductionSerializer(updated).data)
 
-    if not (_is_admin(u) or (_is_farmer(u) and rec.recorded_by_id == u.id)):
+    if not (scope.is_admin or (scope.is_farmer and rec.recorded_by_id == u.id)):
         return _err("Only the original recording farmer or SuperAdmin can delete this record.")
     rec.delete()
     return Response({"detail": "Milk production record deleted."}, status=204)
@@ -349,19 +713,20 @@ def milkproduction_detail(request, pk):
 @permission_classes([PostFarmerOrAdminElseAuth])  
 def activity_list_create(request):
     u = request.user
+    scope = _scope(request)
 
     if request.method == "GET":
-        if _is_farmer(u):
+        if scope.is_farmer:
             activities = Activity.objects.filter(recorded_by=u).select_related("cow", "cow__farm", "cow__farmer")
-        elif _is_agent(u):
+        elif scope.is_agent:
             activities = (Activity.objects
-                          .filter(cow__farm__in=_farms_managed(u))
+                          .filter(farm__in=scope.managed_farm_ids)
                           .select_related("cow", "cow__farm", "cow__farmer"))
-        elif _is_admin(u):
+        elif scope.is_admin:
             activities = Activity.objects.all().select_related("cow", "cow__farm", "cow__farmer")
         else:
             return _err()
-        return _paginate(activities, request, ActivitySerializer)
+        return _paginate(activities, request, ActivitySerializer, includes=("cow", "farm", "recorded_by"))
 
     ser = ActivitySerializer(data=request.data, context={"request": request})
     ser.is_valid(raise_exception=True)
@@ -369,22 +734,64 @@ def activity_list_create(request):
     return Response(ActivitySerializer(activity, context={"request": request}).data, status=201)
 
 
+ACTIVITY_BULK_MAX_COWS = 2000
+
+@swagger_auto_schema(method="post", request_body=ActivityBulkSerializer)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated, IsFarmerOrAdmin])
+def activity_bulk_create(request):
+    u = request.user
+    scope = _scope(request)
+    ser = ActivityBulkSerializer(data=request.data)
+    ser.is_valid(raise_exception=True)
+    data = dict(ser.validated_data)
+    cow_ids = set(data.pop("cows"))
+    tags = set(data.pop("tag_numbers"))
+    if len(cow_ids) + len(tags) > ACTIVITY_BULK_MAX_COWS:
+        return Response({"detail": f"At most {ACTIVITY_BULK_MAX_COWS} cows per request."}, status=400)
+
+    cows = list(Cow.objects
+                .filter(Q(id__in=cow_ids) | Q(tag_number__in=tags))
+                .only("id", "tag_number", "farm_id", "farmer_id")
+                .order_by("id"))
+    not_found = {
+        "cows": sorted(cow_ids - {c.id for c in cows}),
+        "tag_numbers": sorted(tags - {c.tag_number for c in cows}),
+    }
+    allowed = [c for c in cows if scope.is_admin or c.farmer_id == u.id]
+    forbidden = [c.id for c in cows if not (scope.is_admin or c.farmer_id == u.id)]
+    if not allowed:
+        return Response({"detail": "No cows you can log activities for.",
+                         "not_found": not_found, "forbidden": forbidden}, status=400)
+
+    with transaction.atomic():
+        created = Activity.objects.bulk_create(
+            [Activity(cow=c, farm_id=c.farm_id, recorded_by=u, **data) for c in allowed]
+        )
+    return Response({
+        "created": len(created),
+        "cows": [c.id for c in allowed],
+        "not_found": not_found,
+        "forbidden": forbidden,
+    }, status=201)
+
 @swagger_auto_schema(method="get", responses={200: ActivitySerializer})
 @swagger_auto_schema(method="put", request_body=ActivitySerializer)
 @api_view(["GET", "PUT", "DELETE"])
 @permission_classes([AuthenticatedOrReadOnly]) 
 def activity_detail(request, pk):
     u = request.user
-    act = get_object_or_404(Activity.objects.select_related("cow", "recorded_by", "cow__farm"), pk=pk)
+    scope = _scope(request)
+    act = get_object_or_404(Activity.objects.select_related("cow", "recorded_by"), pk=pk)
 
     if request.method == "GET":
-        return Response(ActivitySerializer(act).data) if _record_access_ok(u, act.cow, act.recorded_by) else _err()
+        return Response(ActivitySerializer(act).data) if _record_access_ok(scope, act.cow, act.recorded_by_id) else _err()
 
     if request.method == "PUT":
-        if not (_is_admin(u) or (_is_farmer(u) and act.recorded_by_id == u.id)):
+        if not (scope.is_admin or (scope.is_farmer and act.recorded_by_id == u.id)):
             return _err("Only the original recording farmer or SuperAdmin can update this activity.")
         data = request.data.copy()
-        if _is_farmer(u):
+        if scope.is_farmer:
             data.pop("recorded_by", None)
         ser = ActivitySerializer(act, data=data)
         if not ser.is_valid():
@@ -392,7 +799,7 @@ def activity_detail(request, pk):
         updated = ser.save(recorded_by=act.recorded_by)
         return Response(ActivitySerializer(updated).data)
 
-    if not (_is_admin(u) or (_is_farmer(u) and act.recorded_by_id == u.id)):
+    if not (scope.is_admin or (scope.is_farmer and act.recorded_by_id == u.id)):
         return _err("Only the original recording farmer or SuperAdmin can delete this activity.")
     act.delete()
     return Response({"detail": "Activity record deleted."}, status=204)
@@ -404,17 +811,20 @@ def activity_detail(request, pk):
 @permission_classes([PostAdminOrAgentElseAuth])   
 def enrollment_list_create(request):
     u = request.user
+    scope = _scope(request)
 
     if request.method == "GET":
-        if _is_admin(u):
+        if scope.is_admin:
             enrollments = Enrollment.objects.select_related("user", "farm", "farm__agent")
-        elif _is_agent(u):
-            enrollments = Enrollment.objects.select_related("user", "farm").filter(farm__agent=u)
-        elif _is_farmer(u):
+        elif scope.is_agent:
+            enrollments = Enrollment.objects.select_related("user", "farm").filter(farm__in=scope.managed_farm_ids)
+        elif scope.is_farmer:
             enrollments = Enrollment.objects.select_related("user", "farm").filter(user=u)
         else:
             return _err()
-        return _paginate(enrollments, request, EnrollmentSerializer)
+        etag, count = _list_validators(request, enrollments)
+        return _conditional_get(request, etag, lambda: _paginate(
+            enrollments, request, EnrollmentSerializer, includes=("user", "farm"), count=count))
 
     ser = EnrollmentSerializer(data=request.data, context={"request": request})
     ser.is_valid(raise_exception=True)  
@@ -422,7 +832,7 @@ def enrollment_list_create(request):
     farm = ser.validated_data.get("farm")
     user_obj = ser.validated_data.get("user")
 
-    if _is_agent(u) and farm.agent_id != u.id:
+    if scope.is_agent and not scope.manages(farm.id):
         return _err("You can only enroll farmers into your own farm(s).", code=403)
 
     enrollment = ser.save()
@@ -435,40 +845,172 @@ def enrollment_list_create(request):
 @permission_classes([AuthenticatedOrReadOnly])   
 def enrollment_detail(request, pk):
     u = request.user
+    scope = _scope(request)
     enr = get_object_or_404(Enrollment.objects.select_related("user", "farm", "farm__agent"), pk=pk)
 
     if request.method == "GET":
         can_view = (
-            _is_admin(u)
-            or (_is_agent(u) and _agent_owns_farm(u, enr.farm))
-            or (_is_farmer(u) and enr.user_id == u.id)
+            scope.is_admin
+            or scope.manages(enr.farm_id)
+            or (scope.is_farmer and enr.user_id == u.id)
         )
-        return Response(EnrollmentSerializer(enr).data) if can_view else _err()
+        if not can_view:
+            return _err()
+        return _conditional_get(request, _object_etag(request, enr),
+                                lambda: Response(EnrollmentSerializer(enr).data))
 
     if request.method == "PUT":
-        can_update = _is_admin(u) or (_is_agent(u) and _agent_owns_farm(u, enr.farm))
+        can_update = scope.is_admin or scope.manages(enr.farm_id)
         if not can_update:
             return _err()
         data = request.data.copy()
-        if _is_agent(u):
-            data.pop("user", None)
-            data.pop("farm", None)
-        ser = EnrollmentSerializer(enr, data=data)
+        if scope.is_agent:
+            data["user"], data["farm"] = enr.user_id, enr.farm_id
+        ser = EnrollmentSerializer(enr, data=data, context={"request": request})
         if not ser.is_valid():
             return Response(ser.errors, status=400)
-        updated = ser.save() if _is_admin(u) else ser.save(user=enr.user, farm=enr.farm)
+        updated = ser.save() if scope.is_admin else ser.save(user=enr.user, farm=enr.farm)
         return Response(EnrollmentSerializer(updated).data)
 
-    can_delete = _is_admin(u) or (_is_agent(u) and _agent_owns_farm(u, enr.farm))
+    can_delete = scope.is_admin or scope.manages(enr.farm_id)
     if not can_delete:
         return _err()
-    if _is_agent(u):
+    if scope.is_agent:
         enr.is_active = False
-        enr.save(update_fields=["is_active"])
+        enr.save(update_fields=["is_active", "updated_at"])
         return Response({"detail": "Enrollment deactivated."}, status=200)
     enr.delete()
     return Response({"detail": "Enrollment deleted."}, status=204)
 
+# Exports
+@swagger_auto_schema(method="get", responses={200: ExportJobSerializer(many=True)})
+@swagger_auto_schema(method="post", request_body=ExportJobSerializer, responses={202: ExportJobSerializer})
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticated])
+def export_list_create(request):
+    u = request.user
+    scope = _scope(request)
+    if request.method == "GET":
+        jobs = ExportJob.objects.all() if scope.is_admin else ExportJob.objects.filter(requested_by=u)
+        return _paginate(jobs.order_by("-created_at", "-id"), request, ExportJobSerializer)
+
+    ser = ExportJobSerializer(data=request.data)
+    if not ser.is_valid():
+        return Response(ser.errors, status=400)
+    # rows are scoped to the requester when the file is written
+    job = start_export(ser.save(requested_by=u))
+    return Response(ExportJobSerializer(job).data, status=202)
+
+def _export_for(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk)
+    if not (_scope(request).is_admin or job.requested_by_id == request.user.id):
+        raise NotFound()
+    return job
+
+@swagger_auto_schema(method="get", responses={200: ExportJobSerializer})
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_detail(request, pk):
+    return Response(ExportJobSerializer(_export_for(request, pk)).data)
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_download(request, pk):
+    job = _export_for(request, pk)
+    if job.status != "done":
+        return Response({"detail": f"Export is {job.status}."}, status=409)
+    return FileResponse(job.file.open("rb"), as_attachment=True, filename=os.path.basename(job.file.name))
+
+# Imports
+@swagger_auto_schema(
+    method="post",
+    manual_parameters=[openapi.Parameter("file", openapi.IN_FORM, type=openapi.TYPE_FILE, required=True,
+                                         description="CSV with a header row; see the import_csv command")],
+)
+@api_view(["POST"])
+@parser_classes([MultiPartParser])
+@permission_classes([IsAuthenticated, IsAdminOrAgent])
+def import_upload(request, kind):
+    upload = request.FILES.get("file")
+    if upload is None:
+        return Response({"file": ["No file was submitted."]}, status=400)
+    try:
+        stats = import_csv(kind, io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline=""),
+                           user=request.user)
+    except ImportFileError as e:
+        return Response({"detail": str(e)}, status=400)
+    return Response(stats.as_dict(), status=201 if stats.saved else 400)
+
+# Offline sync
+@swagger_auto_schema(
+    method="get",
+    manual_parameters=[
+        openapi.Parameter("since", openapi.IN_QUERY, type=openapi.TYPE_STRING, format=openapi.FORMAT_DATETIME,
+                          description="`until` of the last complete sync; omit for a full snapshot"),
+        openapi.Parameter("scope", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description="`scope` of the last complete sync"),
+        openapi.Parameter("cursor", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description="Continuation token; follow `next` rather than building it"),
+    ],
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def sync(request):
+    """
+    Farms, cows, milk, activities and enrollments the caller can see that
+    changed since ``since``, and the ids deleted since (or moved out of
+    view). Without ``since``, when it is older than the tombstones kept, or
+    when the caller's farms changed since ``scope`` was issued, the response
+    is a full snapshot marked ``reset``. Follow ``next`` until it is null,
+    then keep ``until`` and ``scope`` for the next sync.
+    """
+    scope = _scope(request)
+    fingerprint = delta_sync.fingerprint(scope)
+    state = None
+    token = request.query_params.get("cursor")
+    if token:
+        state = delta_sync.decode_cursor(token)
+        if state is None:
+            raise NotFound("Invalid cursor.")
+        if state["scope"] != fingerprint:
+            state = None  # the view changed between pages; start over
+    if state is None:
+        since = None
+        raw = request.query_params.get("since")
+        if raw and not token:
+            # an unencoded "+00:00" arrives as " 00:00"
+            try:
+                since = parse_datetime(raw.replace(" ", "+"))
+            except ValueError:  # well formed, but not a real date
+                since = None
+            if since is None:
+                return Response({"since": ["Expected an ISO 8601 timestamp."]}, status=400)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, dt_timezone.utc)
+            if (request.query_params.get("scope", fingerprint) != fingerprint
+                    or since < delta_sync.tombstone_horizon()):
+                since = None
+        state = {
+            "since": delta_sync.delta_start(since) if since else None,
+            "until": timezone.now(),
+            "scope": fingerprint,
+            "positions": {},
+        }
+
+    changes, deleted, positions = delta_sync.changes(scope, state["since"], state["until"], state["positions"])
+    next_url = None
+    if positions is not None:
+        next_url = replace_query_param(request.build_absolute_uri(), "cursor",
+                                       delta_sync.encode_cursor({**state, "positions": positions}))
+    return Response({
+        "until": state["until"],
+        "scope": fingerprint,
+        "reset": state["since"] is None,
+        "changes": changes,
+        "deleted": deleted or {name: [] for name in changes},
+        "next": next_url,
+    })
+
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
     def post(self, request):
@@ -480,9 +1022,28 @@ class LogoutView(APIView):
             token.blacklist() 
         except Exception:
             return Response({"detail": "invalid refresh token"}, status=400)
+        _revoke_access_token(request)
         return Response(status=status.HTTP_205_RESET_CONTENT)
 
 
+def _revoke_access_token(request):
+    """
+    Blacklist the access token used for this request as well, so services
+    that check the blacklist (the reporting API) stop accepting it now
+    rather than at its expiry.
+    """
+    access = request.auth
+    jti = jwt_settings.JTI_CLAIM
+    if access is None or jti not in access:
+        return
+    outstanding, _ = OutstandingToken.objects.get_or_create(
+        jti=access[jti],
+        defaults={"user": request.user, "token": str(access),
+                  "created_at": access.current_time, "expires_at": datetime_from_epoch(access["exp"])},
+    )
+    BlacklistedToken.objects.get_or_create(token=outstanding)
+
+
 class RegisterView(CreateAPIView):
     permission_classes = [AllowAny]
     serializer_class = RegistrationSerializer
@@ -135,6 +135,55 @@ STATIC_URL = 'static/'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
 
+# Cache
+# Local memory by default; point FARMHUB_CACHE_BACKEND/LOCATION at a shared
+# backend (Redis, Memcached, file) when the core and reporting services run
+# as separate processes so that write-driven invalidation reaches both.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("FARMHUB_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("FARMHUB_CACHE_LOCATION", "farmhub"),
+    }
+}
+FARMHUB_REPORT_CACHE = "default"
+FARM_SUMMARY_CACHE_TIMEOUT = 60  # seconds; upper bound on staleness
+ANALYTICS_CACHE_TIMEOUT = 300  # seconds; milk writes invalidate sooner
+
+# /api/exports/ files (under MEDIA_ROOT/exports): "thread" writes them on
+# EXPORT_WORKERS threads in the web process; "db" only queues them in the
+# ExportJob table for `manage.py run_exports` workers, which survive web
+# restarts. A job running for EXPORT_STALE_AFTER seconds is taken as orphaned
+# and queued again.
+EXPORT_BACKEND = os.environ.get("FARMHUB_EXPORT_BACKEND", "thread")
+EXPORT_WORKERS = int(os.environ.get("FARMHUB_EXPORT_WORKERS", 2))
+EXPORT_STALE_AFTER = int(os.environ.get("FARMHUB_EXPORT_STALE_AFTER", 3600))
+
+# Threads (and so database connections) the reporting service uses for ORM calls
+REPORTING_DB_WORKERS = int(os.environ.get("FARMHUB_REPORTING_DB_WORKERS", 8))
+# Verified-token cache of the reporting service (entries, principal lifetime
+# in seconds, and how often revoked token ids are reloaded)
+REPORTING_TOKEN_CACHE_SIZE = 10_000
+REPORTING_PRINCIPAL_TTL = 300
+REPORTING_BLACKLIST_REFRESH = 30
+# Queued reports (/reports/jobs): "process" runs them on a pool of
+# REPORTING_JOB_WORKERS processes inside the reporting service; "db" only
+# queues them in the ReportJob table for `python -m reporting.jobs` workers.
+REPORTING_JOB_BACKEND = os.environ.get("FARMHUB_REPORTING_JOB_BACKEND", "process")
+REPORTING_JOB_WORKERS = int(os.environ.get("FARMHUB_REPORTING_JOB_WORKERS", 2))
+# A job running for longer than this (seconds) lost its worker and is queued again
+REPORTING_JOB_STALE_AFTER = int(os.environ.get("FARMHUB_REPORTING_JOB_STALE_AFTER", 3600))
+
+# Liters of milk an enrollment needs for 100% progress and its certificate
+ENROLLMENT_YIELD_TARGET = float(os.environ.get("FARMHUB_ENROLLMENT_YIELD_TARGET", 1000))
+
+# Milk records older than this move to ArchivedMilkProduction (manage.py archive_milk)
+MILK_ARCHIVE_AFTER_DAYS = int(os.environ.get("FARMHUB_MILK_ARCHIVE_AFTER_DAYS", 730))
+
+# Days deletes are kept for /api/sync/ (manage.py prune_tombstones); clients
+# that last synced before that get a full snapshot instead of a delta
+SYNC_TOMBSTONE_DAYS = int(os.environ.get("FARMHUB_SYNC_TOMBSTONE_DAYS", 90))
+SYNC_PAGE_SIZE = 1000  # rows per model per /api/sync/ page
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -43,8 +43,9 @@ urlpatterns = [
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/token/verify/", TokenVerifyView.as_view(), name="token_verify"),
-    path('api-auth/', include('rest_framework.urls')),
+    # ahead of rest_framework.urls, whose own logout/ would otherwise shadow it
     path('api-auth/logout/', LogoutView.as_view(), name='auth_logout'),
+    path('api-auth/', include('rest_framework.urls')),
     path("api/", include("core.urls")),
     path("swagger/", schema_view.with_ui("swagger", cache_timeout=0), name="schema-swagger-ui"),
     path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
@@ -0,0 +1,205 @@
+from datetime import date
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+import pandas as pd
+
+# reporting.database configures Django, so it is imported before core
+from reporting.database import _milk_production_queryset, _scope_key
+from core.caching import cached_analytics
+from core.models import MilkProduction, ArchivedMilkProduction
+
+# Per-cow milk analytics for the reporting service. A cow's (or a whole
+# farm's) series is read in one UNION ALL query over hot and archived milk,
+# loaded into a DataFrame and computed with vectorized pandas/NumPy
+# operations grouped by cow; results are cached per (cow or farm, range,
+# parameters, caller scope) until the next milk write.
+
+DEFAULT_WINDOW = 7
+DEFAULT_Z_THRESHOLD = 3.0
+# readings a baseline window needs before a z-score is computed
+MIN_BASELINE_READINGS = 3
+
+SERIES_COLUMNS = ["cow_id", "date", "quantity"]
+
+
+def load_milk_series(
+    cow_id: Optional[int] = None,
+    farm_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    principal=None,
+) -> pd.DataFrame:
+    """One query for the (cow_id, date, quantity) rows, sorted by cow and date."""
+    hot, archived = (
+        _milk_production_queryset(farm_id, None, start_date, end_date, model, principal)
+        .filter(**({"cow_id": cow_id} if cow_id else {}))
+        .order_by()
+        .values_list(*SERIES_COLUMNS)
+        for model in (MilkProduction, ArchivedMilkProduction)
+    )
+    rows = list(hot.union(archived, all=True).order_by("cow_id", "date"))
+    frame = pd.DataFrame.from_records(rows, columns=SERIES_COLUMNS)
+    frame["date"] = pd.to_datetime(frame["date"])
+    frame["quantity"] = frame["quantity"].astype("float64")
+    return frame
+
+
+def add_rolling_stats(frame: pd.DataFrame, window: int = DEFAULT_WINDOW,
+                      z_threshold: float = DEFAULT_Z_THRESHOLD) -> pd.DataFrame:
+    """
+    Add per-cow ``rolling_mean`` (the ``window`` calendar days ending on the
+    reading), ``change`` (against the previous day, when there is one) and
+    ``z_score``/``anomaly`` against the ``window`` days before the reading,
+    so a sudden drop is not hidden by its own value.
+    """
+    frame = frame.sort_values(["cow_id", "date"], ignore_index=True)
+    if frame.empty:
+        return frame.assign(rolling_mean=np.nan, change=np.nan, z_score=np.nan, anomaly=False)
+    span = f"{window}D"
+    by_cow = frame.groupby("cow_id", sort=False)
+
+    def rolling(closed):
+        # groupby().rolling() keeps the group order, which matches the sorted frame
+        return frame.groupby("cow_id", sort=False).rolling(span, on="date", closed=closed)["quantity"]
+
+    frame["rolling_mean"] = rolling("right").mean().to_numpy()
+    baseline = rolling("left")
+    base_mean = baseline.mean().to_numpy()
+    base_std = baseline.std().to_numpy()
+    base_count = baseline.count().to_numpy()
+
+    previous_day = by_cow["date"].shift(1)
+    consecutive = (frame["date"] - previous_day) == pd.Timedelta(days=1)
+    frame["change"] = (frame["quantity"] - by_cow["quantity"].shift(1)).where(consecutive)
+
+    quantity = frame["quantity"].to_numpy()
+    usable = (base_count >= MIN_BASELINE_READINGS) & (base_std > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(usable, (quantity - base_mean) / base_std, np.nan)
+    frame["z_score"] = z
+    frame["anomaly"] = np.abs(np.nan_to_num(z)) >= z_threshold
+    return frame
+
+
+def fit_lactation_curve(frame: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Weekly mean yield by week of lactation and a least-squares fit of Wood's
+    curve ``y = a * t**b * exp(-c * t)`` for one cow. There are no calving
+    records, so day 1 of the lactation is the cow's first reading in range.
+    """
+    if frame.empty:
+        return {"weekly": [], "wood": None}
+    days = ((frame["date"] - frame["date"].min()).dt.days + 1).to_numpy()
+    quantity = frame["quantity"].to_numpy()
+    weekly = pd.Series(quantity).groupby((days - 1) // 7 + 1).mean()
+    curve = {
+        "weekly": [
+            {"week": int(week), "mean_quantity": round(float(mean), 3)}
+            for week, mean in weekly.items()
+        ],
+        "wood": None,
+    }
+
+    positive = quantity > 0
+    if positive.sum() < 3 or np.unique(days[positive]).size < 3:
+        return curve
+    t = days[positive].astype("float64")
+    # ln y = ln a + b ln t - c t
+    design = np.column_stack([np.ones_like(t), np.log(t), -t])
+    (ln_a, b, c), *_ = np.linalg.lstsq(design, np.log(quantity[positive]), rcond=None)
+    wood = {"a": round(float(np.exp(ln_a)), 4), "b": round(float(b), 4), "c": round(float(c), 4),
+            "peak_day": None, "peak_quantity": None}
+    if b > 0 and c > 0:
+        peak = b / c
+        wood["peak_day"] = round(float(peak), 1)
+        wood["peak_quantity"] = round(float(np.exp(ln_a) * peak ** b * np.exp(-c * peak)), 3)
+    curve["wood"] = wood
+    return curve
+
+
+def _series_rows(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    out = frame[["date", "quantity", "rolling_mean", "change", "z_score", "anomaly"]].copy()
+    out["date"] = out["date"].dt.date.map(date.isoformat)
+    for column in ("quantity", "rolling_mean", "change", "z_score"):
+        out[column] = out[column].round(3)
+    out = out.astype(object).where(out.notna(), None)
+    return out.to_dict("records")
+
+
+def _cow_analytics(cow_id, start_date, end_date, window, z_threshold, principal) -> Dict[str, Any]:
+    frame = add_rolling_stats(
+        load_milk_series(cow_id=cow_id, start_date=start_date, end_date=end_date, principal=principal),
+        window, z_threshold,
+    )
+    return {
+        "cow_id": cow_id,
+        "window": window,
+        "z_threshold": z_threshold,
+        "days": len(frame),
+        "anomalies": int(frame["anomaly"].sum()),
+        "series": _series_rows(frame),
+        "lactation": fit_lactation_curve(frame),
+    }
+
+
+def get_cow_analytics(
+    cow_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    window: int = DEFAULT_WINDOW,
+    z_threshold: float = DEFAULT_Z_THRESHOLD,
+    principal=None,
+) -> Dict[str, Any]:
+    """Daily series with rolling stats and anomaly flags, plus the lactation curve, for one cow."""
+    return cached_analytics(
+        lambda: _cow_analytics(cow_id, start_date, end_date, window, z_threshold, principal),
+        "cow", cow_id, start_date, end_date, window, z_threshold, _scope_key(principal),
+    )
+
+
+def _farm_analytics(farm_id, start_date, end_date, window, z_threshold, principal) -> Dict[str, Any]:
+    frame = add_rolling_stats(
+        load_milk_series(farm_id=farm_id, start_date=start_date, end_date=end_date, principal=principal),
+        window, z_threshold,
+    )
+    by_cow = frame.groupby("cow_id", sort=True)
+    cows = pd.DataFrame({
+        "days": by_cow.size(),
+        "mean_quantity": by_cow["quantity"].mean().round(3),
+        "latest_rolling_mean": by_cow["rolling_mean"].last().round(3),
+        "anomalies": by_cow["anomaly"].sum(),
+    })
+    flagged = frame[frame["anomaly"]].sort_values(["date", "cow_id"], ascending=[False, True])
+    anomalies = flagged[["cow_id", "date", "quantity", "rolling_mean", "z_score"]].copy()
+    anomalies["date"] = anomalies["date"].dt.date.map(date.isoformat)
+    anomalies[["rolling_mean", "z_score"]] = anomalies[["rolling_mean", "z_score"]].round(3)
+    return {
+        "farm_id": farm_id,
+        "window": window,
+        "z_threshold": z_threshold,
+        "cows": [
+            {"cow_id": int(cow_id), "days": int(row.days), "mean_quantity": float(row.mean_quantity),
+             "latest_rolling_mean": float(row.latest_rolling_mean), "anomalies": int(row.anomalies)}
+            for cow_id, row in cows.iterrows()
+        ],
+        "anomalies": [
+            {**row, "cow_id": int(row["cow_id"]), "quantity": float(row["quantity"])}
+            for row in anomalies.to_dict("records")
+        ],
+    }
+
+
+def get_farm_analytics(
+    farm_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    window: int = DEFAULT_WINDOW,
+    z_threshold: float = DEFAULT_Z_THRESHOLD,
+    principal=None,
+) -> Dict[str, Any]:
+    """Per-cow averages and anomaly counts for a farm, and its anomalies newest first."""
+    return cached_analytics(
+        lambda: _farm_analytics(farm_id, start_date, end_date, window, z_threshold, principal),
+        "farm", farm_id, start_date, end_date, window, z_threshold, _scope_key(principal),
+    )
@@ -0,0 +1,169 @@
+"""
+Local JWT verification for the reporting service.
+
+Tokens are checked in-process with the same SIMPLE_JWT settings Django uses.
+A verified token is resolved once into a ``Principal`` (user id, role and
+managed farm ids) and kept in an LRU keyed by the token's hash until the
+token expires or REPORTING_PRINCIPAL_TTL passes, whichever comes first.
+Revoked token ids are held in memory and reloaded from the simplejwt
+blacklist at most every REPORTING_BLACKLIST_REFRESH seconds.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import FrozenSet, Optional
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import update_last_login
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from core.models import Farm, User
+
+
+class InvalidToken(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Principal:
+    user_id: int
+    username: str
+    role: str
+    farm_ids: FrozenSet[int]  # farms an agent manages; empty for other roles
+    jti: str
+    expires_at: float  # epoch seconds; when this cache entry stops being trusted
+
+    is_admin = property(lambda self: self.role == "admin")
+    is_agent = property(lambda self: self.role == "agent")
+    is_farmer = property(lambda self: self.role == "farmer")
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class RevokedTokens:
+    """In-memory copy of the blacklisted, not yet expired token ids."""
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._jtis: FrozenSet[str] = frozenset()
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds
+
+    def reload(self) -> None:
+        self._jtis = frozenset(
+            BlacklistedToken.objects
+            .filter(token__expires_at__gt=timezone.now())
+            .values_list("token__jti", flat=True)
+        )
+        self._loaded_at = time.monotonic()
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._jtis
+
+
+class TokenVerifier:
+    def __init__(self, max_entries=None, principal_ttl=None, blacklist_refresh=None):
+        self.max_entries = max_entries or getattr(settings, "REPORTING_TOKEN_CACHE_SIZE", 10_000)
+        self.principal_ttl = principal_ttl or getattr(settings, "REPORTING_PRINCIPAL_TTL", 300)
+        self.revoked = RevokedTokens(blacklist_refresh or getattr(settings, "REPORTING_BLACKLIST_REFRESH", 30))
+        self._principals: "OrderedDict[str, Principal]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "rejected": 0}
+
+    def cached(self, token: str) -> Optional[Principal]:
+        """
+        The principal for ``token`` if it can be answered from memory alone;
+        ``None`` means ``verify`` has to run (it may touch the database).
+        """
+        if self.revoked.stale:
+            return None
+        key = _token_key(token)
+        with self._lock:
+            principal = self._principals.get(key)
+            if principal is None or principal.expires_at <= time.time():
+                return None
+            if principal.jti in self.revoked:
+                self._principals.pop(key, None)
+                self._stats["rejected"] += 1
+                raise InvalidToken("Token has been revoked")
+            self._principals.move_to_end(key)
+            self._stats["hits"] += 1
+            return principal
+
+    def verify(self, token: str) -> Principal:
+        """Full check: signature, expiry, type, blacklist and user state."""
+        if self.revoked.stale:
+            self.revoked.reload()
+        principal = self.cached(token)
+        if principal is not None:
+            return principal
+        with self._lock:
+            self._stats["misses"] += 1
+        try:
+            claims = AccessToken(token)
+        except TokenError as exc:
+            self._reject()
+            raise InvalidToken(str(exc))
+        jti = claims.get(jwt_settings.JTI_CLAIM)
+        if jti in self.revoked:
+            self._reject()
+            raise InvalidToken("Token has been revoked")
+        user = (User.objects
+                .filter(**{jwt_settings.USER_ID_FIELD: claims.get(jwt_settings.USER_ID_CLAIM)}, is_active=True)
+                .only("id", "username", "role")
+                .first())
+        if user is None:
+            self._reject()
+            raise InvalidToken("User not found or inactive")
+        farm_ids = (frozenset(Farm.objects.filter(agent=user).values_list("id", flat=True))
+                    if user.role == "agent" else frozenset())
+        principal = Principal(
+            user_id=user.id, username=user.username, role=user.role, farm_ids=farm_ids, jti=jti,
+            expires_at=min(float(claims["exp"]), time.time() + self.principal_ttl),
+        )
+        key = _token_key(token)
+        with self._lock:
+            self._principals[key] = principal
+            self._principals.move_to_end(key)
+            while len(self._principals) > self.max_entries:
+                self._principals.popitem(last=False)
+        return principal
+
+    def _reject(self):
+        with self._lock:
+            self._stats["rejected"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._principals)}
+
+    def clear(self):
+        with self._lock:
+            self._principals.clear()
+        self.revoked = RevokedTokens(self.revoked.refresh_seconds)
+
+
+verifier = TokenVerifier()
+
+
+def issue_access_token(username: str, password: str) -> Optional[str]:
+    """Check credentials and mint an access token in-process; ``None`` on bad credentials."""
+    user = authenticate(username=username, password=password)
+    if user is None or not user.is_active:
+        return None
+    refresh = RefreshToken.for_user(user)
+    if jwt_settings.UPDATE_LAST_LOGIN:
+        update_last_login(None, user)
+    return str(refresh.access_token)
@@ -1,7 +1,7 @@
 import os
 import sys
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator
 from datetime import date
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]  
@@ -13,22 +13,66 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "farmhub.settings")
 import django  
 django.setup()
 
-from django.db.models import Sum, Q  
+from django.db.models import Sum, Q, Count, F
+from django.db.models.functions import TruncWeek, TruncMonth
+from core.caching import cached_farm_summary
 from core.models import ( 
     User,
     Farm,
     Cow,
     Activity,
     MilkProduction,
+    ArchivedMilkProduction,
+    DailyMilkRollup,
 )
 
 
-def get_farm_summary() -> Dict[str, Any]:
-   
-    total_farms = Farm.objects.count()
-    total_farmers = User.objects.filter(role="farmer").count()
-    total_cows = Cow.objects.count()
-    total_milk = MilkProduction.objects.aggregate(total=Sum("quantity"))["total"] or 0
+# Row scoping. ``principal`` is the caller (a reporting.auth.Principal); every
+# report narrows its querysets with it before aggregating, following the DRF
+# list views: admins see everything, agents the rows of the farms they manage,
+# farmers the rows they recorded. ``None`` means an internal, unscoped caller.
+
+def _scoped(qs, principal):
+    if principal is None or principal.is_admin:
+        return qs
+    if principal.is_agent:
+        return qs.filter(farm_id__in=principal.farm_ids)
+    if principal.is_farmer:
+        return qs.filter(recorded_by_id=principal.user_id)
+    return qs.none()
+
+
+def _scope_key(principal) -> str:
+    if principal is None or principal.is_admin:
+        return "all"
+    return f"{principal.role}:{principal.user_id}"
+
+
+def get_farm_summary(principal=None) -> Dict[str, Any]:
+    """Farm/farmer/cow/milk totals, cached until one of those tables is written."""
+    return cached_farm_summary(lambda: _compute_farm_summary(principal), scope=_scope_key(principal))
+
+
+def _compute_farm_summary(principal=None) -> Dict[str, Any]:
+
+    farms = Farm.objects.all()
+    farmers = User.objects.filter(role="farmer")
+    cows = Cow.objects.all()
+    if principal is not None and principal.is_agent:
+        farms = farms.filter(id__in=principal.farm_ids)
+        farmers = farmers.filter(enrollments__farm__in=principal.farm_ids).distinct()
+        cows = cows.filter(farm__in=principal.farm_ids)
+    elif principal is not None and principal.is_farmer:
+        farms = farms.filter(enrollments__user_id=principal.user_id, enrollments__is_active=True).distinct()
+        farmers = farmers.filter(id=principal.user_id)
+        cows = cows.filter(farmer_id=principal.user_id)
+    elif principal is not None and not principal.is_admin:
+        farms, farmers, cows = farms.none(), farmers.none(), cows.none()
+
+    total_farms = farms.count()
+    total_farmers = farmers.count()
+    total_cows = cows.count()
+    total_milk = _milk_total(principal)
 
     return {
         "farms": total_farms,
@@ -38,21 +82,59 @@ def get_farm_summary() -> Dict[str, Any]:
     }
 
 
-def get_milk_production_report(
+def _milk_total(principal=None) -> float:
+    if principal is not None and principal.is_farmer:
+        # the rollup does not keep who recorded a reading, so a farmer's total
+        # is summed over the hot and archived records they recorded
+        hot, archived = (
+            _scoped(model.objects.all(), principal)
+            .order_by().values("recorded_by_id").annotate(total=Sum("quantity"))
+            .values_list("total", flat=True)
+            for model in (MilkProduction, ArchivedMilkProduction)
+        )
+        return sum(total or 0 for total in hot.union(archived, all=True))
+    return _rollup_queryset(principal=principal).aggregate(total=Sum("total_quantity"))["total"] or 0
+
+
+MILK_REPORT_COLUMNS = (
+    "id",
+    "date",
+    "quantity",
+    "cow_id",
+    "cow_tag_number",
+    "farm_id",
+    "farm_name",
+    "farmer_id",
+    "farmer_username",
+)
+
+MILK_REPORT_LOOKUPS = (
+    "id",
+    "date",
+    "quantity",
+    "cow_id",
+    "cow__tag_number",
+    "farm_id",
+    "farm__name",
+    "recorded_by_id",
+    "recorded_by__username",
+)
+
+STREAM_CHUNK_SIZE = 2000
+
+
+def _milk_production_queryset(
     farm_id: Optional[int] = None,
     farmer_id: Optional[int] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-) -> Dict[str, Any]:
-    
-    qs = (
-        MilkProduction.objects
-        .select_related("cow", "recorded_by", "cow__farm")
-        .all()
-    )
+    model=MilkProduction,
+    principal=None,
+):
+    qs = _scoped(model.objects.all(), principal)
 
     if farm_id:
-        qs = qs.filter(cow__farm_id=farm_id)
+        qs = qs.filter(farm_id=farm_id)
 
     if farmer_id:
         qs = qs.filter(
@@ -64,30 +146,183 @@ def get_milk_production_report(
     if end_date:
         qs = qs.filter(date__lte=end_date)
 
-    total_liters = qs.aggregate(total=Sum("quantity"))["total"] or 0
-    count = qs.count()
+    return qs
 
-    items: List[Dict[str, Any]] = []
-    for mp in qs: 
-        cow = mp.cow
-        farm = cow.farm if cow else None
-        farmer = mp.recorded_by
 
-        items.append({
-            "id": mp.id,
-            "date": mp.date.isoformat() if mp.date else None,
-            "quantity": float(mp.quantity),
-            "cow_id": cow.id if cow else None,
-            "cow_tag_number": getattr(cow, "tag_number", None),
-            "farm_id": farm.id if farm else None,
-            "farm_name": getattr(farm, "name", None),
-            "farmer_id": farmer.id if farmer else None,
-            "farmer_username": getattr(farmer, "username", None),
-        })
+def iter_milk_production_rows(
+    farm_id: Optional[int] = None,
+    farmer_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    principal=None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield report rows from a server-side cursor, ``chunk_size`` rows at a time.
+    Hot and archived records are read in one UNION ALL query.
+    """
+    hot, archived = (
+        _milk_production_queryset(farm_id, farmer_id, start_date, end_date, model, principal)
+        .order_by()
+        .values_list(*MILK_REPORT_LOOKUPS)
+        for model in (MilkProduction, ArchivedMilkProduction)
+    )
+    qs = hot.union(archived, all=True).order_by("-date", "-id")
+    for values in qs.iterator(chunk_size=chunk_size):
+        row = dict(zip(MILK_REPORT_COLUMNS, values))
+        row["date"] = row["date"].isoformat() if row["date"] else None
+        row["quantity"] = float(row["quantity"])
+        yield row
+
+
+class MilkProductionStream:
+    """
+    Single-pass milk report: iterate it for rows, then read ``count`` and
+    ``total_liters``, which are accumulated while the rows go by.
+    """
+
+    def __init__(self, rows: Iterator[Dict[str, Any]]):
+        self._rows = rows
+        self.count = 0
+        self.total_liters = 0.0
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in self._rows:
+            self.count += 1
+            self.total_liters += row["quantity"]
+            yield row
+
+    def summary(self) -> Dict[str, Any]:
+        return {"count": self.count, "total_liters": float(self.total_liters)}
+
+
+def stream_milk_production_report(
+    farm_id: Optional[int] = None,
+    farmer_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    principal=None,
+) -> MilkProductionStream:
+    return MilkProductionStream(
+        iter_milk_production_rows(farm_id, farmer_id, start_date, end_date, chunk_size, principal)
+    )
+
+
+def get_milk_production_report(
+    farm_id: Optional[int] = None,
+    farmer_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    principal=None,
+) -> Dict[str, Any]:
+
+    stream = stream_milk_production_report(farm_id, farmer_id, start_date, end_date, principal=principal)
+    items: List[Dict[str, Any]] = list(stream)
+
+    return {
+        **stream.summary(),
+        "items": items,
+    }
+
+
+# group_by -> {output column: model field name or ORM expression}; pushed into GROUP BY
+MILK_GROUPINGS: Dict[str, Dict[str, Any]] = {
+    "farm": {"farm_id": "farm_id", "farm_name": F("farm__name")},
+    "cow": {"cow_id": "cow_id", "cow_tag_number": F("cow__tag_number")},
+    "farmer": {"farmer_id": F("recorded_by_id"), "farmer_username": F("recorded_by__username")},
+    "day": {"period": F("date")},
+    "week": {"period": TruncWeek("date")},
+    "month": {"period": TruncMonth("date")},
+}
+
+
+# the same groupings over DailyMilkRollup; "farmer" (recorded_by) is not kept there
+ROLLUP_GROUPINGS: Dict[str, Dict[str, Any]] = {
+    "farm": {"farm_id": "farm_id", "farm_name": F("farm__name")},
+    "cow": {"cow_id": "cow_id", "cow_tag_number": F("cow__tag_number")},
+    "day": {"period": F("date")},
+    "week": {"period": TruncWeek("date")},
+    "month": {"period": TruncMonth("date")},
+}
+
+
+def _group_values(qs, columns: Dict[str, Any]):
+    return qs.order_by().values(
+        *[name for name, expr in columns.items() if isinstance(expr, str)],
+        **{name: expr for name, expr in columns.items() if not isinstance(expr, str)},
+    )
+
+
+def _rollup_queryset(
+    farm_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    principal=None,
+):
+    # farmers are scoped by recorder, which the rollup does not keep; they read records
+    qs = _scoped(DailyMilkRollup.objects.all(), principal)
+    if farm_id:
+        qs = qs.filter(farm_id=farm_id)
+    if start_date:
+        qs = qs.filter(date__gte=start_date)
+    if end_date:
+        qs = qs.filter(date__lte=end_date)
+    return qs
+
+
+def get_milk_production_grouped(
+    group_by: str,
+    farm_id: Optional[int] = None,
+    farmer_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    principal=None,
+) -> Dict[str, Any]:
+    """
+    Per-group count/sum/average of milk production, computed by the database.
+    Reads the daily rollup whenever the grouping and filters allow it, and
+    hot plus archived records otherwise. The rollup does not keep who
+    recorded a reading, so farmers (scoped by recorder) read records.
+    """
+    if group_by not in MILK_GROUPINGS:
+        raise ValueError(f"group_by must be one of: {', '.join(MILK_GROUPINGS)}")
+
+    by_recorder = farmer_id is not None or (principal is not None and principal.is_farmer)
+    if not by_recorder and group_by in ROLLUP_GROUPINGS:
+        columns = ROLLUP_GROUPINGS[group_by]
+        qs = (
+            _group_values(_rollup_queryset(farm_id, start_date, end_date, principal), columns)
+            .annotate(count=Sum("record_count"), total_liters=Sum("total_quantity"))
+            .order_by(*columns)
+        )
+    else:
+        # grouped separately over hot and archived rows in one UNION ALL query;
+        # a group present in both comes back as two adjacent rows, merged below
+        columns = MILK_GROUPINGS[group_by]
+        hot, archived = (
+            _group_values(_milk_production_queryset(farm_id, farmer_id, start_date, end_date, model, principal), columns)
+            .annotate(count=Count("id"), total_liters=Sum("quantity"))
+            for model in (MilkProduction, ArchivedMilkProduction)
+        )
+        qs = hot.union(archived, all=True).order_by(*columns)
+
+    items: List[Dict[str, Any]] = []
+    for row in qs:
+        row["total_liters"] = float(row["total_liters"] or 0)
+        if items and all(items[-1][c] == row[c] for c in columns):
+            items[-1]["count"] += row["count"]
+            items[-1]["total_liters"] += row["total_liters"]
+            continue
+        items.append(row)
+    for row in items:
+        if "period" in row:
+            row["period"] = row["period"].isoformat() if row["period"] else None
+        row["average_liters"] = row["total_liters"] / row["count"] if row["count"] else 0.0
 
     return {
-        "count": count,
-        "total_liters": float(total_liters),
+        "group_by": group_by,
+        "count": len(items),
         "items": items,
     }
 
@@ -99,16 +334,18 @@ def get_recent_activities(
     cow_id: Optional[int] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
+    principal=None,
 ) -> List[Dict[str, Any]]:
    
-    qs = (
+    qs = _scoped(
         Activity.objects
-        .select_related("cow", "recorded_by", "cow__farm")
-        .order_by("-date", "-created_at")
+        .select_related("cow", "recorded_by", "farm")
+        .order_by("-date", "-created_at"),
+        principal,
     )
 
     if farm_id:
-        qs = qs.filter(cow__farm_id=farm_id)
+        qs = qs.filter(farm_id=farm_id)
 
     if farmer_id:
         qs = qs.filter(
@@ -128,7 +365,7 @@ def get_recent_activities(
     items: List[Dict[str, Any]] = []
     for a in qs:
         cow = a.cow
-        farm = cow.farm if cow else None
+        farm = a.farm
         user = a.recorded_by
 
         items.append({
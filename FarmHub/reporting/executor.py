@@ -0,0 +1,107 @@
+"""
+Bounded thread pool for the synchronous Django ORM work behind the async
+report endpoints. The pool size caps how many database connections the
+reporting process holds; the event loop itself never blocks on a query.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import wraps
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+# chunks buffered between the database thread and the response
+STREAM_QUEUE_CHUNKS = 8
+# how often a blocked producer checks whether the client went away
+_PRODUCER_POLL_SECONDS = 0.5
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_DONE = object()
+
+
+def db_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "REPORTING_DB_WORKERS", 8),
+                thread_name_prefix="reporting-db",
+            )
+        return _executor
+
+
+def shutdown_db_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _with_connection_upkeep(fn: Callable) -> Callable:
+    # pool threads are long-lived: drop connections past CONN_MAX_AGE or broken ones
+    @wraps(fn)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return run
+
+
+async def run_db(fn: Callable, *args, **kwargs):
+    """Await ``fn(*args, **kwargs)`` on the database pool."""
+    call = sync_to_async(_with_connection_upkeep(fn), thread_sensitive=False, executor=db_executor())
+    return await call(*args, **kwargs)
+
+
+async def stream_from_db(make_chunks: Callable[[], Iterator[str]]) -> AsyncIterator[str]:
+    """
+    Run ``make_chunks()`` to completion on one pool thread, so the whole
+    cursor lives on a single connection, and hand its chunks to the event
+    loop through a bounded queue. A slow client applies backpressure; a
+    client that disconnects stops the producer.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        pending = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                pending.result(timeout=_PRODUCER_POLL_SECONDS)
+                return True
+            except FutureTimeout:
+                if stopped.is_set():
+                    pending.cancel()
+                    return False
+
+    @_with_connection_upkeep
+    def produce():
+        try:
+            for chunk in make_chunks():
+                if stopped.is_set() or not put(chunk):
+                    return
+        except Exception as exc:
+            put(exc)
+            return
+        put(_DONE)
+
+    loop.run_in_executor(db_executor(), produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # a producer blocked on the full queue sees the flag within one poll
+        stopped.set()
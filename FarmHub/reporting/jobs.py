@@ -0,0 +1,263 @@
+"""
+Queued reports for the reporting service.
+
+A submitted report becomes a ReportJob row keyed by (report, parameters,
+caller scope) and the data version, a counter row that the write signals
+bump, so the API and reporting processes agree on it. Submitting the same
+thing again returns that row, and its stored result, until farms, cows,
+users or milk change. Results are written as gzipped JSON under MEDIA_ROOT.
+
+With REPORTING_JOB_BACKEND = "process" jobs run on a process pool owned by
+the reporting service. With "db" the table is the queue and separate
+workers (``python -m reporting.jobs``) claim pending rows, so no broker is
+needed either way. Workers touch a running job as they write its result; one
+not heard from for REPORTING_JOB_STALE_AFTER seconds lost its worker and
+is queued again.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+# reporting.database configures Django, so it is imported before core
+from reporting.database import (
+    _scope_key,
+    get_milk_production_grouped,
+    stream_milk_production_report,
+)
+from reporting.auth import Principal
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from core.models import DataVersion, ReportJob
+
+RESULT_DIR = "report-jobs"
+DATE_PARAMS = ("start_date", "end_date")
+# rows written between two heartbeats of a running job
+HEARTBEAT_ROWS = 5000
+
+
+def _milk_production(f, params, principal, heartbeat):
+    # written row by row, like the streaming endpoint; same document as format=json
+    stream = stream_milk_production_report(**params, principal=principal)
+    f.write('{"items": [')
+    for i, row in enumerate(stream):
+        f.write(("," if i else "") + json.dumps(row))
+        if (i + 1) % HEARTBEAT_ROWS == 0:
+            heartbeat()
+    summary = stream.summary()
+    f.write(f'], "count": {json.dumps(summary["count"])}, "total_liters": {json.dumps(summary["total_liters"])}}}')
+
+
+def _milk_production_grouped(f, params, principal, heartbeat):
+    # a single aggregate; nothing to beat for in between
+    json.dump(get_milk_production_grouped(**params, principal=principal), f)
+
+
+# report name -> writer of its JSON result, called as (file, params, principal, heartbeat)
+JOB_REPORTS = {
+    "milk-production": _milk_production,
+    "milk-production/grouped": _milk_production_grouped,
+}
+
+
+def _principal_payload(principal: Principal) -> Dict[str, Any]:
+    return {"user_id": principal.user_id, "username": principal.username,
+            "role": principal.role, "farm_ids": sorted(principal.farm_ids)}
+
+
+def _principal(payload: Dict[str, Any]) -> Principal:
+    return Principal(payload["user_id"], payload["username"], payload["role"],
+                     frozenset(payload["farm_ids"]), jti="", expires_at=0.0)
+
+
+def data_version() -> int:
+    """
+    Version of the data behind the job reports, stored in the database and
+    bumped by the farm, cow, user and milk write signals (and the bulk
+    writers), so every process reads the same one with a single lookup.
+    """
+    return DataVersion.current()
+
+
+def _dispatch(job_id: int) -> None:
+    if getattr(settings, "REPORTING_JOB_BACKEND", "process") == "process":
+        job_pool().submit(run_job, job_id)
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=getattr(settings, "REPORTING_JOB_STALE_AFTER", 3600))
+
+
+def requeue_stale_jobs(queryset=None) -> int:
+    """Put running jobs not touched for REPORTING_JOB_STALE_AFTER seconds (their worker died) back to pending."""
+    queryset = ReportJob.objects.all() if queryset is None else queryset
+    return queryset.filter(status="running", updated_at__lt=_stale_before()).update(
+        status="pending", updated_at=timezone.now())
+
+
+def _heartbeat(job_id: int) -> None:
+    ReportJob.objects.filter(pk=job_id, status="running").update(updated_at=timezone.now())
+
+
+def _job_key(report: str, params: Dict[str, Any], scope: str) -> str:
+    return hashlib.sha256(json.dumps([report, params, scope], sort_keys=True).encode()).hexdigest()
+
+
+def submit_job(report: str, params: Dict[str, Any], principal: Principal) -> Tuple[ReportJob, bool]:
+    """
+    Queue ``report`` for ``principal``, or return the job that already holds
+    (or is computing) it for the current data version. Returns (job, created).
+    """
+    if report not in JOB_REPORTS:
+        raise ValueError(f"report must be one of: {', '.join(JOB_REPORTS)}")
+    params = {k: v.isoformat() if isinstance(v, date) else v for k, v in params.items() if v is not None}
+    scope = _scope_key(principal)
+    key, version = _job_key(report, params, scope), data_version()
+    existing = ReportJob.objects.filter(key=key, data_version=version).exclude(status="failed").first()
+    if existing is not None:
+        if (existing.status == "running" and existing.updated_at < _stale_before()
+                and requeue_stale_jobs(ReportJob.objects.filter(pk=existing.pk))):
+            existing.status = "pending"
+            _dispatch(existing.pk)
+        return existing, False
+    try:
+        with transaction.atomic():
+            job = ReportJob.objects.create(
+                report=report, params=params, principal=_principal_payload(principal),
+                scope=scope, key=key, data_version=version,
+            )
+    except IntegrityError:
+        # submitted concurrently
+        return ReportJob.objects.filter(key=key, data_version=version).exclude(status="failed").get(), False
+    _dispatch(job.pk)
+    return job, True
+
+
+def get_job(job_id: int, principal: Principal) -> Optional[ReportJob]:
+    """The job, if it was run for the caller's scope (it holds exactly their rows)."""
+    return ReportJob.objects.filter(pk=job_id, scope=_scope_key(principal)).first()
+
+
+def job_status(job: ReportJob, version: Optional[int] = None) -> Dict[str, Any]:
+    """``version`` is the current data_version(), when the caller already has it."""
+    version = data_version() if version is None else version
+    return {
+        "id": job.id,
+        "report": job.report,
+        "params": job.params,
+        "status": job.status,
+        "error": job.error or None,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        # the data changed since; submitting again computes a fresh result
+        "stale": job.data_version != version,
+        "result_url": f"/reports/jobs/{job.id}/result" if job.status == "done" else None,
+    }
+
+
+def result_path(job: ReportJob) -> str:
+    return os.path.join(settings.MEDIA_ROOT, job.result.name)
+
+
+def run_job(job_id: int) -> None:
+    """Run a pending job and store its result; a job already claimed elsewhere is left alone."""
+    close_old_connections()
+    try:
+        now = timezone.now()
+        if not ReportJob.objects.filter(pk=job_id, status="pending").update(
+                status="running", started_at=now, updated_at=now):
+            return
+        job = ReportJob.objects.get(pk=job_id)
+        params = {k: date.fromisoformat(v) if k in DATE_PARAMS else v for k, v in job.params.items()}
+        relative = os.path.join(RESULT_DIR, f"job-{job.pk}.json.gz")
+        path = os.path.join(settings.MEDIA_ROOT, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # per process: a worker that was given up on may still be writing
+        partial = f"{path}.{os.getpid()}.part"
+        try:
+            with gzip.open(partial, "wt", encoding="utf-8") as f:
+                JOB_REPORTS[job.report](f, params, _principal(job.principal), lambda: _heartbeat(job.pk))
+            os.replace(partial, path)
+        except Exception as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+        else:
+            job.status, job.result.name = "done", relative
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "result", "error", "finished_at", "updated_at"])
+    finally:
+        close_old_connections()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def job_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawned, not forked: children must not share the parent's database connections
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, "REPORTING_JOB_WORKERS", 2),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def requeue_pending_jobs() -> int:
+    """Hand jobs left pending, or stuck running, by a previous run of the service to the pool."""
+    requeue_stale_jobs()
+    pending = list(ReportJob.objects.filter(status="pending").order_by("created_at").values_list("id", flat=True))
+    for job_id in pending:
+        job_pool().submit(run_job, job_id)
+    return len(pending)
+
+
+def shutdown_job_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def work(poll_seconds: float = 1.0, once: bool = False) -> None:
+    """DB-backed worker loop: reclaim stale jobs, claim the oldest pending job, run it, repeat."""
+    while True:
+        close_old_connections()
+        requeue_stale_jobs()
+        job_id = (ReportJob.objects.filter(status="pending").order_by("created_at")
+                  .values_list("id", flat=True).first())
+        if job_id is not None:
+            run_job(job_id)
+        elif once:
+            return
+        else:
+            time.sleep(poll_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued reporting jobs from the ReportJob table.")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--poll", type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+    parser.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+    args = parser.parse_args()
+    if args.processes == 1:
+        work(args.poll, args.once)
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        workers = [ctx.Process(target=work, args=(args.poll, args.once)) for _ in range(args.processes)]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
@@ -1,23 +1,39 @@
 
+from contextlib import asynccontextmanager
+
+from django.conf import settings
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-import requests
 
-app = FastAPI()
+from .report import router as report_router
+from .auth import issue_access_token
+from .executor import run_db, shutdown_db_executor
+from .jobs import requeue_pending_jobs, shutdown_job_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if getattr(settings, "REPORTING_JOB_BACKEND", "process") == "process":
+        await run_db(requeue_pending_jobs)
+    try:
+        yield
+    finally:
+        shutdown_job_pool()
+        shutdown_db_executor()
+
+
+app = FastAPI(lifespan=lifespan)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 @app.post("/token")
 async def login_for_token(form_data: OAuth2PasswordRequestForm = Depends()):
     """
-    Proxy login: call Django core to obtain a JWT access token.
+    Log in against the Django user table and mint the JWT access token
+    in-process, with the same SIMPLE_JWT settings as the core API.
     """
-    core_url = "http://127.0.0.1:8000/api/token/"
-    data = {"username": form_data.username, "password": form_data.password}
-    response = requests.post(core_url, json=data)
-    if response.status_code != 200:
+    access = await run_db(issue_access_token, form_data.username, form_data.password)
+    if access is None:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    token_data = response.json()
-    return {"access_token": token_data.get("access"), "token_type": "bearer"}
+    return {"access_token": access, "token_type": "bearer"}
 
-from .report import router as report_router
 app.include_router(report_router)
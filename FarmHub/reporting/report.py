@@ -7,53 +7,246 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "farmhub.settings")
 import django
 django.setup()
 
-from fastapi import APIRouter, Depends, HTTPException
+import csv
+import gzip
+import io
+import json
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-import jwt
-from django.conf import settings
 from datetime import date
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Literal, Union
+from pydantic import BaseModel
+from core.caching import cache_stats
+from reporting.analytics import DEFAULT_WINDOW, DEFAULT_Z_THRESHOLD, get_cow_analytics, get_farm_analytics
+from reporting.auth import InvalidToken, Principal, verifier
+from reporting.executor import run_db, stream_from_db
+from reporting.jobs import get_job, job_status, result_path, submit_job
 from reporting.database import (
+    MILK_GROUPINGS,
+    MILK_REPORT_COLUMNS,
     get_farm_summary,
+    get_milk_production_grouped,
     get_milk_production_report,
     get_recent_activities,
+    stream_milk_production_report,
 )
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    # repeat callers are answered from memory; only first sight of a token
+    # (or a stale blacklist) goes to the database pool
     try:
-        
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-    except jwt.PyJWTError:
+        principal = verifier.cached(token)
+        if principal is None:
+            principal = await run_db(verifier.verify, token)
+    except InvalidToken:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
-    return payload  
+    return principal
+
+# Endpoints are async; every ORM call runs on the bounded pool in reporting.executor.
+# Each report is scoped to the caller's rows inside reporting.database.
 
 @router.get("/reports/farm-summary")
-def farm_summary_report(current_user: dict = Depends(get_current_user)) -> Dict[str, Any]:
-    return get_farm_summary()
+async def farm_summary_report(current_user: Principal = Depends(get_current_user)) -> Dict[str, Any]:
+    return await run_db(get_farm_summary, principal=current_user)
+
+# rows buffered per chunk written to a streaming response
+STREAM_ROWS_PER_WRITE = 500
+
+def _ndjson_lines(stream) -> Iterator[str]:
+    buf = []
+    for row in stream:
+        buf.append(json.dumps(row))
+        if len(buf) >= STREAM_ROWS_PER_WRITE:
+            yield "\n".join(buf) + "\n"
+            buf = []
+    buf.append(json.dumps({"summary": stream.summary()}))
+    yield "\n".join(buf) + "\n"
+
+def _csv_lines(stream) -> Iterator[str]:
+    # rows only: a trailer would read as one more row to any CSV consumer
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=MILK_REPORT_COLUMNS)
+    writer.writeheader()
+    for i, row in enumerate(stream, start=1):
+        writer.writerow(row)
+        if i % STREAM_ROWS_PER_WRITE == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    yield out.getvalue()
+
+@router.get("/reports/cache-stats")
+async def cache_stats_report(current_user: Principal = Depends(get_current_user)) -> Dict[str, Any]:
+    return {**cache_stats(), "tokens": verifier.stats()}
+
+@router.get("/reports/milk-production", response_model=None)
+async def milk_production_report(
+    farm_id: Optional[int] = None,
+    farmer_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson|csv)$"),
+    current_user: Principal = Depends(get_current_user),
+) -> Union[Dict[str, Any], StreamingResponse]:
+    """
+    ``format=json`` (default) returns the whole report in one document.
+    ``format=ndjson`` and ``format=csv`` stream rows straight from the
+    database cursor; the NDJSON stream ends with a ``{"summary": ...}`` line.
+    CSV carries the rows only, no count or total: sum its ``quantity``
+    column, or use NDJSON or JSON when the summary is wanted.
+    """
+    if fmt == "json":
+        return await run_db(get_milk_production_report, farm_id, farmer_id, start_date, end_date,
+                            principal=current_user)
+
+    lines = _ndjson_lines if fmt == "ndjson" else _csv_lines
+    chunks = stream_from_db(
+        lambda: lines(stream_milk_production_report(farm_id, farmer_id, start_date, end_date,
+                                                    principal=current_user))
+    )
+    if fmt == "ndjson":
+        return StreamingResponse(chunks, media_type="application/x-ndjson")
+    return StreamingResponse(
+        chunks,
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="milk-production.csv"'},
+    )
 
-@router.get("/reports/milk-production")
-def milk_production_report(
+@router.get("/reports/milk-production/grouped")
+async def milk_production_grouped_report(
+    group_by: str = Query(..., pattern=f"^({'|'.join(MILK_GROUPINGS)})$"),
     farm_id: Optional[int] = None,
     farmer_id: Optional[int] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    current_user: dict = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ) -> Dict[str, Any]:
 
-    return get_milk_production_report(farm_id, farmer_id, start_date, end_date)
+    return await run_db(get_milk_production_grouped, group_by, farm_id, farmer_id, start_date, end_date,
+                        principal=current_user)
 
 @router.get("/reports/recent-activities")
-def recent_activities_report(
+async def recent_activities_report(
     limit: int = 10,
     farm_id: Optional[int] = None,
     farmer_id: Optional[int] = None,
     cow_id: Optional[int] = None,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    current_user: dict = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ) -> List[Dict[str, Any]]:
     
-    return get_recent_activities(limit, farm_id, farmer_id, cow_id, start_date, end_date)
+    return await run_db(get_recent_activities, limit, farm_id, farmer_id, cow_id, start_date, end_date,
+                        principal=current_user)
+
+@router.get("/reports/analytics/cows/{cow_id}")
+async def cow_analytics_report(
+    cow_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    window: int = Query(DEFAULT_WINDOW, ge=2, le=90),
+    z_threshold: float = Query(DEFAULT_Z_THRESHOLD, gt=0),
+    current_user: Principal = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Daily yield with a ``window``-day rolling mean, day-over-day change and a
+    z-score against the preceding window (``anomaly`` when ``|z| >= z_threshold``),
+    plus the cow's lactation curve.
+    """
+    return await run_db(get_cow_analytics, cow_id, start_date, end_date, window, z_threshold,
+                        principal=current_user)
+
+@router.get("/reports/analytics/farms/{farm_id}")
+async def farm_analytics_report(
+    farm_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    window: int = Query(DEFAULT_WINDOW, ge=2, le=90),
+    z_threshold: float = Query(DEFAULT_Z_THRESHOLD, gt=0),
+    current_user: Principal = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """Per-cow averages and anomaly counts for a farm, with its anomalies newest first."""
+    return await run_db(get_farm_analytics, farm_id, start_date, end_date, window, z_threshold,
+                        principal=current_user)
+
+class ReportJobRequest(BaseModel):
+    report: Literal["milk-production", "milk-production/grouped"]
+    group_by: Optional[str] = None
+    farm_id: Optional[int] = None
+    farmer_id: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+@router.post("/reports/jobs", status_code=202)
+async def submit_report_job(
+    body: ReportJobRequest,
+    current_user: Principal = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Queue a report and get a job id to poll. An identical request (same
+    parameters and scope) returns the existing job, and its stored result,
+    until the underlying data changes.
+    """
+    params = body.model_dump(exclude={"report"}, exclude_none=True)
+    if body.report == "milk-production/grouped":
+        if body.group_by not in MILK_GROUPINGS:
+            raise HTTPException(status_code=422, detail=f"group_by must be one of: {', '.join(MILK_GROUPINGS)}")
+    elif "group_by" in params:
+        raise HTTPException(status_code=422, detail="group_by only applies to milk-production/grouped")
+
+    def submit():
+        job, created = submit_job(body.report, params, current_user)
+        # submit_job matched or created the job at the current data version
+        return {**job_status(job, version=job.data_version), "deduplicated": not created}
+    return await run_db(submit)
+
+@router.get("/reports/jobs/{job_id}")
+async def report_job_status(job_id: int, current_user: Principal = Depends(get_current_user)) -> Dict[str, Any]:
+    def status():
+        job = get_job(job_id, current_user)
+        return job_status(job) if job is not None else None
+    result = await run_db(status)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return result
+
+# bytes read per chunk when a stored result is decompressed for the client
+RESULT_CHUNK_SIZE = 64 * 1024
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "x-gzip", "*"):
+            q = params.strip().lower()
+            try:
+                return not q.startswith("q=") or float(q[2:]) > 0
+            except ValueError:
+                return False
+    return False
+
+def _gunzipped(path: str) -> Iterator[bytes]:
+    with gzip.open(path, "rb") as f:
+        while chunk := f.read(RESULT_CHUNK_SIZE):
+            yield chunk
+
+@router.get("/reports/jobs/{job_id}/result", response_model=None)
+async def report_job_result(
+    job_id: int,
+    accept_encoding: Optional[str] = Header(None),
+    current_user: Principal = Depends(get_current_user),
+) -> Union[FileResponse, StreamingResponse]:
+    job = await run_db(get_job, job_id, current_user)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    # stored gzipped: sent as is to clients that accept gzip, decompressed for the rest
+    headers = {"Vary": "Accept-Encoding"}
+    if _accepts_gzip(accept_encoding):
+        return FileResponse(result_path(job), media_type="application/json",
+                            headers={**headers, "Content-Encoding": "gzip"})
+    return StreamingResponse(_gunzipped(result_path(job)), media_type="application/json", headers=headers)